@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List
+from models import (User, SystemStats, SearchChargeResult, CheckinResult, BulkPointsResult, GroupPair,
+                    LedgerCompactionResult, ActivityStats)
+from config import Config
+from database import Database
+from runtime_config import ConfigSnapshot
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase:
+    """Database 的异步封装
+
+    所有数据库操作提交到专用线程池执行，事件循环只等待结果，
+    避免磁盘写入和 fsync 阻塞其他群组的消息处理。
+    """
+
+    def __init__(self, db: Database, workers: int = None):
+        self.db = db
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or Config.DB_EXECUTOR_WORKERS or Config.DB_POOL_SIZE,
+            thread_name_prefix='db'
+        )
+        # 已提交但尚未开始执行的任务数
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _started(self):
+        with self._waiting_lock:
+            self._waiting -= 1
+
+    def _call(self, func, *args, **kwargs):
+        self._started()
+        return func(*args, **kwargs)
+
+    def _done(self, future):
+        # 开始执行前被取消的任务不会经过 _call
+        if future.cancelled():
+            self._started()
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程中执行任意同步函数"""
+        with self._waiting_lock:
+            self._waiting += 1
+        try:
+            future = self._executor.submit(self._call, func, *args, **kwargs)
+        except RuntimeError:
+            self._started()
+            raise
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def queue_size(self) -> int:
+        """等待数据库线程执行的任务数量"""
+        with self._waiting_lock:
+            return self._waiting
+
+    async def get_or_create_user(self, user_id: int, username: str = None,
+                                 first_name: str = None, last_name: str = None) -> User:
+        """获取或创建用户"""
+        return await self.run(self.db.get_or_create_user, user_id, username, first_name, last_name)
+
+    async def add_points(self, user_id: int, points: int, transaction_type: str, description: str) -> bool:
+        """增加用户积分"""
+        return await self.run(self.db.add_points, user_id, points, transaction_type, description)
+
+    async def bulk_add_points(self, adjustments: Dict[int, int], transaction_type: str,
+                              description: str) -> BulkPointsResult:
+        """批量调整积分"""
+        return await self.run(self.db.bulk_add_points, adjustments, transaction_type, description)
+
+    async def can_checkin_today(self, user_id: int) -> bool:
+        """检查用户今天是否可以签到"""
+        return await self.run(self.db.can_checkin_today, user_id)
+
+    async def record_checkin(self, user_id: int, points: int) -> bool:
+        """记录签到"""
+        return await self.run(self.db.record_checkin, user_id, points)
+
+    async def perform_checkin(self, user_id: int, points: int = None) -> CheckinResult:
+        """签到并增加积分"""
+        return await self.run(self.db.perform_checkin, user_id, points)
+
+    async def get_daily_message_points(self, user_id: int, group_id: int) -> int:
+        """获取用户今天在指定群的发言积分"""
+        return await self.run(self.db.get_daily_message_points, user_id, group_id)
+
+    async def record_message(self, user_id: int, group_id: int, points: int) -> bool:
+        """记录发言积分"""
+        return await self.run(self.db.record_message, user_id, group_id, points)
+
+    async def add_message_points(self, user_id: int, group_id: int, points: int) -> bool:
+        """记录发言并增加发言积分"""
+        return await self.run(self.db.add_message_points, user_id, group_id, points)
+
+    async def flush(self):
+        """立即写入缓冲中的发言记录"""
+        return await self.run(self.db.flush)
+
+    async def get_user_points(self, user_id: int) -> int:
+        """获取用户总积分"""
+        return await self.run(self.db.get_user_points, user_id)
+
+    async def get_user_rank(self, user_id: int) -> tuple:
+        """获取用户排名信息 (排名, 总用户数)"""
+        return await self.run(self.db.get_user_rank, user_id)
+
+    async def get_top_users(self, limit: int = 10) -> List[tuple]:
+        """获取积分排行榜"""
+        return await self.run(self.db.get_top_users, limit)
+
+    async def get_stats(self) -> SystemStats:
+        """获取系统统计"""
+        return await self.run(self.db.get_stats)
+
+    async def get_activity_stats(self, start: date, end: date) -> ActivityStats:
+        """获取时间段活动统计"""
+        return await self.run(self.db.get_activity_stats, start, end)
+
+    async def get_users_around(self, user_id: int, radius: int = 2) -> List[tuple]:
+        """获取用户排名前后的用户"""
+        return await self.run(self.db.get_users_around, user_id, radius)
+
+    async def cleanup_expired_points(self) -> int:
+        """清理过期积分"""
+        return await self.run(self.db.cleanup_expired_points)
+
+    async def compact_ledger(self) -> LedgerCompactionResult:
+        """压缩早于保留期的积分流水"""
+        return await self.run(self.db.compact_ledger)
+
+    async def record_search_message(self, user_id: int) -> bool:
+        """记录用户在搜索群的发言时间"""
+        return await self.run(self.db.record_search_message, user_id)
+
+    async def charge_search_message(self, user_id: int, cost: int = None) -> SearchChargeResult:
+        """搜索群发言扣费"""
+        return await self.run(self.db.charge_search_message, user_id, cost)
+
+    async def can_send_search_message(self, user_id: int) -> bool:
+        """检查用户是否可以在搜索群发言"""
+        return await self.run(self.db.can_send_search_message, user_id)
+
+    async def record_restriction(self, user_id: int, chat_id: int, until: datetime) -> bool:
+        """记录禁言"""
+        return await self.run(self.db.record_restriction, user_id, chat_id, until)
+
+    async def clear_restriction(self, user_id: int, chat_id: int) -> bool:
+        """删除禁言记录"""
+        return await self.run(self.db.clear_restriction, user_id, chat_id)
+
+    async def update_config(self, changes: dict) -> ConfigSnapshot:
+        """修改运行时配置"""
+        return await self.run(self.db.update_config, changes)
+
+    async def save_group_pair(self, pair: GroupPair) -> bool:
+        """新增或更新群组组合"""
+        return await self.run(self.db.save_group_pair, pair)
+
+    async def set_group_rule(self, checkin_group_id: int, name: str, value) -> bool:
+        """修改群组组合的积分规则"""
+        return await self.run(self.db.set_group_rule, checkin_group_id, name, value)
+
+    async def remove_group_pair(self, checkin_group_id: int) -> bool:
+        """删除群组组合"""
+        return await self.run(self.db.remove_group_pair, checkin_group_id)
+
+    def close(self):
+        """等待已提交的数据库操作完成并关闭线程池"""
+        self._executor.shutdown(wait=True)
+        logger.info("数据库线程池已关闭")
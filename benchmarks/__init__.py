@@ -0,0 +1,6 @@
+"""
+性能测试工具
+
+- storage: 数据库层离线压测（python -m benchmarks.storage）
+- replay: 端到端更新回放压测（python -m benchmarks.replay）
+"""
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+端到端更新回放压测
+
+用本地假 Bot API 替换 Telegram 服务器，构建完整的 TelegramBot（Application、
+命令处理器、签到群/搜索群处理器），按目标速率把录制的或合成的 Update 放入
+更新队列，统计端到端处理延迟和对外 API 调用量。
+
+用法：
+    python -m benchmarks.replay --updates 20000 --rate 500
+    python -m benchmarks.replay --input updates.jsonl --rate 200 --api-latency 50
+    python -m benchmarks.replay --webhook --updates 5000
+录制文件为 JSONL，每行一个 Telegram Update 的 JSON。指定 --webhook 时启动本地
+Webhook 服务，通过 HTTP POST 推送更新（带 secret token 请求头）。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import shutil
+import itertools
+from collections import Counter
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+from config import Config
+from metrics import OUTBOUND_DROPPED, OUTBOUND_FAILED
+from benchmarks.storage import percentile, git_revision
+
+BOT_USER = {
+    'id': 1000000001,
+    'is_bot': True,
+    'first_name': 'Replay',
+    'username': 'replay_bot',
+    'can_join_groups': True,
+    'can_read_all_group_messages': True,
+    'supports_inline_queries': False,
+}
+
+DEFAULT_MIX = 'checkin_message=55,search_message=30,checkin=5,points=4,rank=3,start=2,stats=1'
+
+class FakeBotAPI(BaseRequest):
+    """本地假 Bot API：记录所有请求并返回合法的响应
+
+    latency 为每个请求的模拟耗时（秒），error_rate 为返回 429 限流错误的概率。
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, keep_log: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.keep_log = keep_log
+        self.calls = Counter()
+        self.errors = Counter()
+        self.log = []
+        self._rng = random.Random(seed)
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if len(self.log) < self.keep_log:
+            self.log.append({'method': endpoint, 'params': params})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint != 'getMe' and self.error_rate and self._rng.random() < self.error_rate:
+            self.errors[endpoint] += 1
+            body = {
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1},
+            }
+            return 429, json.dumps(body).encode()
+
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode()
+
+    def _result(self, endpoint, params):
+        if endpoint == 'getMe':
+            return BOT_USER
+        if endpoint in ('sendMessage', 'sendDocument', 'sendPhoto'):
+            chat_id = int(params.get('chat_id', 0))
+            message = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+                'from': BOT_USER,
+            }
+            if 'text' in params:
+                message['text'] = params['text']
+            return message
+        if endpoint == 'getChatMember':
+            return {'status': 'member', 'user': {'id': int(params.get('user_id', 0)), 'is_bot': False,
+                                                 'first_name': 'User'}}
+        # restrictChatMember、deleteMessage 等接口返回 True
+        return True
+
+class ReplayApplication(Application):
+    """记录每个更新处理完成时间的 Application"""
+
+    async def process_update(self, update):
+        try:
+            await super().process_update(update)
+        finally:
+            recorder = getattr(self, 'replay_recorder', None)
+            if recorder is not None and isinstance(update, Update):
+                recorder.done(update.update_id)
+
+class ReplayRecorder:
+    """记录每个更新从入队到处理完成的延迟"""
+
+    def __init__(self):
+        self.enqueued = {}
+        self.kinds = {}
+        self.samples = {}
+
+    def enqueue(self, update_id, kind):
+        self.enqueued[update_id] = time.perf_counter_ns()
+        self.kinds[update_id] = kind
+
+    def done(self, update_id):
+        start = self.enqueued.pop(update_id, None)
+        if start is None:
+            return
+        kind = self.kinds.pop(update_id, 'unknown')
+        self.samples.setdefault(kind, []).append(time.perf_counter_ns() - start)
+
+    def summary(self, wall_seconds):
+        all_samples = sorted(itertools.chain.from_iterable(self.samples.values()))
+        result = {'all': _summarize(all_samples, wall_seconds)}
+        for kind, samples in sorted(self.samples.items()):
+            result[kind] = _summarize(sorted(samples), wall_seconds)
+        return result
+
+def _summarize(samples, wall_seconds):
+    count = len(samples)
+    if not count:
+        return {'count': 0}
+    return {
+        'count': count,
+        'throughput_per_sec': round(count / wall_seconds, 2) if wall_seconds else None,
+        'mean_ms': round(sum(samples) / count / 1e6, 3),
+        'p50_ms': round(percentile(samples, 0.50) / 1e6, 3),
+        'p95_ms': round(percentile(samples, 0.95) / 1e6, 3),
+        'p99_ms': round(percentile(samples, 0.99) / 1e6, 3),
+        'max_ms': round(samples[-1] / 1e6, 3),
+    }
+
+class UpdateGenerator:
+    """生成合成的群组消息和命令更新"""
+
+    def __init__(self, users, mix, admin_id, seed=0, skew=3.0):
+        self.users = users
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.admin_id = admin_id
+        self.skew = skew
+        self._rng = random.Random(seed)
+
+    def _user(self):
+        user_id = 1 + int(self.users * (self._rng.random() ** self.skew)) % self.users
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+    @staticmethod
+    def _group(chat_id):
+        return {'id': chat_id, 'type': 'supergroup', 'title': f'Group {chat_id}'}
+
+    @staticmethod
+    def _message(update_id, chat, user, text):
+        message = {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': chat,
+            'from': user,
+            'text': text,
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'update_id': update_id, 'message': message}
+
+    def generate(self, update_id):
+        """返回 (更新类型, Update 的 JSON 数据)"""
+        kind = self._rng.choices(self.names, self.weights)[0]
+        user = self._user()
+        checkin_group = self._group(Config.CHECKIN_GROUP_ID)
+        search_group = self._group(Config.SEARCH_GROUP_ID)
+
+        if kind == 'checkin_message':
+            data = self._message(update_id, checkin_group, user, f'hello #{update_id}')
+        elif kind == 'search_message':
+            data = self._message(update_id, search_group, user, f'search keyword {update_id}')
+        elif kind in ('checkin', 'points', 'rank'):
+            data = self._message(update_id, checkin_group, user, f'/{kind}')
+        elif kind == 'start':
+            data = self._message(update_id, search_group, user, '/start')
+        elif kind == 'stats':
+            admin = {'id': self.admin_id, 'is_bot': False, 'first_name': 'Admin', 'username': 'admin'}
+            data = self._message(update_id, {'id': self.admin_id, 'type': 'private', 'first_name': 'Admin'},
+                                 admin, '/stats')
+        else:
+            raise ValueError(f"未知的更新类型: {kind}")
+        return kind, data
+
+def load_recorded(path):
+    """读取录制的更新（JSONL），按顺序重新编号"""
+    with open(path, encoding='utf-8') as f:
+        for update_id, line in enumerate((line for line in f if line.strip()), 1):
+            data = json.loads(line)
+            data['update_id'] = update_id
+            kind = 'recorded'
+            message = data.get('message') or data.get('edited_message') or {}
+            text = message.get('text') or ''
+            if text.startswith('/'):
+                kind = text.split()[0].split('@')[0]
+            yield kind, data
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        if part.strip():
+            name, _, weight = part.partition('=')
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+async def replay(args):
+    from main import TelegramBot
+
+    work_dir = tempfile.mkdtemp(prefix='replay_')
+    Config.DATABASE_PATH = args.db or os.path.join(work_dir, 'replay.db')
+    Config.BOT_TOKEN = '123456:REPLAY'
+    Config.CHECKIN_GROUP_ID = args.checkin_group
+    Config.SEARCH_GROUP_ID = args.search_group
+    Config.ADMIN_USER_IDS = [args.admin_id]
+
+    fake_api = FakeBotAPI(args.api_latency / 1000, args.error_rate, args.seed, args.keep_log)
+    builder = (
+        Application.builder()
+        .token(Config.BOT_TOKEN)
+        .request(fake_api)
+        .get_updates_request(fake_api)
+        .application_class(ReplayApplication)
+    )
+    bot = TelegramBot(builder=builder)
+    application = bot.application
+    recorder = ReplayRecorder()
+    application.replay_recorder = recorder
+
+    if args.input:
+        stream = load_recorded(args.input)
+    else:
+        generator = UpdateGenerator(args.users, parse_mix(args.mix), args.admin_id, args.seed, args.skew)
+        stream = (generator.generate(update_id) for update_id in range(1, args.updates + 1))
+
+    sent = 0
+    max_queue = 0
+    client = None
+    dropped_before, failed_before = OUTBOUND_DROPPED.values(), OUTBOUND_FAILED.values()
+    try:
+        await application.initialize()
+        if args.webhook:
+            secret = 'replay-secret'
+            webhook_url = f'http://127.0.0.1:{args.webhook_port}/{Config.WEBHOOK_PATH}'
+            await application.updater.start_webhook(**bot.webhook_options(
+                listen='127.0.0.1', port=args.webhook_port, webhook_url=webhook_url, secret_token=secret
+            ))
+            client = httpx.AsyncClient(headers={'X-Telegram-Bot-Api-Secret-Token': secret})
+        await application.start()
+
+        start = time.perf_counter()
+        for kind, data in stream:
+            if args.rate > 0:
+                delay = start + sent / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            recorder.enqueue(data['update_id'], kind)
+            if client is not None:
+                response = await client.post(webhook_url, json=data)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Webhook 返回 {response.status_code}: {response.text}")
+            else:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            sent += 1
+            max_queue = max(max_queue, application.update_queue.qsize())
+        send_seconds = time.perf_counter() - start
+
+        await application.update_queue.join()
+        wall_seconds = time.perf_counter() - start
+        if application.updater.running:
+            await application.updater.stop()
+        await application.stop()
+    finally:
+        if client is not None:
+            await client.aclose()
+        await application.shutdown()
+        await bot._post_shutdown(application)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 调度器丢弃（队列满、过期、关闭时未发出）和最终失败的请求不会出现在 API 调用量中，单独统计
+    dropped = {}
+    for (method, reason), value in OUTBOUND_DROPPED.values().items():
+        count = int(value - dropped_before.get((method, reason), 0))
+        if count:
+            dropped.setdefault(method, {})[reason] = count
+    failed = {method: int(value - failed_before.get((method,), 0))
+              for (method,), value in OUTBOUND_FAILED.values().items()
+              if value > failed_before.get((method,), 0)}
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'params': {
+            'input': args.input,
+            'webhook': args.webhook,
+            'updates': sent,
+            'target_rate': args.rate,
+            'users': args.users,
+            'mix': None if args.input else parse_mix(args.mix),
+            'api_latency_ms': args.api_latency,
+            'error_rate': args.error_rate,
+            'seed': args.seed,
+        },
+        'totals': {
+            'send_seconds': round(send_seconds, 3),
+            'wall_seconds': round(wall_seconds, 3),
+            'achieved_rate': round(sent / send_seconds, 2) if send_seconds else None,
+            'processed_per_sec': round(sent / wall_seconds, 2) if wall_seconds else None,
+            'max_queue_depth': max_queue,
+        },
+        'latency': recorder.summary(wall_seconds),
+        'api_calls': dict(fake_api.calls),
+        'api_errors': dict(fake_api.errors),
+        'api_calls_per_update': round(sum(fake_api.calls.values()) / sent, 3) if sent else None,
+        'outbound_dropped': dropped,
+        'outbound_failed': failed,
+        'api_log': fake_api.log,
+    }
+
+def print_report(result):
+    totals = result['totals']
+    print()
+    print(f"⏱  发送 {result['params']['updates']} 个更新，目标速率 {result['params']['target_rate']}/s，"
+          f"实际 {totals['achieved_rate']}/s，处理 {totals['processed_per_sec']}/s，"
+          f"最大队列 {totals['max_queue_depth']}")
+    print()
+    print(f"{'类型':<20}{'次数':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for kind, item in result['latency'].items():
+        if item['count']:
+            print(f"{kind:<20}{item['count']:>10}{item['p50_ms']:>10}{item['p95_ms']:>10}"
+                  f"{item['p99_ms']:>10}{item['max_ms']:>10}")
+    print()
+    print(f"📡 API 调用（每个更新 {result['api_calls_per_update']} 次）：")
+    for method, count in sorted(result['api_calls'].items(), key=lambda item: -item[1]):
+        errors = result['api_errors'].get(method, 0)
+        print(f"  {method:<24}{count:>10}" + (f"  （错误 {errors}）" if errors else ""))
+    if result['outbound_dropped'] or result['outbound_failed']:
+        print()
+        print("🗑  出站调度器未发出的请求：")
+        for method, reasons in sorted(result['outbound_dropped'].items()):
+            detail = '，'.join(f"{reason} {count}" for reason, count in sorted(reasons.items()))
+            print(f"  {method:<24}{sum(reasons.values()):>10}  丢弃（{detail}）")
+        for method, count in sorted(result['outbound_failed'].items()):
+            print(f"  {method:<24}{count:>10}  失败")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='端到端更新回放压测（假 Bot API）')
+    parser.add_argument('--input', help='录制的更新文件（JSONL），不指定时生成合成更新')
+    parser.add_argument('--updates', type=int, default=10000, help='合成更新数量（默认 10000）')
+    parser.add_argument('--rate', type=float, default=200, help='目标发送速率（更新/秒，0 为不限速，默认 200）')
+    parser.add_argument('--users', type=int, default=5000, help='合成用户数（默认 5000）')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'更新类型比例（默认 {DEFAULT_MIX}）')
+    parser.add_argument('--skew', type=float, default=3.0, help='用户活跃度偏斜（默认 3）')
+    parser.add_argument('--api-latency', type=float, default=0, help='假 Bot API 每次请求耗时（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0, help='假 Bot API 返回 429 的概率')
+    parser.add_argument('--checkin-group', type=int, default=-1000000000001, help='签到群ID')
+    parser.add_argument('--search-group', type=int, default=-1000000000002, help='搜索群ID')
+    parser.add_argument('--admin-id', type=int, default=999999999, help='管理员用户ID')
+    parser.add_argument('--webhook', action='store_true', help='通过本地 Webhook 服务 POST 更新')
+    parser.add_argument('--webhook-port', type=int, default=18443, help='本地 Webhook 端口（默认 18443）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--db', help='数据库路径（默认使用临时目录）')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据库')
+    parser.add_argument('--keep-log', type=int, default=0, help='在结果中保留前 N 条 API 请求明细')
+    parser.add_argument('--verbose', action='store_true', help='输出机器人日志')
+    parser.add_argument('--min-processed-rate', type=float, default=0,
+                        help='处理速率（更新/秒）低于该值时以非零状态退出，用于回归检查')
+    parser.add_argument('--output', default='replay_results.json', help='结果文件（默认 replay_results.json）')
+    args = parser.parse_args(argv)
+
+    # 先配置日志：导入 main 时的 basicConfig 不再生效，不会在当前目录写 bot.log
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO if args.verbose else logging.WARNING,
+    )
+
+    result = asyncio.run(replay(args))
+    print_report(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 结果已写入 {args.output}")
+
+    processed = result['totals']['processed_per_sec'] or 0
+    if processed < args.min_processed_rate:
+        print(f"❌ 处理速率 {processed}/s 低于要求的 {args.min_processed_rate}/s")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+数据库层离线压测
+
+使用合成用户数据驱动 Database，模拟签到群发言、签到、搜索群扣费、资料更新、
+排名和统计查询的混合负载（含跨天），统计每个方法的吞吐量和 p50/p95/p99 延迟，
+以及数据库文件增长，结果写入 JSON 文件便于不同版本之间对比。
+
+用法：
+    python -m benchmarks.storage --users 10000 --ops 100000
+    python -m benchmarks.storage --users 1000000 --ops 500000 --threads 4 --output results.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import sqlite3
+import threading
+import subprocess
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+import database
+import stats
+
+DEFAULT_MIX = 'message=60,search=20,checkin=5,profile=5,points=4,rank=3,top=2,stats=1'
+
+CHECKIN_GROUP_ID = -1000000000001
+SEARCH_GROUP_ID = -1000000000002
+
+class SimulatedDate(date):
+    """可推进的模拟日期，用于压测跨天场景"""
+    offset_days = 0
+
+    @classmethod
+    def today(cls):
+        real = date.fromtimestamp(time.time()) + timedelta(days=cls.offset_days)
+        return cls(real.year, real.month, real.day)
+
+class LatencyRecorder:
+    """按方法名记录调用延迟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def call(self, name, func, *args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            with self._lock:
+                self.samples.setdefault(name, []).append(elapsed)
+
+    def summary(self, wall_seconds):
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            samples.sort()
+            count = len(samples)
+            result[name] = {
+                'count': count,
+                'throughput_per_sec': round(count / wall_seconds, 2) if wall_seconds else None,
+                'mean_ms': round(sum(samples) / count / 1e6, 4),
+                'p50_ms': round(percentile(samples, 0.50) / 1e6, 4),
+                'p95_ms': round(percentile(samples, 0.95) / 1e6, 4),
+                'p99_ms': round(percentile(samples, 0.99) / 1e6, 4),
+                'max_ms': round(samples[-1] / 1e6, 4),
+            }
+        return result
+
+def percentile(sorted_samples, fraction):
+    """最近秩法计算分位数"""
+    if not sorted_samples:
+        return 0
+    index = max(0, math.ceil(fraction * len(sorted_samples)) - 1)
+    return sorted_samples[index]
+
+def parse_mix(text):
+    """解析负载比例，例如 message=60,search=20"""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"未知的操作类型: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def db_file_size(path):
+    """数据库文件（含 WAL）总大小"""
+    total = 0
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            total += os.path.getsize(path + suffix)
+    return total
+
+def git_revision():
+    """当前代码版本，便于对比不同版本的结果"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def populate(db_path, users, seed):
+    """直接批量写入合成用户"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    batch = []
+    for user_id in range(1, users + 1):
+        batch.append((user_id, f'user{user_id}', f'User{user_id}', None, rng.randint(0, 100)))
+        if len(batch) >= 10000:
+            conn.executemany('''
+                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, total_points)
+                VALUES (?, ?, ?, ?, ?)
+            ''', batch)
+            batch = []
+    if batch:
+        conn.executemany('''
+            INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, total_points)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+    conn.commit()
+    conn.close()
+
+def pick_user(rng, users, skew):
+    """按幂律挑选用户：少数活跃用户贡献大部分消息"""
+    return 1 + int(users * (rng.random() ** skew)) % users
+
+def op_message(db, rec, rng, user_id, day):
+    rec.call('get_or_create_user', db.get_or_create_user, user_id, f'user{user_id}', f'User{user_id}', None)
+    daily = rec.call('get_daily_message_points', db.get_daily_message_points, user_id, CHECKIN_GROUP_ID)
+    if daily < Config.MAX_MESSAGE_POINTS_PER_DAY:
+        rec.call('add_message_points', db.add_message_points, user_id, CHECKIN_GROUP_ID, Config.MESSAGE_POINTS)
+    else:
+        rec.call('record_message', db.record_message, user_id, CHECKIN_GROUP_ID, 0)
+
+def op_search(db, rec, rng, user_id, day):
+    rec.call('get_or_create_user', db.get_or_create_user, user_id, f'user{user_id}', f'User{user_id}', None)
+    rec.call('charge_search_message', db.charge_search_message, user_id)
+
+def op_checkin(db, rec, rng, user_id, day):
+    rec.call('get_or_create_user', db.get_or_create_user, user_id, f'user{user_id}', f'User{user_id}', None)
+    rec.call('perform_checkin', db.perform_checkin, user_id)
+
+def op_profile(db, rec, rng, user_id, day):
+    # 模拟用户修改用户名
+    rec.call('get_or_create_user', db.get_or_create_user, user_id, f'user{user_id}_{day}', f'User{user_id}', None)
+
+def op_points(db, rec, rng, user_id, day):
+    rec.call('get_user_points', db.get_user_points, user_id)
+
+def op_rank(db, rec, rng, user_id, day):
+    rec.call('get_user_rank', db.get_user_rank, user_id)
+    rec.call('get_users_around', db.get_users_around, user_id, 2)
+
+def op_top(db, rec, rng, user_id, day):
+    rec.call('get_top_users', db.get_top_users, 10)
+
+def op_stats(db, rec, rng, user_id, day):
+    rec.call('get_stats', db.get_stats)
+
+OPERATIONS = {
+    'message': op_message,
+    'search': op_search,
+    'checkin': op_checkin,
+    'profile': op_profile,
+    'points': op_points,
+    'rank': op_rank,
+    'top': op_top,
+    'stats': op_stats,
+}
+
+def run_benchmark(args):
+    mix = parse_mix(args.mix)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    work_dir = None
+    if args.db:
+        db_path = args.db
+    else:
+        work_dir = tempfile.mkdtemp(prefix='bench_')
+        db_path = os.path.join(work_dir, 'bench.db')
+
+    database.date = SimulatedDate
+    stats.date = SimulatedDate
+    SimulatedDate.offset_days = 0
+
+    try:
+        print(f"📦 初始化数据库并写入 {args.users} 个用户...")
+        start = time.perf_counter()
+        database.Database(db_path).close()
+        populate(db_path, args.users, args.seed)
+        populate_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        db = database.Database(db_path)
+        startup_seconds = time.perf_counter() - start
+        size_before = db_file_size(db_path)
+
+        rec = LatencyRecorder()
+        ops_per_day = max(1, args.ops // args.days)
+        counter = iter(range(args.ops))
+        counter_lock = threading.Lock()
+        day_lock = threading.Lock()
+        state = {'day': 0}
+
+        def worker(worker_id):
+            rng = random.Random(args.seed + worker_id + 1)
+            while True:
+                with counter_lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                day = index // ops_per_day
+                if day > state['day']:
+                    with day_lock:
+                        if day > state['day']:
+                            # 跨天：先写回缓冲数据，再推进日期
+                            rec.call('flush', db.flush)
+                            state['day'] = day
+                            SimulatedDate.offset_days = day
+                name = rng.choices(names, weights)[0]
+                user_id = pick_user(rng, args.users, args.skew)
+                OPERATIONS[name](db, rec, rng, user_id, state['day'])
+
+        print(f"🚀 开始压测：{args.ops} 次操作，{args.days} 天，{args.threads} 个线程")
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rec.call('flush', db.flush)
+        wall_seconds = time.perf_counter() - start
+
+        size_after = db_file_size(db_path)
+        rec.call('close', db.close)
+        size_closed = db_file_size(db_path)
+
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+            },
+            'params': {
+                'users': args.users,
+                'ops': args.ops,
+                'days': args.days,
+                'threads': args.threads,
+                'mix': mix,
+                'skew': args.skew,
+                'seed': args.seed,
+                'journal_mode': Config.DB_JOURNAL_MODE,
+                'synchronous': Config.DB_SYNCHRONOUS,
+                'message_batch_enabled': Config.MESSAGE_BATCH_ENABLED,
+                'rank_index_enabled': Config.RANK_INDEX_ENABLED,
+            },
+            'totals': {
+                'populate_seconds': round(populate_seconds, 3),
+                'startup_seconds': round(startup_seconds, 3),
+                'wall_seconds': round(wall_seconds, 3),
+                'ops_per_sec': round(args.ops / wall_seconds, 2) if wall_seconds else None,
+            },
+            'db_size_bytes': {
+                'before': size_before,
+                'after': size_after,
+                'after_close': size_closed,
+                'growth': size_closed - size_before,
+                'growth_per_op': round((size_closed - size_before) / args.ops, 2) if args.ops else None,
+            },
+            'methods': rec.summary(wall_seconds),
+        }
+    finally:
+        database.date = date
+        stats.date = date
+        if work_dir and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def print_report(result):
+    totals = result['totals']
+    size = result['db_size_bytes']
+    print()
+    print(f"⏱  总耗时 {totals['wall_seconds']}s，吞吐 {totals['ops_per_sec']} ops/s，"
+          f"启动 {totals['startup_seconds']}s")
+    print(f"💾 数据库增长 {size['growth']} 字节（{size['growth_per_op']} 字节/操作）")
+    print()
+    print(f"{'方法':<26}{'次数':>10}{'ops/s':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, item in result['methods'].items():
+        print(f"{name:<26}{item['count']:>10}{item['throughput_per_sec']:>12}"
+              f"{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='数据库层离线压测')
+    parser.add_argument('--users', type=int, default=10000, help='合成用户数（默认 10000）')
+    parser.add_argument('--ops', type=int, default=100000, help='操作次数（默认 100000）')
+    parser.add_argument('--days', type=int, default=3, help='模拟天数，操作平均分布到每天（默认 3）')
+    parser.add_argument('--threads', type=int, default=1, help='并发线程数（默认 1）')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'操作比例（默认 {DEFAULT_MIX}）')
+    parser.add_argument('--skew', type=float, default=3.0, help='用户活跃度偏斜，越大越集中（默认 3）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--db', help='数据库路径（默认使用临时目录）')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据库')
+    parser.add_argument('--output', default='bench_results.json', help='结果文件（默认 bench_results.json）')
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args)
+    print_report(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -8,6 +9,26 @@ class Config:
     # Telegram Bot Token
     BOT_TOKEN = os.getenv('BOT_TOKEN', '8197758331:AAFWsMFekmFDZyTQ5zKu4BI40ZZ4L86jHzs')
     
+    # 运行模式配置
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()  # 接收更新方式：polling 或 webhook
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 32))  # 同时处理的更新数量（同一用户仍按顺序），1为逐个处理
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')  # Webhook 监听地址
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))  # Webhook 监听端口
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')  # Webhook 路径
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # 对外的 Webhook 完整地址（负载均衡器地址 + 路径）
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')  # 校验请求头 X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))  # Telegram 推送的最大并发连接数
+    
+    # 出站请求配置
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 25))  # 全局每秒最多请求数
+    OUTBOUND_PRIVATE_CHAT_RATE = float(os.getenv('OUTBOUND_PRIVATE_CHAT_RATE', 1))  # 每个私聊每秒最多消息数
+    OUTBOUND_GROUP_RATE_PER_MINUTE = float(os.getenv('OUTBOUND_GROUP_RATE_PER_MINUTE', 20))  # 每个群每分钟最多消息数
+    OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', 3))  # 每个会话允许的突发消息数
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))  # 429 或网络错误最多重试次数
+    OUTBOUND_MAX_IN_FLIGHT = int(os.getenv('OUTBOUND_MAX_IN_FLIGHT', 16))  # 同时进行中的请求数
+    OUTBOUND_CHAT_QUEUE_LIMIT = int(os.getenv('OUTBOUND_CHAT_QUEUE_LIMIT', 20))  # 每个会话最多排队的回复/通知数，超出时丢弃最早的
+    OUTBOUND_MESSAGE_TTL = float(os.getenv('OUTBOUND_MESSAGE_TTL', 60))  # 回复/通知排队超过该秒数仍未发出则丢弃
+    
     # 群组ID配置
     CHECKIN_GROUP_ID = int(os.getenv('CHECKIN_GROUP_ID', 0))  # 签到群ID
     SEARCH_GROUP_ID = int(os.getenv('SEARCH_GROUP_ID', 0))  # 搜索群ID
@@ -18,18 +39,55 @@ class Config:
     MESSAGE_POINTS = int(os.getenv('MESSAGE_POINTS', 1))   # 发言获得积分
     SEARCH_MESSAGE_COST = int(os.getenv('SEARCH_MESSAGE_COST', 1))  # 搜索群发言消耗积分
     POINTS_EXPIRE_DAYS = int(os.getenv('POINTS_EXPIRE_DAYS', 0))  # 积分过期天数，0为永不过期
+    EXPIRY_CHUNK_SIZE = int(os.getenv('EXPIRY_CHUNK_SIZE', 500))  # 过期清理每批处理的用户数
+    LEDGER_RETENTION_DAYS = int(os.getenv('LEDGER_RETENTION_DAYS', 0))  # 积分流水保留天数，更早的流水压缩归档，0为不压缩
+    LEDGER_ARCHIVE_DIR = os.getenv('LEDGER_ARCHIVE_DIR', 'ledger_archive')  # 流水归档目录
+    LEDGER_COMPACTION_CHUNK_SIZE = int(os.getenv('LEDGER_COMPACTION_CHUNK_SIZE', 5000))  # 流水压缩每批条数
     ZERO_POINTS_COOLDOWN_HOURS = int(os.getenv('ZERO_POINTS_COOLDOWN_HOURS', 1))  # 积分为0时发言冷却时间（小时）
     BAN_DURATION_HOURS = int(os.getenv('BAN_DURATION_HOURS', 1))  # 积分不足时禁言时长（小时）
 
     # 签到配置
     MAX_CHECKIN_PER_DAY = int(os.getenv('MAX_CHECKIN_PER_DAY', 1))  # 每日最大签到次数
+    CHECKIN_STREAK_BONUS = int(os.getenv('CHECKIN_STREAK_BONUS', 0))  # 连续签到每多一天额外奖励积分
+    CHECKIN_STREAK_BONUS_MAX_DAYS = int(os.getenv('CHECKIN_STREAK_BONUS_MAX_DAYS', 7))  # 连续签到奖励最多累计天数
     MAX_MESSAGE_POINTS_PER_DAY = int(os.getenv('MAX_MESSAGE_POINTS_PER_DAY', 10))  # 每日发言最大积分
     
     # 数据库配置
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'bot_data.db')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))  # 连接池大小
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # 等待空闲连接超时（秒）
+    DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', 5))  # 数据库锁等待超时（秒）
+    DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')  # 日志模式
+    DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')  # 同步级别
+    DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', -16000))  # 页缓存大小（负数为KiB）
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 268435456))  # 内存映射大小（字节）
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))  # 预编译语句缓存数量
+    DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', 0))  # 数据库线程数，0为与连接池大小一致
+    
+    # 批量写入配置
+    MESSAGE_BATCH_ENABLED = os.getenv('MESSAGE_BATCH_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # 签到群发言批量写入
+    MESSAGE_BATCH_INTERVAL_MS = int(os.getenv('MESSAGE_BATCH_INTERVAL_MS', 1000))  # 批量写入间隔（毫秒）
+    MESSAGE_BATCH_MAX_EVENTS = int(os.getenv('MESSAGE_BATCH_MAX_EVENTS', 500))  # 累计多少条发言立即写入
+    
+    # 缓存配置
+    BALANCE_CACHE_SIZE = int(os.getenv('BALANCE_CACHE_SIZE', 100000))  # 余额缓存用户数，0为关闭
+    PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 100000))  # 用户资料缓存用户数，0为关闭
+    RANK_INDEX_ENABLED = os.getenv('RANK_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # 内存排行索引
+    
+    # 监控配置
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # Prometheus 指标端口，0为关闭
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')  # 指标服务监听地址
+    
+    # 运行时配置
+    CONFIG_RELOAD_INTERVAL = float(os.getenv('CONFIG_RELOAD_INTERVAL', 5))  # 检查数据库/文件中配置变化的间隔（秒），0为不检查
+    RUNTIME_CONFIG_FILE = os.getenv('RUNTIME_CONFIG_FILE', '')  # 可选的 JSON 配置文件，修改后自动生效
     
     # 管理员配置
     ADMIN_USER_IDS = [int(x) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x.strip()]
+    BULK_POINTS_MAX_ROWS = int(os.getenv('BULK_POINTS_MAX_ROWS', 100000))  # 批量调整积分文件最大行数
+    BULK_POINTS_CHUNK_SIZE = int(os.getenv('BULK_POINTS_CHUNK_SIZE', 500))  # 批量调整积分每个事务的用户数
+    EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 1000))  # 导出时每次读取的行数
+    EXPORT_FILE_MAX_MB = int(os.getenv('EXPORT_FILE_MAX_MB', 45))  # 导出文件分片大小（MB），Bot API 上传上限为 50MB
     
     @classmethod
     def validate(cls):
@@ -40,36 +98,14 @@ class Config:
             raise ValueError("CHECKIN_GROUP_ID 未设置")
         if not cls.SEARCH_GROUP_ID:
             raise ValueError("SEARCH_GROUP_ID 未设置")
+        if cls.BOT_MODE not in ('polling', 'webhook'):
+            raise ValueError(f"BOT_MODE 只能是 polling 或 webhook: {cls.BOT_MODE}")
+        if cls.BOT_MODE == 'webhook':
+            if not cls.WEBHOOK_URL:
+                raise ValueError("webhook 模式需要设置 WEBHOOK_URL")
+            # 没有校验令牌时任何能访问端口的人都可以伪造更新（包括冒充管理员）
+            if not cls.WEBHOOK_SECRET_TOKEN:
+                raise ValueError("webhook 模式需要设置 WEBHOOK_SECRET_TOKEN")
+            if not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', cls.WEBHOOK_SECRET_TOKEN):
+                raise ValueError("WEBHOOK_SECRET_TOKEN 只能包含字母、数字、_ 和 -，最长256个字符")
         return True
-
-    @classmethod
-    def update_config(cls, key: str, value: int):
-        """动态更新配置"""
-        config_map = {
-            'checkin_min': 'CHECKIN_POINTS_MIN',
-            'checkin_max': 'CHECKIN_POINTS_MAX',
-            'message_points': 'MESSAGE_POINTS',
-            'search_cost': 'SEARCH_MESSAGE_COST',
-            'max_daily_points': 'MAX_MESSAGE_POINTS_PER_DAY',
-            'expire_days': 'POINTS_EXPIRE_DAYS',
-            'cooldown_hours': 'ZERO_POINTS_COOLDOWN_HOURS'
-        }
-
-        if key in config_map:
-            attr_name = config_map[key]
-            setattr(cls, attr_name, value)
-            return True
-        return False
-
-    @classmethod
-    def get_config_info(cls):
-        """获取当前配置信息"""
-        return {
-            'checkin_min': cls.CHECKIN_POINTS_MIN,
-            'checkin_max': cls.CHECKIN_POINTS_MAX,
-            'message_points': cls.MESSAGE_POINTS,
-            'search_cost': cls.SEARCH_MESSAGE_COST,
-            'max_daily_points': cls.MAX_MESSAGE_POINTS_PER_DAY,
-            'expire_days': cls.POINTS_EXPIRE_DAYS,
-            'cooldown_hours': cls.ZERO_POINTS_COOLDOWN_HOURS
-        }
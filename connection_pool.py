@@ -0,0 +1,100 @@
+import sqlite3
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    """SQLite 连接池
+
+    复用长连接，避免每次操作都重新 connect；每个连接创建时统一设置 PRAGMA。
+    同一线程内嵌套获取连接时复用已持有的连接，由最外层负责提交或回滚。
+    """
+
+    def __init__(self, db_path: str, size: int = 5, timeout: float = 30.0,
+                 busy_timeout: float = 5.0, cached_statements: int = 256,
+                 pragmas: Optional[Dict[str, object]] = None):
+        self.db_path = db_path
+        # 内存数据库每个连接都是独立的库，只能使用单连接
+        self.size = 1 if db_path == ':memory:' else max(1, size)
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.pragmas = pragmas or {}
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """创建新连接并应用 PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            if value is None or value == '':
+                continue
+            row = conn.execute(f'PRAGMA {name} = {value}').fetchone()
+            if name == 'journal_mode' and row and str(row[0]).lower() != str(value).lower():
+                logger.warning(f"数据库日志模式设置为 {value} 失败，当前为 {row[0]}")
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """从连接池借出连接，退出时提交（异常时回滚）并归还"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # 同一线程嵌套调用，复用外层连接
+            yield held
+            return
+
+        if self._closed:
+            raise sqlite3.ProgrammingError("连接池已关闭")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(f"获取数据库连接超时（{self.timeout}秒）")
+
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._create_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._local.conn = conn
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+            self._slots.release()
+
+    def close(self):
+        """关闭连接池中的所有连接"""
+        self._closed = True
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.warning(f"关闭数据库连接失败: {e}")
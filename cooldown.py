@@ -0,0 +1,69 @@
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Tuple
+
+# 启动时至少恢复最近一天的发言记录，冷却时间由 can_send 按当时的配置判断
+RESTORE_WINDOW = 24 * 3600
+
+class CooldownTracker:
+    """搜索群发言冷却记录
+
+    使用单调时钟记录用户最后一次发言时间，判断冷却无需查询数据库；
+    变更的记录以墙上时间保存，由 Database.flush 定期写回数据库。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last: Dict[int, float] = {}  # user_id -> 单调时钟时间
+        self._dirty: Dict[int, float] = {}  # user_id -> 待持久化的 UNIX 时间戳
+
+    def restore(self, entries: Iterable[Tuple[int, datetime]], max_age: float):
+        """从数据库恢复记录，超过 max_age 秒的记录直接忽略
+
+        max_age 应覆盖冷却时间可能的取值，而不是启动时的配置：
+        运行中修改冷却时间后，can_send 仍需要这些记录。
+        """
+        now_wall = time.time()
+        now_mono = time.monotonic()
+        with self._lock:
+            for user_id, last_time in entries:
+                if last_time.tzinfo is None:
+                    last_time = last_time.replace(tzinfo=timezone.utc)
+                elapsed = now_wall - last_time.timestamp()
+                if elapsed < max_age:
+                    self._last[user_id] = now_mono - max(0.0, elapsed)
+
+    def can_send(self, user_id: int, cooldown_seconds: float) -> bool:
+        """冷却时间已过（或从未发言）时返回 True"""
+        with self._lock:
+            last = self._last.get(user_id)
+            if last is None:
+                return True
+            if time.monotonic() - last >= cooldown_seconds:
+                # 冷却已结束的记录不再需要保留在内存中
+                del self._last[user_id]
+                return True
+            return False
+
+    def record(self, user_id: int):
+        """记录用户刚刚发言"""
+        with self._lock:
+            self._last[user_id] = time.monotonic()
+            self._dirty[user_id] = time.time()
+
+    def drain_dirty(self) -> Dict[int, float]:
+        """取出待持久化的记录"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            return dirty
+
+    def restore_dirty(self, dirty: Dict[int, float]):
+        """持久化失败时放回，已有更新的记录优先"""
+        with self._lock:
+            for user_id, timestamp in dirty.items():
+                self._dirty.setdefault(user_id, timestamp)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._last)
@@ -0,0 +1,96 @@
+import os
+import csv
+import json
+import logging
+from datetime import date
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from date_range import parse_date_range
+from ledger_archive import ARCHIVE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+class ExportSpec(NamedTuple):
+    """可导出的数据：key 为唯一整数列，按日期筛选时按 (date_column, key) 分页以使用日期索引"""
+    table: str
+    columns: Tuple[str, ...]
+    key: str
+    date_column: Optional[str] = None
+
+EXPORT_SPECS = {
+    'users': ExportSpec('users', ('user_id', 'username', 'first_name', 'last_name', 'total_points',
+                                  'checkin_streak', 'last_checkin_date', 'created_at', 'updated_at'),
+                        'user_id', 'created_at'),
+    'balances': ExportSpec('users', ('user_id', 'username', 'total_points'), 'user_id'),
+    'transactions': ExportSpec('points_transactions', ARCHIVE_COLUMNS, 'id', 'created_at'),
+    'checkins': ExportSpec('checkin_records', ('id', 'user_id', 'checkin_date', 'points_earned', 'created_at'),
+                           'id', 'checkin_date'),
+}
+
+EXPORT_USAGE = ("用法：/export <users|balances|transactions|checkins> [日期范围] [csv|jsonl]\n"
+                "日期范围同 /stats，如 7d、2024-05、2024-05-01..2024-05-31；不指定时导出全部")
+
+def parse_export_args(args: List[str]) -> Tuple[str, Optional[date], Optional[date], str]:
+    """解析 /export 参数，返回 (类型, 开始日期, 结束日期, 格式)，参数无效时抛出 ValueError（中文提示）"""
+    args = list(args)
+    if not args or args[0] not in EXPORT_SPECS:
+        raise ValueError(EXPORT_USAGE)
+    kind = args.pop(0)
+    fmt = 'csv'
+    if args and args[-1].lower() in EXPORT_FORMATS:
+        fmt = args.pop().lower()
+    start = end = None
+    if args:
+        if not EXPORT_SPECS[kind].date_column:
+            raise ValueError(f"{kind} 不支持按日期筛选")
+        try:
+            start, end = parse_date_range(' '.join(args))
+        except ValueError as e:
+            raise ValueError(f"日期范围无效：{e}\n{EXPORT_USAGE}")
+    return kind, start, end, fmt
+
+# 每写入多少行检查一次文件大小
+_SIZE_CHECK_ROWS = 1000
+
+def write_chunks(rows: Iterable[tuple], columns: Sequence[str], fmt: str, directory: str,
+                 prefix: str, max_bytes: int) -> Iterator[Tuple[str, int]]:
+    """把行流式写入分片文件，每写完一个分片产出 (文件路径, 行数)
+
+    每个分片超过 max_bytes 后换下一个文件，CSV 分片各自带表头；
+    调用方处理完一个分片后即可删除，磁盘和内存占用都与总行数无关。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+
+    part, count, f, writer = 0, 0, None, None
+    try:
+        for row in rows:
+            if f is None:
+                part += 1
+                path = os.path.join(directory, f'{prefix}-{part:03d}.{fmt}')
+                # CSV 带 BOM，Excel 打开中文不乱码
+                f = open(path, 'w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='')
+                if fmt == 'csv':
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+            count += 1
+
+            if count % _SIZE_CHECK_ROWS == 0 and f.tell() >= max_bytes:
+                f.close()
+                f = None
+                yield path, count
+                count = 0
+
+        if f is not None:
+            f.close()
+            f = None
+            yield path, count
+    finally:
+        if f is not None:
+            f.close()
@@ -1,20 +1,154 @@
+import random
 import sqlite3
 import logging
-from datetime import datetime, date, timedelta
-from typing import Optional, List
-from models import User, CheckinRecord, MessageRecord, PointsTransaction
+import threading
+from dataclasses import replace
+from datetime import datetime, date, timedelta, timezone
+from typing import Callable, Dict, Iterator, Optional, List
+from models import (User, CheckinRecord, MessageRecord, PointsTransaction, SystemStats, SearchChargeResult,
+                    CheckinResult, BulkPointsResult, GroupPair, LedgerCompactionResult,
+                    DailyActivity, ActivityStats)
 from config import Config
+from connection_pool import ConnectionPool
+from write_behind import MessageBatcher, PendingUpdates, PeriodicFlusher
+from cache import LRUCache
+from rank_index import RankIndex
+from stats import DailyActiveTracker
+from migrations import migrate
+from cooldown import CooldownTracker, RESTORE_WINDOW
+from metrics import track_db
+from group_routing import GroupRouter, RULES, rule
+from runtime_config import RuntimeConfig, ConfigSnapshot, validate_snapshot
+from ledger_archive import LedgerArchive, ARCHIVE_COLUMNS
+from restrictions import RestrictionIndex
+from data_export import EXPORT_SPECS
 
 logger = logging.getLogger(__name__)
 
+_GROUP_PAIR_COLUMNS = (
+    'checkin_group_id, search_group_id, name, checkin_points_min, checkin_points_max, '
+    'message_points, max_message_points_per_day, search_message_cost, enabled'
+)
+
+def _row_to_group_pair(row) -> GroupPair:
+    return GroupPair(*row[:8], enabled=bool(row[8]))
+
 class Database:
     def __init__(self, db_path: str = None):
         self.db_path = db_path or Config.DATABASE_PATH
+        self.pool = ConnectionPool(
+            self.db_path,
+            size=Config.DB_POOL_SIZE,
+            timeout=Config.DB_POOL_TIMEOUT,
+            busy_timeout=Config.DB_BUSY_TIMEOUT,
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE,
+            pragmas={
+                'journal_mode': Config.DB_JOURNAL_MODE,
+                'synchronous': Config.DB_SYNCHRONOUS,
+                'cache_size': Config.DB_CACHE_SIZE,
+                'mmap_size': Config.DB_MMAP_SIZE,
+                'temp_store': 'MEMORY'
+            }
+        )
         self.init_database()
+        # 持久化的运行时配置（/config 修改的积分规则等）
+        self.runtime_config = RuntimeConfig(self)
+        self.runtime_config.start()
+
+        # 余额相关的读写与写后刷新共用此锁，保证读到的余额 = 已入库 + 未入库
+        self._balance_lock = threading.RLock()
+        # 已入库余额的写穿缓存，所有积分变动提交后同步更新
+        self.balance_cache = LRUCache(Config.BALANCE_CACHE_SIZE)
+        # 用户资料缓存：user_id -> (用户名, 名, 姓, 创建时间, 更新时间)
+        self.profile_cache = LRUCache(Config.PROFILE_CACHE_SIZE)
+        self.profile_updates = PendingUpdates()
+        self.rank_index = None
+        if Config.RANK_INDEX_ENABLED:
+            self._load_rank_index()
+        self.daily_active = DailyActiveTracker()
+        self._load_daily_active()
+        self.cooldowns = CooldownTracker()
+        self._load_cooldowns()
+        self.groups = GroupRouter()
+        self._load_group_pairs()
+        self.restrictions = RestrictionIndex()
+        self._load_restrictions()
+        # 被禁言用户的积分恢复到足够在搜索群发言时调用 (user_id, chat_id)，由 Moderation 设置
+        self.on_restriction_lift: Optional[Callable[[int, int], None]] = None
+        self.message_batcher = None
+        if Config.MESSAGE_BATCH_ENABLED:
+            self.message_batcher = MessageBatcher(Config.MESSAGE_BATCH_MAX_EVENTS)
+        # 后台定时写回所有写后缓冲（发言积分、发言冷却等）
+        self._flusher = PeriodicFlusher(Config.MESSAGE_BATCH_INTERVAL_MS / 1000, self.flush)
+        self._flusher.start()
     
+    def _load_rank_index(self):
+        """从数据库加载全部用户积分，构建排行索引"""
+        with self.get_connection() as conn:
+            rank_index = RankIndex.build(conn.execute('''
+                SELECT user_id, COALESCE(total_points, 0) AS points FROM users
+                ORDER BY points DESC, user_id
+            '''))
+        self.rank_index = rank_index
+        logger.info(f"排行索引加载完成，共 {len(rank_index)} 个用户")
+
+    def _load_daily_active(self):
+        """从今日的签到和发言记录初始化活跃用户统计"""
+        today = date.today().isoformat()
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT user_id FROM message_records WHERE message_date = ?
+                UNION
+                SELECT user_id FROM checkin_records WHERE checkin_date = ?
+            ''', (today, today)).fetchall()
+        self.daily_active.load(today, (row[0] for row in rows))
+
+    def _load_cooldowns(self):
+        """从数据库恢复搜索群发言冷却记录
+
+        恢复最近一天（冷却时间更长时按冷却时间）的记录，运行中调整冷却时间后
+        由 can_send 按新的配置判断。
+        """
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT user_id, last_message_time FROM search_message_records').fetchall()
+        self.cooldowns.restore(
+            ((user_id, datetime.fromisoformat(last_time)) for user_id, last_time in rows if last_time),
+            max(RESTORE_WINDOW, self.runtime_config.current().cooldown_hours * 3600)
+        )
+
+    def _load_group_pairs(self):
+        """加载群组组合路由表"""
+        with self.get_connection() as conn:
+            rows = conn.execute(f'SELECT {_GROUP_PAIR_COLUMNS} FROM group_pairs').fetchall()
+        self.groups.load(_row_to_group_pair(row) for row in rows)
+        logger.info(f"群组路由加载完成，共 {len(self.groups)} 组签到群/搜索群")
+
+    def _load_restrictions(self):
+        """清理已过期的禁言记录，加载其余记录"""
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self.get_connection() as conn:
+            conn.execute('DELETE FROM restrictions WHERE until <= ?', (now,))
+            rows = conn.execute('SELECT user_id, chat_id, until FROM restrictions').fetchall()
+            conn.commit()
+        self.restrictions.load(
+            (user_id, chat_id, datetime.fromisoformat(until).replace(tzinfo=timezone.utc).timestamp())
+            for user_id, chat_id, until in rows
+        )
+        if rows:
+            logger.info(f"已加载 {len(rows)} 条禁言记录")
+
     def get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """从连接池获取数据库连接（需配合 with 使用）"""
+        return self.pool.connection()
+
+    def close(self):
+        """写入所有缓冲数据并关闭数据库连接池"""
+        self.runtime_config.stop()
+        if self._flusher:
+            self._flusher.stop()
+            self._flusher = None
+        self.pool.close()
+        logger.info("数据库连接池已关闭")
     
     def init_database(self):
         """初始化数据库表"""
@@ -76,34 +210,62 @@ class Database:
             ''')
             
             conn.commit()
-            logger.info("数据库初始化完成")
+            
+            # 对已有数据库执行增量迁移（索引、新列、新表）
+            version = migrate(conn)
+            logger.info(f"数据库初始化完成，结构版本 v{version}")
     
+    @track_db
     def get_or_create_user(self, user_id: int, username: str = None, 
                           first_name: str = None, last_name: str = None) -> User:
-        """获取或创建用户"""
-        with self.get_connection() as conn:
+        """获取或创建用户
+
+        用户资料缓存在内存中，资料未变化时不写数据库；资料变化时先更新缓存，
+        由后台刷新批量写入。
+        """
+        profile = (username, first_name, last_name)
+        cached = self.profile_cache.get(user_id)
+        if cached is not None:
+            if cached[:3] != profile:
+                self._queue_profile_update(user_id, profile, cached[3])
+            return User(
+                user_id=user_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                total_points=self.get_user_points(user_id),
+                created_at=cached[3],
+                updated_at=cached[4]
+            )
+
+        with self._balance_lock, self.get_connection() as conn:
             cursor = conn.cursor()
             
             # 尝试获取用户
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            cursor.execute('''
+                SELECT username, first_name, last_name, total_points, created_at, updated_at
+                FROM users WHERE user_id = ?
+            ''', (user_id,))
             row = cursor.fetchone()
             
             if row:
-                # 更新用户信息
-                cursor.execute('''
-                    UPDATE users SET username = ?, first_name = ?, last_name = ?, 
-                    updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
-                ''', (username, first_name, last_name, user_id))
-                conn.commit()
+                created_at = datetime.fromisoformat(row[4]) if row[4] else None
+                updated_at = datetime.fromisoformat(row[5]) if row[5] else None
+                self._balance_changed(user_id, row[3])
+                if tuple(row[:3]) != profile:
+                    # 更新用户信息
+                    self._queue_profile_update(user_id, profile, created_at)
+                else:
+                    self.profile_cache.set(user_id, profile + (created_at, updated_at))
                 
                 return User(
-                    user_id=row[0],
-                    username=row[1],
-                    first_name=row[2],
-                    last_name=row[3],
-                    total_points=row[4],
-                    created_at=datetime.fromisoformat(row[5]) if row[5] else None,
-                    updated_at=datetime.fromisoformat(row[6]) if row[6] else None
+                    user_id=user_id,
+                    username=username,
+                    first_name=first_name,
+                    last_name=last_name,
+                    total_points=row[3] + self._pending_points(user_id),
+                    created_at=created_at,
+                    updated_at=updated_at
                 )
             else:
                 # 创建新用户
@@ -112,21 +274,40 @@ class Database:
                     VALUES (?, ?, ?, ?)
                 ''', (user_id, username, first_name, last_name))
                 conn.commit()
+                self._balance_changed(user_id, 0)
+                now = datetime.now()
+                self.profile_cache.set(user_id, profile + (now, now))
                 
                 return User(
                     user_id=user_id,
                     username=username,
                     first_name=first_name,
                     last_name=last_name,
-                    total_points=0,
-                    created_at=datetime.now(),
-                    updated_at=datetime.now()
+                    total_points=self._pending_points(user_id),
+                    created_at=now,
+                    updated_at=now
                 )
     
+    def _queue_profile_update(self, user_id: int, profile: tuple, created_at: Optional[datetime]):
+        """记录待写入的用户资料变更"""
+        now = datetime.now()
+        self.profile_cache.set(user_id, profile + (created_at, now))
+        self.profile_updates.set(user_id, profile)
+        self._request_flush(len(self.profile_updates) >= Config.MESSAGE_BATCH_MAX_EVENTS)
+
+    def _request_flush(self, due: bool):
+        """写后缓冲达到阈值（due）时唤醒后台刷新；close() 之后没有后台线程，立即写入"""
+        flusher = self._flusher
+        if flusher is None:
+            self.flush()
+        elif due:
+            flusher.trigger()
+    
+    @track_db
     def add_points(self, user_id: int, points: int, transaction_type: str, description: str) -> bool:
         """增加用户积分"""
         try:
-            with self.get_connection() as conn:
+            with self._balance_lock, self.get_connection() as conn:
                 cursor = conn.cursor()
                 
                 # 如果是扣除积分，先检查余额是否足够
@@ -137,7 +318,7 @@ class Database:
                         logger.warning(f"用户 {user_id} 不存在")
                         return False
                     
-                    current_points = result[0]
+                    current_points = result[0] + self._pending_points(user_id)
                     if current_points + points < 0:
                         logger.warning(f"用户 {user_id} 积分不足，当前: {current_points}, 尝试扣除: {abs(points)}")
                         return False
@@ -154,12 +335,80 @@ class Database:
                     VALUES (?, ?, ?, ?)
                 ''', (user_id, points, transaction_type, description))
                 
+                cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
+                result = cursor.fetchone()
                 conn.commit()
+                self._balance_changed(user_id, result[0] if result else None)
                 return True
         except Exception as e:
             logger.error(f"添加积分失败: {e}")
             return False
 
+    @track_db
+    def bulk_add_points(self, adjustments: Dict[int, int], transaction_type: str,
+                        description: str) -> BulkPointsResult:
+        """批量调整积分（user_id -> 积分）
+
+        按 BULK_POINTS_CHUNK_SIZE 个用户一批，每批在独立的短事务中写入并持有余额锁，
+        批与批之间释放锁，导入期间签到、扣费和余额查询不会被长时间阻塞。
+        不存在的用户会被创建；扣分后余额会小于 0 的用户跳过。某一批写入失败时停止，
+        之前的批次已生效，未处理的用户数记录在 failed 中。
+        """
+        result = BulkPointsResult()
+        user_ids = list(adjustments)
+        chunk_size = max(1, Config.BULK_POINTS_CHUNK_SIZE)
+        for i in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[i:i + chunk_size]
+            try:
+                self._bulk_add_chunk(chunk, adjustments, transaction_type, description, result)
+            except Exception as e:
+                logger.error(f"批量调整积分写入失败: {e}")
+                result.failed = len(user_ids) - i
+                break
+
+        logger.info(f"批量调整积分完成：{result.applied} 个用户，合计 {result.total_points} 积分，"
+                    f"新建 {result.created} 个用户，跳过 {result.skipped} 个，失败 {result.failed} 个")
+        return result
+
+    def _bulk_add_chunk(self, user_ids: List[int], adjustments: Dict[int, int], transaction_type: str,
+                        description: str, result: BulkPointsResult):
+        """在一个事务中写入一批积分调整，并累加到 result"""
+        with self._balance_lock, self.get_connection() as conn:
+            cursor = conn.cursor()
+            balances = self._fetch_balances(cursor, user_ids)
+
+            applied = []
+            skipped = 0
+            for user_id in user_ids:
+                points = adjustments[user_id]
+                if points < 0:
+                    current = balances.get(user_id, 0) + self._pending_points(user_id)
+                    if current + points < 0:
+                        skipped += 1
+                        continue
+                applied.append((user_id, points))
+
+            missing = [(user_id,) for user_id, _ in applied if user_id not in balances]
+            cursor.executemany('INSERT OR IGNORE INTO users (user_id) VALUES (?)', missing)
+            cursor.executemany('''
+                UPDATE users SET total_points = total_points + ?,
+                updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
+            ''', [(points, user_id) for user_id, points in applied])
+            cursor.executemany('''
+                INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
+                VALUES (?, ?, ?, ?)
+            ''', [(user_id, points, transaction_type, description) for user_id, points in applied])
+            conn.commit()
+
+            for user_id, points in applied:
+                self._balance_changed(user_id, balances.get(user_id, 0) + points)
+
+        result.applied += len(applied)
+        result.created += len(missing)
+        result.skipped += skipped
+        result.total_points += sum(points for _, points in applied)
+
+    @track_db
     def can_checkin_today(self, user_id: int) -> bool:
         """检查用户今天是否可以签到"""
         today = date.today().isoformat()
@@ -172,6 +421,7 @@ class Database:
             count = cursor.fetchone()[0]
             return count < Config.MAX_CHECKIN_PER_DAY
 
+    @track_db
     def record_checkin(self, user_id: int, points: int) -> bool:
         """记录签到"""
         today = date.today().isoformat()
@@ -182,7 +432,9 @@ class Database:
                     INSERT INTO checkin_records (user_id, checkin_date, points_earned)
                     VALUES (?, ?, ?)
                 ''', (user_id, today, points))
+                self._update_checkin_streak(cursor, user_id, today)
                 conn.commit()
+                self.daily_active.touch(user_id, today)
                 return True
         except sqlite3.IntegrityError:
             # 今天已经签到过了
@@ -191,6 +443,84 @@ class Database:
             logger.error(f"记录签到失败: {e}")
             return False
 
+    def _update_checkin_streak(self, cursor, user_id: int, today: str) -> int:
+        """更新连续签到天数，返回更新后的天数"""
+        yesterday = (date.fromisoformat(today) - timedelta(days=1)).isoformat()
+        cursor.execute('''
+            UPDATE users SET
+            checkin_streak = CASE WHEN last_checkin_date = ? THEN COALESCE(checkin_streak, 0) + 1 ELSE 1 END,
+            last_checkin_date = ?
+            WHERE user_id = ?
+        ''', (yesterday, today, user_id))
+        cursor.execute('SELECT checkin_streak FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else 0
+
+    @track_db
+    def perform_checkin(self, user_id: int, points: int = None) -> CheckinResult:
+        """签到：在一个事务内完成签到记录、连续天数、积分入账和交易记录
+
+        points 为空时在配置的签到积分范围内随机。
+        """
+        today = date.today().isoformat()
+        if points is None:
+            settings = self.runtime_config.current()
+            points = random.randint(settings.checkin_min, settings.checkin_max)
+
+        try:
+            with self._balance_lock, self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT checkin_streak, last_checkin_date, total_points FROM users WHERE user_id = ?
+                ''', (user_id,))
+                row = cursor.fetchone()
+                if not row:
+                    logger.warning(f"用户 {user_id} 不存在")
+                    return CheckinResult(success=False)
+                if row[1] == today:
+                    return CheckinResult(success=False, streak=row[0] or 0,
+                                         balance=row[2] + self._pending_points(user_id))
+
+                yesterday = (date.fromisoformat(today) - timedelta(days=1)).isoformat()
+                streak = (row[0] or 0) + 1 if row[1] == yesterday else 1
+                bonus = min(streak - 1, Config.CHECKIN_STREAK_BONUS_MAX_DAYS) * Config.CHECKIN_STREAK_BONUS
+                total = points + bonus
+
+                cursor.execute('''
+                    INSERT INTO checkin_records (user_id, checkin_date, points_earned)
+                    VALUES (?, ?, ?)
+                ''', (user_id, today, total))
+                cursor.execute('''
+                    UPDATE users SET total_points = total_points + ?,
+                    checkin_streak = ?, last_checkin_date = ?,
+                    updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
+                ''', (total, streak, today, user_id))
+                description = f'每日签到（连续{streak}天）' if streak > 1 else '每日签到'
+                cursor.execute('''
+                    INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, total, 'checkin', description))
+                cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
+                balance = cursor.fetchone()[0]
+                conn.commit()
+                self._balance_changed(user_id, balance)
+        except sqlite3.IntegrityError:
+            # 今天已经签到过了
+            return CheckinResult(success=False)
+        except Exception as e:
+            logger.error(f"签到失败: {e}")
+            return CheckinResult(success=False)
+
+        self.daily_active.touch(user_id, today)
+        return CheckinResult(
+            success=True,
+            points=total,
+            bonus=bonus,
+            streak=streak,
+            balance=balance + self._pending_points(user_id)
+        )
+
+    @track_db
     def get_daily_message_points(self, user_id: int, group_id: int) -> int:
         """获取用户今天在指定群的发言积分"""
         today = date.today().isoformat()
@@ -201,13 +531,31 @@ class Database:
                 WHERE user_id = ? AND group_id = ? AND message_date = ?
             ''', (user_id, group_id, today))
             result = cursor.fetchone()
-            return result[0] if result else 0
+            points = result[0] if result else 0
+        if self.message_batcher is not None:
+            points += self.message_batcher.pending_message_points(user_id, group_id, today)
+        return points
 
+    @track_db
     def record_message(self, user_id: int, group_id: int, points: int) -> bool:
         """记录发言积分"""
+        return self._record_message(user_id, group_id, points, credit=False)
+
+    @track_db
+    def add_message_points(self, user_id: int, group_id: int, points: int) -> bool:
+        """记录发言并给用户增加发言积分（启用批量写入时延迟入库）"""
+        return self._record_message(user_id, group_id, points, credit=True)
+
+    def _record_message(self, user_id: int, group_id: int, points: int, credit: bool) -> bool:
+        """记录发言，credit 为 True 时同时增加用户积分"""
         today = date.today().isoformat()
+        self.daily_active.touch(user_id, today)
+        if self.message_batcher is not None:
+            self._request_flush(self.message_batcher.add(user_id, group_id, today, points, points if credit else 0))
+            return True
+
         try:
-            with self.get_connection() as conn:
+            with self._balance_lock, self.get_connection() as conn:
                 cursor = conn.cursor()
 
                 # 尝试更新现有记录
@@ -224,28 +572,187 @@ class Database:
                         VALUES (?, ?, ?, ?)
                     ''', (user_id, group_id, today, points))
 
+                if credit and points:
+                    cursor.execute('''
+                        UPDATE users SET total_points = total_points + ?,
+                        updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
+                    ''', (points, user_id))
+                    cursor.execute('''
+                        INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
+                        VALUES (?, ?, ?, ?)
+                    ''', (user_id, points, 'message', '群内发言获得积分'))
+                    cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
+                    result = cursor.fetchone()
+
                 conn.commit()
+                if credit and points:
+                    self._balance_changed(user_id, result[0] if result else None)
                 return True
         except Exception as e:
             logger.error(f"记录发言失败: {e}")
             return False
 
+    @track_db
+    def flush(self):
+        """写回所有写后缓冲的数据"""
+        self._flush_profiles()
+        self._flush_messages()
+        self._flush_cooldowns()
+
+    def _flush_profiles(self):
+        """把变更的用户资料批量写回数据库"""
+        updates = self.profile_updates.drain()
+        if not updates:
+            return
+        try:
+            with self.get_connection() as conn:
+                conn.executemany('''
+                    UPDATE users SET username = ?, first_name = ?, last_name = ?,
+                    updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
+                ''', [profile + (user_id,) for user_id, profile in updates.items()])
+                conn.commit()
+        except Exception as e:
+            logger.error(f"写入用户资料失败: {e}")
+            self.profile_updates.restore(updates)
+
+    def _flush_cooldowns(self):
+        """把变更的搜索群发言时间批量写回数据库"""
+        dirty = self.cooldowns.drain_dirty()
+        if not dirty:
+            return
+        try:
+            with self.get_connection() as conn:
+                conn.executemany('''
+                    INSERT INTO search_message_records (user_id, last_message_time)
+                    VALUES (?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET last_message_time = excluded.last_message_time
+                ''', [(user_id, datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+                      for user_id, timestamp in dirty.items()])
+                conn.commit()
+        except Exception as e:
+            logger.error(f"写入搜索群发言时间失败: {e}")
+            self.cooldowns.restore_dirty(dirty)
+
+    def _flush_messages(self):
+        """把写后缓冲中的发言记录和积分在一个事务内批量写入"""
+        if self.message_batcher is None:
+            return
+
+        with self._balance_lock:
+            messages, credits = self.message_batcher.drain()
+            if not messages:
+                return
+
+            try:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.executemany('''
+                        INSERT INTO message_records (user_id, group_id, message_date, points_earned, message_count)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(user_id, group_id, message_date) DO UPDATE SET
+                        points_earned = points_earned + excluded.points_earned,
+                        message_count = message_count + excluded.message_count
+                    ''', [(user_id, group_id, day, points, count)
+                          for (user_id, group_id, day), (count, points) in messages.items()])
+
+                    cursor.executemany('''
+                        UPDATE users SET total_points = total_points + ?,
+                        updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
+                    ''', [(points, user_id) for user_id, (points, _) in credits.items()])
+
+                    cursor.executemany('''
+                        INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
+                        VALUES (?, ?, ?, ?)
+                    ''', [(user_id, points, 'message', f'群内发言获得积分（{count}条）')
+                          for user_id, (points, count) in credits.items()])
+
+                    balances = self._fetch_balances(cursor, list(credits))
+                    conn.commit()
+
+                for user_id in credits:
+                    self._balance_changed(user_id, balances.get(user_id))
+            except Exception as e:
+                logger.error(f"批量写入发言记录失败: {e}")
+                self.message_batcher.restore(messages, credits)
+                return
+
+        logger.debug(f"批量写入发言记录 {len(messages)} 条，积分入账 {len(credits)} 个用户")
+
+    def _pending_points(self, user_id: int) -> int:
+        """获取用户在写后缓冲中尚未入库的积分"""
+        return self.message_batcher.pending_points(user_id) if self.message_batcher is not None else 0
+
+    def _fetch_balances(self, cursor, user_ids: List[int]) -> dict:
+        """批量查询用户已入库余额"""
+        balances = {}
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            cursor.execute(
+                f'SELECT user_id, total_points FROM users WHERE user_id IN ({",".join("?" * len(chunk))})',
+                chunk
+            )
+            balances.update(cursor.fetchall())
+        return balances
+
+    def _balance_changed(self, user_id: int, balance: Optional[int]):
+        """积分变动提交后同步内存状态（须持有余额锁），balance 为 None 表示用户不存在"""
+        if balance is None:
+            self.balance_cache.pop(user_id)
+            if self.rank_index is not None:
+                self.rank_index.remove(user_id)
+        else:
+            self.balance_cache.set(user_id, balance)
+            if self.rank_index is not None:
+                self.rank_index.update(user_id, balance)
+            if self.on_restriction_lift is not None:
+                self._check_restrictions(user_id, balance + self._pending_points(user_id))
+
+    def _check_restrictions(self, user_id: int, balance: int):
+        """余额足够在被禁言的搜索群发言时通知解禁（先从索引中移除，保证只通知一次）"""
+        chats = self.restrictions.chats(user_id)
+        if not chats:
+            return
+        settings = self.runtime_config.current()
+        for chat_id in chats:
+            route = self.groups.route(chat_id)
+            cost = route.rule('search_cost', settings) if route is not None else settings.search_cost
+            if balance >= cost and self.restrictions.remove(user_id, chat_id):
+                try:
+                    self.on_restriction_lift(user_id, chat_id)
+                except Exception as e:
+                    logger.error(f"提交自动解禁失败: {e}")
+
+    def _committed_points(self, user_id: int) -> int:
+        """获取用户已入库余额，优先读取缓存"""
+        balance = self.balance_cache.get(user_id)
+        if balance is None:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
+                result = cursor.fetchone()
+            balance = result[0] if result else 0
+            self.balance_cache.set(user_id, balance)
+        return balance
+
+    @track_db
     def get_user_points(self, user_id: int) -> int:
         """获取用户总积分"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else 0
+        with self._balance_lock:
+            return self._committed_points(user_id) + self._pending_points(user_id)
 
+    @track_db
     def get_user_rank(self, user_id: int) -> tuple:
         """获取用户排名信息 (排名, 总用户数)"""
+        if self.rank_index is not None:
+            with self._balance_lock:
+                return self.rank_index.rank(user_id), len(self.rank_index)
+
+        # 先读取积分（需要 _balance_lock），再打开连接，与其他路径的加锁顺序一致
+        user_points = self.get_user_points(user_id)
+
         with self.get_connection() as conn:
             cursor = conn.cursor()
 
-            # 获取用户积分
-            user_points = self.get_user_points(user_id)
-
             # 获取排名
             cursor.execute('''
                 SELECT COUNT(*) FROM users WHERE total_points > ?
@@ -258,133 +765,552 @@ class Database:
 
             return rank, total_users
 
+    @track_db
     def get_top_users(self, limit: int = 10) -> List[tuple]:
         """获取积分排行榜"""
+        if self.rank_index is not None:
+            with self._balance_lock:
+                entries = self.rank_index.top(limit)
+            return self._with_user_names(entries)
+
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT user_id, username, first_name, total_points
-                FROM users ORDER BY total_points DESC LIMIT ?
+                FROM users ORDER BY total_points DESC, user_id LIMIT ?
             ''', (limit,))
             return cursor.fetchall()
+
+    @track_db
+    def get_stats(self) -> SystemStats:
+        """获取系统统计，启用排行索引时不查询数据库"""
+        search_cost = self.runtime_config.current().search_cost
+        if self.rank_index is not None:
+            with self._balance_lock:
+                return SystemStats(
+                    total_users=len(self.rank_index),
+                    spendable_users=self.rank_index.count_at_least(search_cost),
+                    total_points=self.rank_index.total_points,
+                    daily_active_users=self.daily_active.count()
+                )
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*),
+                       COALESCE(SUM(total_points >= ?), 0),
+                       COALESCE(SUM(total_points), 0)
+                FROM users
+            ''', (search_cost,))
+            total_users, spendable_users, total_points = cursor.fetchone()
+        return SystemStats(
+            total_users=total_users,
+            spendable_users=spendable_users,
+            total_points=total_points,
+            daily_active_users=self.daily_active.count()
+        )
+
+    @track_db
+    def get_activity_stats(self, start: date, end: date) -> ActivityStats:
+        """从按天汇总表读取时间段内的活动统计，耗时只与天数有关"""
+        if end >= date.today():
+            # 今天的发言可能还在写后缓冲中
+            self._flush_messages()
+
+        first, last = start.isoformat(), end.isoformat()
+        days = {}
+        day = start
+        while day <= end:
+            days[day.isoformat()] = DailyActivity(day=day.isoformat())
+            day += timedelta(days=1)
+        stats = ActivityStats(start=first, end=last, days=list(days.values()))
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT day, group_id, message_count, points_earned FROM daily_message_stats
+                WHERE day >= ? AND day <= ?
+            ''', (first, last))
+            for day, group_id, messages, points in cursor.fetchall():
+                days[day].messages += messages
+                days[day].message_points += points
+                stats.group_messages[group_id] = stats.group_messages.get(group_id, 0) + messages
+
+            cursor.execute('''
+                SELECT day, checkin_count, points_earned FROM daily_checkin_stats
+                WHERE day >= ? AND day <= ?
+            ''', (first, last))
+            for day, checkins, points in cursor.fetchall():
+                days[day].checkins = checkins
+                days[day].checkin_points = points
+
+            cursor.execute('''
+                SELECT day, transaction_type, credits, debits FROM daily_points_stats
+                WHERE day >= ? AND day <= ?
+            ''', (first, last))
+            for day, transaction_type, credits, debits in cursor.fetchall():
+                days[day].points_earned += credits
+                days[day].points_spent += debits
+                earned, spent = stats.points_by_type.get(transaction_type, (0, 0))
+                stats.points_by_type[transaction_type] = (earned + credits, spent + debits)
+        return stats
+
+    @track_db
+    def export_page(self, kind: str, after: Optional[tuple] = None, start: date = None,
+                    end: date = None, limit: int = None) -> List[tuple]:
+        """读取一页导出数据（键集分页），after 为上一页最后一行的分页键"""
+        spec = EXPORT_SPECS[kind]
+        limit = limit or Config.EXPORT_PAGE_SIZE
+        conditions, params = [], []
+        if spec.date_column and (start or end):
+            order = (spec.date_column, spec.key)
+            if start:
+                conditions.append(f'{spec.date_column} >= ?')
+                params.append(start.isoformat())
+            if end:
+                conditions.append(f'{spec.date_column} < ?')
+                params.append((end + timedelta(days=1)).isoformat())
+        else:
+            order = (spec.key,)
+        if after is not None:
+            conditions.append(f'({", ".join(order)}) > ({", ".join("?" * len(order))})')
+            params.extend(after)
+
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {", ".join(spec.columns + order)} FROM {spec.table}
+                {where} ORDER BY {", ".join(order)} LIMIT ?
+            ''', params + [limit])
+            return cursor.fetchall()
+
+    def iter_export(self, kind: str, start: date = None, end: date = None) -> Iterator[tuple]:
+        """逐行导出数据，列为 EXPORT_SPECS[kind].columns
+
+        每页在独立的短读取中完成，页与页之间不持有连接，导出期间写入不受影响；
+        内存占用只与页大小有关。时间戳列（created_at）为 UTC。
+        """
+        if kind not in EXPORT_SPECS:
+            raise ValueError(f"未知的导出类型: {kind}")
+        width = len(EXPORT_SPECS[kind].columns)
+        # 写后缓冲中的积分先入库，导出的余额和流水才完整
+        self._flush_messages()
+
+        after = None
+        while True:
+            rows = self.export_page(kind, after, start, end)
+            for row in rows:
+                yield row[:width]
+            if len(rows) < Config.EXPORT_PAGE_SIZE:
+                return
+            after = rows[-1][width:]
+
+    @track_db
+    def get_users_around(self, user_id: int, radius: int = 2) -> List[tuple]:
+        """获取用户排名前后各 radius 名的用户 [(排名, 用户ID, 用户名, 名字, 积分)]"""
+        if self.rank_index is not None:
+            with self._balance_lock:
+                entries = self.rank_index.around(user_id, radius)
+                ranks = [self.rank_index.count_above(points) + 1 for _, points in entries]
+            return [(rank,) + row for rank, row in zip(ranks, self._with_user_names(entries))]
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
+            if not result:
+                return []
+            points = result[0]
+            cursor.execute('''
+                SELECT * FROM (
+                    SELECT user_id, username, first_name, total_points FROM users
+                    WHERE total_points > ? OR (total_points = ? AND user_id < ?)
+                    ORDER BY total_points ASC, user_id DESC LIMIT ?
+                ) ORDER BY total_points DESC, user_id ASC
+            ''', (points, points, user_id, radius))
+            above = cursor.fetchall()
+            cursor.execute('''
+                SELECT user_id, username, first_name, total_points FROM users
+                WHERE total_points < ? OR (total_points = ? AND user_id >= ?)
+                ORDER BY total_points DESC, user_id ASC LIMIT ?
+            ''', (points, points, user_id, radius + 1))
+            rows = above + cursor.fetchall()
+            result = []
+            for row in rows:
+                cursor.execute('SELECT COUNT(*) FROM users WHERE total_points > ?', (row[3],))
+                result.append((cursor.fetchone()[0] + 1,) + tuple(row))
+            return result
+
+    def _with_user_names(self, entries: List[tuple]) -> List[tuple]:
+        """为 (用户ID, 积分) 列表补充用户名，返回 (用户ID, 用户名, 名字, 积分)"""
+        names = {}
+        user_ids = [user_id for user_id, _ in entries]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                cursor.execute(
+                    f'SELECT user_id, username, first_name FROM users WHERE user_id IN ({",".join("?" * len(chunk))})',
+                    chunk
+                )
+                for user_id, username, first_name in cursor.fetchall():
+                    names[user_id] = (username, first_name)
+        return [(user_id,) + names.get(user_id, (None, None)) + (points,) for user_id, points in entries]
     
+    @track_db
     def cleanup_expired_points(self) -> int:
-        """清理过期积分，返回清理的用户数量"""
-        if Config.POINTS_EXPIRE_DAYS <= 0:
+        """清理过期积分，返回清理的用户数量
+
+        按先进先出计算：消费总是先用掉最早获得的积分，因此用户余额中超过
+        过期时间点之后所获积分的部分即为过期积分。只处理自上次清理以来有积分
+        跨过过期时间点的用户，分批在独立的短事务中完成。
+        """
+        expire_days = self.runtime_config.current().expire_days
+        if expire_days <= 0:
             return 0  # 永不过期
         
+        # 先写入缓冲中的发言积分，避免过期计算遗漏
+        self.flush()
+        
+        # 交易记录的 created_at 为 UTC 时间
+        expire_date = datetime.now(timezone.utc) - timedelta(days=expire_days)
+        cutoff = expire_date.strftime('%Y-%m-%d %H:%M:%S')
+        description = f'积分过期清理，过期天数: {expire_days}'
+        
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 计算过期时间
-                expire_date = datetime.now() - timedelta(days=Config.POINTS_EXPIRE_DAYS)
-                expire_date_str = expire_date.strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 获取所有用户的过期积分
-                cursor.execute('''
-                    SELECT user_id, 
-                           SUM(CASE WHEN points_change > 0 AND created_at < ? THEN points_change ELSE 0 END) as expired_points
-                    FROM points_transactions 
-                    WHERE created_at < ?
-                    GROUP BY user_id
-                    HAVING expired_points > 0
-                ''', (expire_date_str, expire_date_str))
-                
-                expired_users = cursor.fetchall()
-                cleaned_count = 0
-                
-                for user_id, expired_points in expired_users:
-                    # 获取用户当前积分
-                    cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
-                    result = cursor.fetchone()
-                    if not result:
-                        continue
+                watermark = self._get_state(conn.cursor(), 'expiry_watermark') or ''
+            
+            cleaned_count = 0
+            last_user_id = None
+            while True:
+                with self._balance_lock, self.get_connection() as conn:
+                    cursor = conn.cursor()
                     
-                    current_points = result[0]
-                    # 扣除过期积分，但不能低于0
-                    points_to_deduct = min(expired_points, current_points)
+                    # 本批次：上次清理后有积分跨过过期时间点的用户
+                    # 已压缩的流水按天计入汇总表，一并检查（多选的用户按先进先出计算不会多扣）
+                    cursor.execute('''
+                        SELECT user_id FROM points_transactions
+                        WHERE points_change > 0 AND created_at >= ? AND created_at < ?
+                        AND (? IS NULL OR user_id > ?)
+                        UNION
+                        SELECT user_id FROM points_ledger_summary
+                        WHERE credits > 0 AND day >= ? AND day <= ?
+                        AND (? IS NULL OR user_id > ?)
+                        ORDER BY user_id LIMIT ?
+                    ''', (watermark, cutoff, last_user_id, last_user_id,
+                          watermark[:10], cutoff[:10], last_user_id, last_user_id, Config.EXPIRY_CHUNK_SIZE))
+                    user_ids = [row[0] for row in cursor.fetchall()]
+                    if not user_ids:
+                        break
+                    last_user_id = user_ids[-1]
                     
-                    if points_to_deduct > 0:
-                        # 扣除过期积分
-                        cursor.execute('''
-                            UPDATE users SET total_points = total_points - ?, 
-                            updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
-                        ''', (points_to_deduct, user_id))
-                        
-                        # 记录积分过期交易
-                        cursor.execute('''
-                            INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
-                            VALUES (?, ?, ?, ?)
-                        ''', (user_id, -points_to_deduct, 'expire', f'积分过期清理，过期天数: {Config.POINTS_EXPIRE_DAYS}'))
-                        
-                        cleaned_count += 1
-                        logger.info(f"用户 {user_id} 过期积分已清理: {points_to_deduct}")
-                
+                    balances = self._fetch_balances(cursor, user_ids)
+                    placeholders = ','.join('?' * len(user_ids))
+                    cursor.execute(f'''
+                        SELECT user_id, SUM(points_change) FROM points_transactions
+                        WHERE user_id IN ({placeholders}) AND points_change > 0 AND created_at >= ?
+                        GROUP BY user_id
+                    ''', user_ids + [cutoff])
+                    recent_credits = dict(cursor.fetchall())
+                    
+                    # 余额中超出近期所获积分的部分已过期，扣除后不会低于0
+                    expired = {}
+                    for user_id, balance in balances.items():
+                        points_to_deduct = balance - recent_credits.get(user_id, 0)
+                        if points_to_deduct > 0:
+                            expired[user_id] = points_to_deduct
+                    
+                    cursor.executemany('''
+                        UPDATE users SET total_points = total_points - ?, 
+                        updated_at = CURRENT_TIMESTAMP WHERE user_id = ?
+                    ''', [(points, user_id) for user_id, points in expired.items()])
+                    
+                    # 记录积分过期交易
+                    cursor.executemany('''
+                        INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
+                        VALUES (?, ?, ?, ?)
+                    ''', [(user_id, -points, 'expire', description) for user_id, points in expired.items()])
+                    
+                    conn.commit()
+                    for user_id, points in expired.items():
+                        self._balance_changed(user_id, balances[user_id] - points)
+                    cleaned_count += len(expired)
+            
+            with self.get_connection() as conn:
+                self._set_state(conn.cursor(), 'expiry_watermark', max(watermark, cutoff))
                 conn.commit()
-                logger.info(f"积分过期清理完成，共处理 {cleaned_count} 个用户")
-                return cleaned_count
+            
+            logger.info(f"积分过期清理完成，共处理 {cleaned_count} 个用户")
+            return cleaned_count
                 
         except Exception as e:
             logger.error(f"清理过期积分失败: {e}")
             return 0
     
-    def record_search_message(self, user_id: int):
-        """记录用户在搜索群的发言时间"""
-        try:
+    @track_db
+    def compact_ledger(self, retention_days: int = None) -> LedgerCompactionResult:
+        """压缩早于保留期的积分流水
+
+        原始流水先追加写入压缩归档文件，再在同一事务中按 (用户, 日期, 类型) 累加到
+        points_ledger_summary 并删除原始行；提交前核对受影响用户的流水合计
+        （原始流水 + 汇总）与压缩前一致。用户余额不受影响。开启积分过期时，
+        保留期必须长于过期天数，且只压缩过期清理已经处理过的流水。
+        """
+        retention_days = Config.LEDGER_RETENTION_DAYS if retention_days is None else retention_days
+        result = LedgerCompactionResult()
+        if retention_days <= 0:
+            return result
+
+        # 按天对齐，保证同一天的流水一次压缩完
+        cutoff_day = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+        cutoff = f'{cutoff_day.isoformat()} 00:00:00'
+        expire_days = self.runtime_config.current().expire_days
+        if expire_days > 0:
+            if retention_days <= expire_days:
+                logger.warning(f"流水保留天数 {retention_days} 必须大于积分过期天数 {expire_days}，跳过压缩")
+                return result
+            with self.get_connection() as conn:
+                watermark = self._get_state(conn.cursor(), 'expiry_watermark')
+            if not watermark:
+                logger.warning("积分过期清理尚未执行过，跳过流水压缩")
+                return result
+            cutoff = min(cutoff, f'{watermark[:10]} 00:00:00')
+        result.cutoff = cutoff
+
+        archive = LedgerArchive(Config.LEDGER_ARCHIVE_DIR)
+        last_id = 0
+        while True:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # 创建搜索群发言记录表（如果不存在）
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS search_message_records (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        last_message_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id),
-                        UNIQUE(user_id)
-                    )
-                ''')
-                
-                # 插入或更新用户最后发言时间
-                cursor.execute('''
-                    INSERT OR REPLACE INTO search_message_records (user_id, last_message_time)
-                    VALUES (?, CURRENT_TIMESTAMP)
-                ''', (user_id,))
-                
+                cursor.execute(f'''
+                    SELECT {', '.join(ARCHIVE_COLUMNS)} FROM points_transactions
+                    WHERE id > ? AND created_at < ?
+                    ORDER BY id LIMIT ?
+                ''', (last_id, cutoff, Config.LEDGER_COMPACTION_CHUNK_SIZE))
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # 先写入归档并落盘，再删除数据库中的原始流水
+            for path in archive.append(rows):
+                if path not in result.archives:
+                    result.archives.append(path)
+
+            summaries = {}
+            for _, user_id, points_change, transaction_type, _, created_at in rows:
+                entry = summaries.setdefault((user_id, created_at[:10], transaction_type or ''), [0, 0, 0])
+                if points_change >= 0:
+                    entry[0] += points_change
+                else:
+                    entry[1] -= points_change
+                entry[2] += 1
+            user_ids = sorted({key[0] for key in summaries})
+
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                before = self._ledger_totals(cursor, user_ids)
+                cursor.executemany('''
+                    INSERT INTO points_ledger_summary
+                    (user_id, day, transaction_type, credits, debits, transaction_count)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, day, transaction_type) DO UPDATE SET
+                        credits = credits + excluded.credits,
+                        debits = debits + excluded.debits,
+                        transaction_count = transaction_count + excluded.transaction_count
+                ''', [key + tuple(entry) for key, entry in summaries.items()])
+                cursor.executemany('DELETE FROM points_transactions WHERE id = ?', [(row[0],) for row in rows])
+                after = self._ledger_totals(cursor, user_ids)
+                if before != after:
+                    conn.rollback()
+                    raise RuntimeError("流水压缩前后用户流水合计不一致，已回滚")
                 conn.commit()
-                return True
-                
-        except Exception as e:
-            logger.error(f"记录搜索群发言时间失败: {e}")
-            return False
+
+            result.rows += len(rows)
+            result.summaries += len(summaries)
+
+        if result.rows:
+            logger.info(f"积分流水压缩完成：{result.rows} 条早于 {cutoff} 的流水已归档到 {', '.join(result.archives)}，"
+                        f"写入汇总 {result.summaries} 行")
+        return result
+
+    def _ledger_totals(self, cursor, user_ids: List[int]) -> dict:
+        """用户流水合计（原始流水 + 已压缩汇总）"""
+        totals = {}
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT user_id, SUM(points_change) FROM points_transactions
+                WHERE user_id IN ({placeholders}) GROUP BY user_id
+            ''', chunk)
+            for user_id, total in cursor.fetchall():
+                totals[user_id] = totals.get(user_id, 0) + total
+            cursor.execute(f'''
+                SELECT user_id, SUM(credits - debits) FROM points_ledger_summary
+                WHERE user_id IN ({placeholders}) GROUP BY user_id
+            ''', chunk)
+            for user_id, total in cursor.fetchall():
+                totals[user_id] = totals.get(user_id, 0) + total
+        return totals
+
+    def _get_state(self, cursor, key: str) -> Optional[str]:
+        """读取系统状态值"""
+        cursor.execute('SELECT value FROM system_state WHERE key = ?', (key,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+    
+    def _set_state(self, cursor, key: str, value: str):
+        """写入系统状态值"""
+        cursor.execute('''
+            INSERT INTO system_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (key, value))
+    
+    @track_db
+    def record_search_message(self, user_id: int):
+        """记录用户在搜索群的发言时间（内存记录，后台定时写回数据库）"""
+        self.cooldowns.record(user_id)
+        return True
     
+    @track_db
+    def charge_search_message(self, user_id: int, cost: int = None) -> SearchChargeResult:
+        """搜索群发言扣费：余额足够时在一个事务内条件扣费并记账，
+        否则按积分为0时的冷却规则决定是否放行，并记录发言时间"""
+        settings = self.runtime_config.current()
+        cost = settings.search_cost if cost is None else cost
+        if cost <= 0:
+            return SearchChargeResult(allowed=True, charged=False, balance=self.get_user_points(user_id), cost=0)
+
+        with self._balance_lock:
+            # 已入库余额不够但加上缓冲中的积分够时，先把缓冲写入，扣费后已入库余额不会为负
+            if self._pending_points(user_id) and self._committed_points(user_id) < cost:
+                self._flush_messages()
+            pending = self._pending_points(user_id)
+            try:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    # 条件扣费，检查与扣除在同一条语句内完成
+                    cursor.execute('''
+                        UPDATE users SET total_points = total_points - ?,
+                        updated_at = CURRENT_TIMESTAMP
+                        WHERE user_id = ? AND total_points >= ?
+                    ''', (cost, user_id, cost))
+                    if cursor.rowcount:
+                        cursor.execute('''
+                            INSERT INTO points_transactions (user_id, points_change, transaction_type, description)
+                            VALUES (?, ?, ?, ?)
+                        ''', (user_id, -cost, 'search', '搜索群发言消耗'))
+                        cursor.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,))
+                        balance = cursor.fetchone()[0]
+                        conn.commit()
+                        self._balance_changed(user_id, balance)
+                        return SearchChargeResult(allowed=True, charged=True, balance=balance + pending, cost=cost)
+            except Exception as e:
+                logger.error(f"搜索群发言扣费失败: {e}")
+                # 出错时允许发言
+                return SearchChargeResult(allowed=True, charged=False, balance=0, cost=cost)
+
+            balance = self._committed_points(user_id) + pending
+
+        # 积分不足：冷却时间已过则放行一次
+        if self.cooldowns.can_send(user_id, settings.cooldown_hours * 3600):
+            self.record_search_message(user_id)
+            return SearchChargeResult(allowed=True, charged=False, balance=balance, cost=cost)
+        return SearchChargeResult(allowed=False, charged=False, balance=balance, cost=cost)
+    
+    @track_db
     def can_send_search_message(self, user_id: int) -> bool:
         """检查用户是否可以在搜索群发言（基于冷却时间）"""
+        return self.cooldowns.can_send(user_id, self.runtime_config.current().cooldown_hours * 3600)
+
+    @track_db
+    def record_restriction(self, user_id: int, chat_id: int, until: datetime) -> bool:
+        """记录禁言（until 为带时区的解禁时间）"""
+        until = until.astimezone(timezone.utc)
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO restrictions (user_id, chat_id, until) VALUES (?, ?, ?)
+                ON CONFLICT(user_id, chat_id) DO UPDATE SET until = excluded.until,
+                created_at = CURRENT_TIMESTAMP
+            ''', (user_id, chat_id, until.strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+        self.restrictions.set(user_id, chat_id, until.timestamp())
+        return True
+
+    @track_db
+    def clear_restriction(self, user_id: int, chat_id: int) -> bool:
+        """删除禁言记录，返回记录是否存在"""
+        self.restrictions.remove(user_id, chat_id)
+        with self.get_connection() as conn:
+            cursor = conn.execute('DELETE FROM restrictions WHERE user_id = ? AND chat_id = ?', (user_id, chat_id))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    @track_db
+    def update_config(self, changes: dict) -> ConfigSnapshot:
+        """修改运行时配置并持久化，配置名或数值无效时抛出 ValueError"""
+        return self.runtime_config.update(changes)
+
+    @track_db
+    def save_group_pair(self, pair: GroupPair) -> bool:
+        """新增或更新群组组合（按签到群ID），并同步路由表"""
+        for chat_id in (pair.checkin_group_id, pair.search_group_id):
+            existing = self.groups.route(chat_id)
+            if existing is not None and existing.pair.checkin_group_id != pair.checkin_group_id:
+                logger.warning(f"群 {chat_id} 已属于签到群 {existing.pair.checkin_group_id} 的组合")
+                return False
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 获取用户最后发言时间
-                cursor.execute('''
-                    SELECT last_message_time FROM search_message_records WHERE user_id = ?
-                ''', (user_id,))
-                
-                result = cursor.fetchone()
-                if not result:
-                    # 用户从未发言，可以发言
-                    return True
-                
-                last_message_time = datetime.fromisoformat(result[0])
-                current_time = datetime.now()
-                
-                # 计算时间差
-                time_diff = current_time - last_message_time
-                cooldown_hours = Config.ZERO_POINTS_COOLDOWN_HOURS
-                
-                # 检查是否超过冷却时间
-                return time_diff.total_seconds() >= cooldown_hours * 3600
-                
-        except Exception as e:
-            logger.error(f"检查搜索群发言权限失败: {e}")
-            return True  # 出错时允许发言
+                conn.execute(f'''
+                    INSERT INTO group_pairs ({_GROUP_PAIR_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(checkin_group_id) DO UPDATE SET
+                        search_group_id = excluded.search_group_id,
+                        name = excluded.name,
+                        checkin_points_min = excluded.checkin_points_min,
+                        checkin_points_max = excluded.checkin_points_max,
+                        message_points = excluded.message_points,
+                        max_message_points_per_day = excluded.max_message_points_per_day,
+                        search_message_cost = excluded.search_message_cost,
+                        enabled = excluded.enabled,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', (
+                    pair.checkin_group_id, pair.search_group_id, pair.name,
+                    pair.checkin_points_min, pair.checkin_points_max, pair.message_points,
+                    pair.max_message_points_per_day, pair.search_message_cost, int(pair.enabled)
+                ))
+                conn.commit()
+        except sqlite3.IntegrityError as e:
+            logger.warning(f"保存群组组合失败: {e}")
+            return False
+        self.groups.set(pair)
+        return True
+
+    @track_db
+    def set_group_rule(self, checkin_group_id: int, name: str, value: Optional[int]) -> bool:
+        """修改群组组合的一条积分规则，value 为 None 时恢复使用全局配置
+
+        组合不存在或规则名无效时返回 False；与全局配置合并后的规则无效时抛出 ValueError。
+        """
+        if name not in RULES:
+            return False
+        pair = self.groups.with_rule(checkin_group_id, name, value)
+        if pair is None:
+            return False
+        settings = self.runtime_config.current()
+        validate_snapshot(replace(settings, **{key: rule(pair, key, settings) for key in RULES}))
+        return self.save_group_pair(pair)
+
+    @track_db
+    def remove_group_pair(self, checkin_group_id: int) -> bool:
+        """删除群组组合（环境变量中的默认组合只能恢复默认规则）"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM group_pairs WHERE checkin_group_id = ?', (checkin_group_id,))
+            deleted = cursor.rowcount > 0
+            conn.commit()
+        if deleted:
+            self._load_group_pairs()
+        return deleted
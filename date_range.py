@@ -0,0 +1,48 @@
+import re
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+_DAYS = re.compile(r'^([1-9]\d*)d$')
+_MONTH = re.compile(r'^(\d{4})-(\d{2})$')
+
+def parse_date_range(text: str, today: Optional[date] = None,
+                     max_days: Optional[int] = None) -> Tuple[date, date]:
+    """解析日期范围，返回 (开始日期, 结束日期)，两端都包含
+
+    支持的格式：today / yesterday、7d（最近7天，含今天）、2024-05（整月）、
+    2024-05-01（单日）、2024-05-01..2024-05-31。格式错误或超出 max_days 时抛出 ValueError。
+    """
+    today = today or date.today()
+    text = (text or '').strip().lower()
+    try:
+        start, end = _parse(text, today)
+    except OverflowError:
+        raise ValueError("日期超出范围")
+    except ValueError:
+        raise ValueError(f"无法识别的日期范围：{text}")
+
+    if start > end:
+        raise ValueError("开始日期不能晚于结束日期")
+    if max_days is not None and (end - start).days + 1 > max_days:
+        raise ValueError(f"日期范围不能超过 {max_days} 天")
+    return start, end
+
+def _parse(text: str, today: date) -> Tuple[date, date]:
+    """按格式解析，日期无效时由 date/timedelta 抛出 ValueError 或 OverflowError"""
+    if text in ('', 'today', '今天'):
+        start = end = today
+    elif text in ('yesterday', '昨天'):
+        start = end = today - timedelta(days=1)
+    elif _DAYS.match(text):
+        days = int(_DAYS.match(text).group(1))
+        start, end = today - timedelta(days=days - 1), today
+    elif _MONTH.match(text):
+        year, month = map(int, _MONTH.match(text).groups())
+        start = date(year, month, 1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    elif '..' in text:
+        first, _, last = text.partition('..')
+        start, end = date.fromisoformat(first.strip()), date.fromisoformat(last.strip())
+    else:
+        start = end = date.fromisoformat(text)
+    return start, end
@@ -0,0 +1,120 @@
+import logging
+import threading
+from dataclasses import replace
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from telegram.ext import filters
+from config import Config
+from models import GroupPair
+
+logger = logging.getLogger(__name__)
+
+ROLE_CHECKIN = 'checkin'
+ROLE_SEARCH = 'search'
+
+# 规则名 -> (GroupPair 字段, 全局配置项)，规则名与 /config 命令一致
+RULES = {
+    'checkin_min': ('checkin_points_min', 'CHECKIN_POINTS_MIN'),
+    'checkin_max': ('checkin_points_max', 'CHECKIN_POINTS_MAX'),
+    'message_points': ('message_points', 'MESSAGE_POINTS'),
+    'max_daily_points': ('max_message_points_per_day', 'MAX_MESSAGE_POINTS_PER_DAY'),
+    'search_cost': ('search_message_cost', 'SEARCH_MESSAGE_COST'),
+}
+
+class GroupRoute(NamedTuple):
+    """会话所属的群组组合及其角色"""
+    pair: GroupPair
+    role: str
+
+    @property
+    def is_checkin(self) -> bool:
+        return self.role == ROLE_CHECKIN
+
+    @property
+    def is_search(self) -> bool:
+        return self.role == ROLE_SEARCH
+
+    def rule(self, name: str, settings=None) -> int:
+        return rule(self.pair, name, settings)
+
+def rule(pair: GroupPair, name: str, settings=None) -> int:
+    """读取群组组合的积分规则，未单独设置时使用全局配置（settings 为运行时配置快照）"""
+    field, config_attr = RULES[name]
+    value = getattr(pair, field)
+    if value is not None:
+        return value
+    return getattr(settings, name) if settings is not None else getattr(Config, config_attr)
+
+def default_pair() -> Optional[GroupPair]:
+    """环境变量中配置的默认群组组合"""
+    if not Config.CHECKIN_GROUP_ID or not Config.SEARCH_GROUP_ID:
+        return None
+    return GroupPair(Config.CHECKIN_GROUP_ID, Config.SEARCH_GROUP_ID, name='默认')
+
+class GroupRouter:
+    """会话ID -> 群组组合的路由表
+
+    签到群和搜索群的会话ID都直接映射到所属组合，查询为 O(1)。checkin_chats 和
+    search_chats 是随路由表同步更新的 filters.Chat，可直接用于注册处理器。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pairs: Dict[int, GroupPair] = {}  # 签到群ID -> 组合
+        self._routes: Dict[int, GroupRoute] = {}
+        self.checkin_chats = filters.Chat(allow_empty=False)
+        self.search_chats = filters.Chat(allow_empty=False)
+
+    def load(self, pairs: Iterable[GroupPair]):
+        """用默认组合和数据库中的组合重建路由表"""
+        with self._lock:
+            self._pairs = {}
+            default = default_pair()
+            if default is not None:
+                self._pairs[default.checkin_group_id] = default
+            for pair in pairs:
+                self._pairs[pair.checkin_group_id] = pair
+            self._rebuild()
+
+    def set(self, pair: GroupPair):
+        """新增或替换一个组合"""
+        with self._lock:
+            self._pairs[pair.checkin_group_id] = pair
+            self._rebuild()
+
+    def remove(self, checkin_group_id: int) -> Optional[GroupPair]:
+        with self._lock:
+            pair = self._pairs.pop(checkin_group_id, None)
+            self._rebuild()
+            return pair
+
+    def _rebuild(self):
+        routes = {}
+        for pair in self._pairs.values():
+            if not pair.enabled:
+                continue
+            routes[pair.checkin_group_id] = GroupRoute(pair, ROLE_CHECKIN)
+            routes[pair.search_group_id] = GroupRoute(pair, ROLE_SEARCH)
+        self._routes = routes
+        self.checkin_chats.chat_ids = {chat_id for chat_id, r in routes.items() if r.is_checkin}
+        self.search_chats.chat_ids = {chat_id for chat_id, r in routes.items() if r.is_search}
+
+    def route(self, chat_id: int) -> Optional[GroupRoute]:
+        """查询会话所属的群组组合"""
+        return self._routes.get(chat_id)
+
+    def get(self, checkin_group_id: int) -> Optional[GroupPair]:
+        return self._pairs.get(checkin_group_id)
+
+    def pairs(self) -> List[GroupPair]:
+        with self._lock:
+            return list(self._pairs.values())
+
+    def with_rule(self, checkin_group_id: int, name: str, value: Optional[int]) -> Optional[GroupPair]:
+        """返回修改了一条规则的组合副本（不修改路由表）"""
+        pair = self._pairs.get(checkin_group_id)
+        if pair is None or name not in RULES:
+            return None
+        return replace(pair, **{RULES[name][0]: value})
+
+    def __len__(self):
+        return len(self._pairs)
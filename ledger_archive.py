@@ -0,0 +1,52 @@
+import os
+import gzip
+import json
+import logging
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'points_change', 'transaction_type', 'description', 'created_at')
+
+class LedgerArchive:
+    """积分流水冷归档
+
+    按流水创建时间（UTC）每月一个 gzip 压缩的 JSONL 文件，每次归档追加一个新的 gzip 成员并 fsync，
+    已写入的内容不会被修改。归档中断后重新执行可能重复写入同一批流水，
+    读取时按 id 去重即可。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, month: str) -> str:
+        """month 为 YYYY-MM"""
+        return os.path.join(self.directory, f'points_transactions-{month}.jsonl.gz')
+
+    def append(self, rows: Iterable[tuple]) -> List[str]:
+        """追加一批流水（按 ARCHIVE_COLUMNS 顺序），按流水 created_at 所在月份写入对应文件，返回写入的文件路径"""
+        by_month: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_month.setdefault(row[-1][:7], []).append(row)
+
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for month, month_rows in sorted(by_month.items()):
+            path = self.path_for(month)
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    for row in month_rows:
+                        line = json.dumps(dict(zip(ARCHIVE_COLUMNS, row)), ensure_ascii=False)
+                        f.write(line.encode('utf-8') + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+            paths.append(path)
+        return paths
+
+    @staticmethod
+    def read(path: str):
+        """逐行读取归档文件"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
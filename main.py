@@ -6,75 +6,168 @@ Telegram 积分机器人
 2. VIP群：只有达到积分要求的用户才能发言
 """
 
+import os
+import shutil
 import logging
 import asyncio
 import datetime
-from telegram.ext import Application, CommandHandler
+import tempfile
+from pathlib import Path
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters
+from telegram.request import HTTPXRequest
 from config import Config
 from database import Database
+from async_database import AsyncDatabase
+from update_processor import UserOrderedUpdateProcessor
+from outbound import OutboundScheduler, PRIORITY_REPLY
+from points_import import PointsFileError, parse_points_file
+from group_routing import RULES, rule
+from models import GroupPair
+from runtime_config import TUNABLES
+from date_range import parse_date_range
+from data_export import EXPORT_SPECS, parse_export_args, write_chunks
+from restrictions import Moderation
+from metrics import InstrumentedRequest, MetricsServer, register_gauge, track_handler
 from handlers.checkin_handler import CheckinHandler
 from handlers.search_handler import SearchHandler
 
+# 积分流水类型的显示名称
+TRANSACTION_TYPE_NAMES = {
+    'checkin': '签到',
+    'message': '发言',
+    'search': '搜索群发言',
+    'expire': '过期',
+    'admin_adjust': '管理员调整',
+    'admin_bulk': '批量调整',
+}
+
+# 按天列出明细的最大天数，超过时只显示合计
+STATS_DAILY_ROWS = 31
+
 # 配置日志
+# 日志文件在第一次写入时才创建，导入 main 的工具先配置日志即可避免生成 bot.log
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO,
     handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
+        logging.FileHandler('bot.log', encoding='utf-8', delay=True),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
 class TelegramBot:
-    def __init__(self):
+    def __init__(self, builder=None):
+        """builder 可传入预先配置的 ApplicationBuilder（如压测时替换 Bot API 请求对象）"""
         # 验证配置
         Config.validate()
         
         # 初始化数据库
         self.db = Database()
+        self.adb = AsyncDatabase(self.db)
         
         # 初始化处理器
         self.checkin_handler = CheckinHandler(self.db)
         self.search_handler = SearchHandler(self.db)
         
         # 创建应用
-        self.application = Application.builder().token(Config.BOT_TOKEN).build()
+        if builder is None:
+            builder = (
+                Application.builder()
+                .token(Config.BOT_TOKEN)
+                .request(InstrumentedRequest(HTTPXRequest(connection_pool_size=256)))
+                .get_updates_request(InstrumentedRequest(HTTPXRequest()))
+            )
+        if Config.CONCURRENT_UPDATES > 1:
+            # 不同用户的更新并发处理，同一用户的更新保持顺序
+            builder = builder.concurrent_updates(UserOrderedUpdateProcessor(Config.CONCURRENT_UPDATES))
+        self.application = builder.post_init(self._post_init).post_shutdown(self._post_shutdown).build()
+        
+        # 出站请求调度器：限速、优先级、重试和合并
+        self.outbound = OutboundScheduler(self.application.bot)
+        self.application.bot_data['outbound'] = self.outbound  # 供处理器通过 context.bot_data 使用
+        self.application.bot_data['groups'] = self.db.groups
+        # 禁言记录：跳过重复禁言，积分恢复后自动解禁
+        self.moderation = Moderation(self.adb, self.outbound)
+        self.application.bot_data['moderation'] = self.moderation
         
         # 注册处理器
         self._register_handlers()
+        
+        # 监控指标
+        self.metrics_server = None
+        self._register_gauges()
     
     def _register_handlers(self):
         """注册所有消息处理器"""
         
+        # 每个更新开始处理前固定一份运行时配置快照（context.config）
+        self.application.add_handler(TypeHandler(Update, self._bind_config), group=-1)
+        
         # 通用命令
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
+        self._add_handler(CommandHandler("start", self.start_command))
+        self._add_handler(CommandHandler("help", self.help_command))
         
         # 管理员命令
-        self.application.add_handler(CommandHandler("admin", self.admin_command))
-        self.application.add_handler(CommandHandler("unban", self.unban_command))
-        self.application.add_handler(CommandHandler("stats", self.stats_command))
-        self.application.add_handler(CommandHandler("config", self.config_command))
+        self._add_handler(CommandHandler("admin", self.admin_command))
+        self._add_handler(CommandHandler("unban", self.unban_command))
+        self._add_handler(CommandHandler("stats", self.stats_command))
+        self._add_handler(CommandHandler("config", self.config_command))
+        self._add_handler(CommandHandler("export", self.export_command))
+        self._add_handler(MessageHandler(
+            filters.Document.ALL & filters.CaptionRegex(r'^/admin(@\w+)?\s+bulk_points\b'),
+            self.bulk_points_document
+        ))
         
         # 签到群处理器
         for handler in self.checkin_handler.get_handlers():
-            self.application.add_handler(handler)
+            self._add_handler(handler)
         
         # 搜索群处理器
         for handler in self.search_handler.get_handlers():
-            self.application.add_handler(handler)
+            self._add_handler(handler)
         
         logger.info("所有处理器注册完成")
     
+    async def _bind_config(self, update, context):
+        """让同一个更新的所有处理器读到同一版本的配置"""
+        context.config = self.db.runtime_config.current()
+    
+    def _add_handler(self, handler):
+        """注册处理器，并记录其回调耗时"""
+        name = getattr(handler.callback, '__qualname__', None) or type(handler).__name__
+        handler.callback = track_handler(name, handler.callback)
+        self.application.add_handler(handler)
+    
+    def _register_gauges(self):
+        """注册队列深度等实时指标"""
+        register_gauge('bot_update_queue_size', '等待处理的更新数量',
+                       self.application.update_queue.qsize)
+        processor = self.application.update_processor
+        if isinstance(processor, UserOrderedUpdateProcessor):
+            register_gauge('bot_update_processor_pending_users', '有更新在排队或处理中的用户数',
+                           lambda: processor.pending_keys)
+        register_gauge('bot_outbound_queue_size', '出站调度器中排队和进行中的请求数量',
+                       lambda: len(self.outbound))
+        register_gauge('bot_db_executor_queue_size', '等待数据库线程执行的任务数量',
+                       self.adb.queue_size)
+        register_gauge('bot_message_batch_pending', '尚未写入数据库的签到群发言数量',
+                       lambda: len(self.db.message_batcher) if self.db.message_batcher is not None else 0)
+        register_gauge('bot_balance_cache_hits', '余额缓存命中次数', lambda: self.db.balance_cache.hits)
+        register_gauge('bot_balance_cache_misses', '余额缓存未命中次数', lambda: self.db.balance_cache.misses)
+        register_gauge('bot_restricted_users', '禁言记录中仍在禁言的 (用户, 群) 数量', lambda: len(self.db.restrictions))
+    
     async def start_command(self, update, context):
         """开始命令"""
         user = update.effective_user
         chat = update.effective_chat
+        route = self.db.groups.route(chat.id)
         
         if chat.type == 'private':
             # 私聊回复
-            await update.message.reply_text(
+            self.outbound.reply_text(
+                update.message,
                 f"👋 你好 @{user.username or user.first_name}！\n\n"
                 f"🤖 我是积分管理机器人\n\n"
                 f"📝 功能说明：\n"
@@ -82,31 +175,35 @@ class TelegramBot:
                 f"• 在搜索群消耗积分进行发言搜索\n\n"
                 f"💡 使用 /help 查看详细帮助"
             )
-        elif chat.id == Config.CHECKIN_GROUP_ID:
+        elif route is not None and route.is_checkin:
             # 签到群回复
-            await update.message.reply_text(
+            self.outbound.reply_text(
+                update.message,
                 f"👋 欢迎 @{user.username or user.first_name}！\n\n"
                 f"📅 使用 /checkin 进行签到\n"
                 f"💎 使用 /points 查看积分\n"
                 f"🏆 使用 /rank 查看排行榜"
             )
-        elif chat.id == Config.SEARCH_GROUP_ID:
+        elif route is not None and route.is_search:
             # 搜索群回复
-            user_points = self.db.get_user_points(user.id)
-            status = "✅ 可以发言" if user_points >= Config.SEARCH_MESSAGE_COST else "❌ 积分不足"
+            search_cost = route.rule('search_cost', context.config)
+            user_points = await self.adb.get_user_points(user.id)
+            status = "✅ 可以发言" if user_points >= search_cost else "❌ 积分不足"
 
-            await update.message.reply_text(
+            self.outbound.reply_text(
+                update.message,
                 f"👋 欢迎 @{user.username or user.first_name}！\n\n"
                 f"💎 您的积分：{user_points}\n"
-                f"💰 发言消耗：{Config.SEARCH_MESSAGE_COST} 积分/条\n"
+                f"💰 发言消耗：{search_cost} 积分/条\n"
                 f"📊 状态：{status}"
             )
     
     async def help_command(self, update, context):
         """帮助命令"""
         chat = update.effective_chat
+        route = self.db.groups.route(chat.id)
         
-        if chat.id == Config.CHECKIN_GROUP_ID:
+        if route is not None and route.is_checkin:
             help_text = (
                 "📚 签到群命令帮助\n\n"
                 "🔹 /checkin - 每日签到获取积分\n"
@@ -114,15 +211,15 @@ class TelegramBot:
                 "🔹 /rank - 查看积分排行榜\n"
                 "🔹 /help - 显示此帮助信息\n\n"
                 "💡 积分获取方式：\n"
-                f"• 每日签到：{Config.CHECKIN_POINTS_MIN}-{Config.CHECKIN_POINTS_MAX} 积分（随机）\n"
-                f"• 群内发言：{Config.MESSAGE_POINTS} 积分/条（每日上限 {Config.MAX_MESSAGE_POINTS_PER_DAY} 积分）\n\n"
-                f"💰 搜索群发言：{Config.SEARCH_MESSAGE_COST} 积分/条"
+                f"• 每日签到：{route.rule('checkin_min', context.config)}-{route.rule('checkin_max', context.config)} 积分（随机）\n"
+                f"• 群内发言：{route.rule('message_points', context.config)} 积分/条（每日上限 {route.rule('max_daily_points', context.config)} 积分）\n\n"
+                f"💰 搜索群发言：{route.rule('search_cost', context.config)} 积分/条"
             )
-        elif chat.id == Config.SEARCH_GROUP_ID:
+        elif route is not None and route.is_search:
             help_text = (
                 "📚 搜索群说明\n\n"
                 f"🔍 本群为积分消费搜索群组\n"
-                f"💰 发言消耗：{Config.SEARCH_MESSAGE_COST} 积分/条\n"
+                f"💰 发言消耗：{route.rule('search_cost', context.config)} 积分/条\n"
                 f"💡 只要有积分就可以发言搜索\n"
                 f"📈 请前往签到群获取积分\n\n"
                 f"📊 使用 /start 查看个人状态"
@@ -137,7 +234,7 @@ class TelegramBot:
                 "💡 请加入相应群组使用功能"
             )
         
-        await update.message.reply_text(help_text)
+        self.outbound.reply_text(update.message, help_text)
     
     async def admin_command(self, update, context):
         """管理员命令"""
@@ -145,19 +242,26 @@ class TelegramBot:
         
         # 检查管理员权限
         if user.id not in Config.ADMIN_USER_IDS:
-            await update.message.reply_text("❌ 您没有管理员权限")
+            self.outbound.reply_text(update.message, "❌ 您没有管理员权限")
             return
         
         # 解析命令参数
         args = context.args
         if not args:
-            await update.message.reply_text(
+            self.outbound.reply_text(
+                update.message,
                 "🔧 管理员命令帮助\n\n"
                 "• /admin add_points <用户ID> <积分> - 给用户添加积分\n"
                 "• /admin user_info <用户ID> - 查看用户信息\n"
-                "• /unban [用户ID] - 解除用户禁言（可回复消息使用）\n"
-                "• /stats - 查看系统统计\n"
-                "• /config - 查看和修改系统配置"
+                "• /admin bulk_points [说明] - 批量调整积分（回复 CSV/JSON 文件，或作为文件说明发送）\n"
+                "• /admin group_list - 查看所有签到群/搜索群组合\n"
+                "• /admin group_add <签到群ID> <搜索群ID> [名称] - 添加群组组合\n"
+                "• /admin group_set <签到群ID> <规则> <数值|default> - 设置组合的积分规则\n"
+                "• /admin group_remove <签到群ID> - 删除群组组合\n"
+                "• /unban [用户ID] [搜索群ID] - 解除用户禁言（可回复消息使用）\n"
+                "• /stats [日期范围] - 查看系统统计，指定范围时按天统计活动（如 7d、2024-05）\n"
+                "• /config - 查看和修改系统配置\n"
+                "• /export <users|balances|transactions|checkins> [日期范围] [csv|jsonl] - 导出数据"
             )
             return
         
@@ -168,32 +272,153 @@ class TelegramBot:
                 user_id = int(args[1])
                 points = int(args[2])
                 
-                if self.db.add_points(user_id, points, 'admin_adjust', f'管理员调整: +{points}'):
-                    total_points = self.db.get_user_points(user_id)
-                    await update.message.reply_text(
+                if await self.adb.add_points(user_id, points, 'admin_adjust', f'管理员调整: +{points}'):
+                    total_points = await self.adb.get_user_points(user_id)
+                    self.outbound.reply_text(
+                        update.message,
                         f"✅ 成功给用户 {user_id} 添加 {points} 积分\n"
                         f"💎 用户总积分：{total_points}"
                     )
                 else:
-                    await update.message.reply_text("❌ 添加积分失败")
+                    self.outbound.reply_text(update.message, "❌ 添加积分失败")
             except ValueError:
-                await update.message.reply_text("❌ 参数格式错误")
+                self.outbound.reply_text(update.message, "❌ 参数格式错误")
         
         elif command == "user_info" and len(args) >= 2:
             try:
                 user_id = int(args[1])
-                points = self.db.get_user_points(user_id)
-                rank, total_users = self.db.get_user_rank(user_id)
+                points = await self.adb.get_user_points(user_id)
+                rank, total_users = await self.adb.get_user_rank(user_id)
                 
-                await update.message.reply_text(
+                self.outbound.reply_text(
+                    update.message,
                     f"👤 用户 {user_id} 信息\n\n"
                     f"💎 总积分：{points}\n"
                     f"🏆 排名：{rank}/{total_users}\n"
-                    f"🔍 搜索群发言：{'✅ 可以发言' if points >= Config.SEARCH_MESSAGE_COST else '❌ 积分不足'}"
+                    f"🔍 搜索群发言：{'✅ 可以发言' if points >= context.config.search_cost else '❌ 积分不足'}"
                 )
             except ValueError:
-                await update.message.reply_text("❌ 用户ID格式错误")
+                self.outbound.reply_text(update.message, "❌ 用户ID格式错误")
         
+        elif command == "bulk_points":
+            replied = update.message.reply_to_message
+            if not replied or not replied.document:
+                self.outbound.reply_text(update.message, "❌ 请回复包含积分数据的 CSV/JSON 文件使用此命令")
+                return
+            await self._bulk_points(update, context, replied.document, ' '.join(args[1:]))
+        
+        elif command.startswith("group_"):
+            await self._group_admin(update, context, command, args[1:])
+
+    async def _group_admin(self, update, context, command: str, args):
+        """群组组合管理"""
+        try:
+            if command == "group_list":
+                settings = context.config
+                lines = ["🏘️ 群组组合\n"]
+                for pair in self.db.groups.pairs():
+                    rules = "，".join(
+                        f"{name}={rule(pair, name, settings)}" + ("" if getattr(pair, field) is None else "*")
+                        for name, (field, _) in RULES.items()
+                    )
+                    lines.append(f"• {pair.name or '未命名'}：签到群 {pair.checkin_group_id} / 搜索群 {pair.search_group_id}\n  {rules}")
+                lines.append("\n带 * 的规则为该组合单独设置，其余使用全局配置")
+                self.outbound.reply_text(update.message, "\n".join(lines))
+            
+            elif command == "group_add" and len(args) >= 2:
+                pair = GroupPair(int(args[0]), int(args[1]), name=' '.join(args[2:]) or None)
+                if self.db.groups.get(pair.checkin_group_id) is not None:
+                    # 重新添加会覆盖组合已设置的规则
+                    self.outbound.reply_text(
+                        update.message,
+                        f"❌ 签到群 {pair.checkin_group_id} 的组合已存在，请用 group_set 修改规则或先 group_remove"
+                    )
+                elif await self.adb.save_group_pair(pair):
+                    self.outbound.reply_text(
+                        update.message,
+                        f"✅ 已添加群组组合\n📅 签到群：{pair.checkin_group_id}\n🔍 搜索群：{pair.search_group_id}"
+                    )
+                else:
+                    self.outbound.reply_text(update.message, "❌ 添加失败，搜索群可能已属于其他组合")
+            
+            elif command == "group_set" and len(args) >= 3:
+                value = None if args[2] == 'default' else int(args[2])
+                checkin_group_id = int(args[0])
+                try:
+                    updated = await self.adb.set_group_rule(checkin_group_id, args[1], value)
+                except ValueError as e:
+                    self.outbound.reply_text(update.message, f"❌ 规则无效：{e}")
+                    return
+                if updated:
+                    self.outbound.reply_text(update.message, f"✅ 群组规则已更新\n🔧 {args[1]}: {args[2]}")
+                else:
+                    self.outbound.reply_text(
+                        update.message,
+                        f"❌ 更新失败，请检查签到群ID和规则名（{', '.join(RULES)}）"
+                    )
+            
+            elif command == "group_remove" and len(args) >= 1:
+                if await self.adb.remove_group_pair(int(args[0])):
+                    self.outbound.reply_text(update.message, f"✅ 已删除群组组合 {args[0]}")
+                else:
+                    self.outbound.reply_text(update.message, "❌ 未找到该群组组合")
+            
+            else:
+                self.outbound.reply_text(update.message, "❌ 参数不足，使用 /admin 查看帮助")
+        except ValueError:
+            self.outbound.reply_text(update.message, "❌ 群组ID和数值必须是数字")
+
+    async def bulk_points_document(self, update, context):
+        """管理员发送文件并以 /admin bulk_points 作为说明时批量调整积分"""
+        if update.effective_user.id not in Config.ADMIN_USER_IDS:
+            self.outbound.reply_text(update.message, "❌ 您没有管理员权限")
+            return
+        description = update.message.caption.split(maxsplit=2)[2:]
+        await self._bulk_points(update, context, update.message.document, ' '.join(description))
+
+    async def _bulk_points(self, update, context, document, description: str):
+        """下载积分文件，解析后在一个事务中批量写入"""
+        user = update.effective_user
+        file = await context.bot.get_file(document.file_id)
+        data = bytes(await file.download_as_bytearray())
+
+        try:
+            # 解析是纯计算，不占用数据库线程
+            adjustments, rows, errors = await asyncio.to_thread(
+                parse_points_file, data, document.file_name or '', Config.BULK_POINTS_MAX_ROWS
+            )
+        except PointsFileError as e:
+            self.outbound.reply_text(update.message, f"❌ 文件解析失败：{e}")
+            return
+
+        if not adjustments:
+            self.outbound.reply_text(update.message, "❌ 文件中没有有效的积分数据")
+            return
+
+        description = description or f'管理员批量调整: {document.file_name or "文件"}'
+        try:
+            result = await self.adb.bulk_add_points(adjustments, 'admin_bulk', description)
+        except Exception as e:
+            logger.error(f"批量调整积分失败: {e}")
+            self.outbound.reply_text(update.message, "❌ 批量调整积分失败")
+            return
+
+        logger.info(f"管理员 {user.id} 批量调整积分：{rows} 行，{result.applied} 个用户，合计 {result.total_points}")
+        summary = (
+            f"{'⚠️ 批量调整积分部分完成' if result.failed else '✅ 批量调整积分完成'}\n\n"
+            f"📄 有效行数：{rows}\n"
+            f"👥 调整用户：{result.applied}（新用户 {result.created}）\n"
+            f"💎 积分合计：{result.total_points:+d}\n"
+        )
+        if result.skipped:
+            summary += f"⚠️ 余额不足跳过：{result.skipped} 个用户\n"
+        if result.failed:
+            summary += f"❌ 写入失败未调整：{result.failed} 个用户（已调整的用户不受影响，请勿重复导入整个文件）\n"
+        if errors:
+            summary += f"❌ 无效行：{len(errors)}\n" + "\n".join(errors[:5])
+            if len(errors) > 5:
+                summary += "\n..."
+        self.outbound.reply_text(update.message, summary)
 
     async def unban_command(self, update, context):
         """解禁命令"""
@@ -201,7 +426,7 @@ class TelegramBot:
         
         # 检查管理员权限
         if user.id not in Config.ADMIN_USER_IDS:
-            await update.message.reply_text("❌ 您没有管理员权限")
+            self.outbound.reply_text(update.message, "❌ 您没有管理员权限")
             return
         
         try:
@@ -213,32 +438,20 @@ class TelegramBot:
             elif context.args and len(context.args) >= 1:
                 user_id = int(context.args[0])
             else:
-                await update.message.reply_text("❌ 请回复要解禁的用户消息，或使用 /unban <用户ID>")
+                self.outbound.reply_text(update.message, "❌ 请回复要解禁的用户消息，或使用 /unban <用户ID> [搜索群ID]")
                 return
             
-            # 恢复用户在搜索群的所有权限
-            from telegram import ChatPermissions
-            unrestricted_permissions = ChatPermissions(
-                can_send_messages=True,
-                can_send_audios=True,
-                can_send_documents=True,
-                can_send_photos=True,
-                can_send_videos=True,
-                can_send_video_notes=True,
-                can_send_voice_notes=True,
-                can_send_polls=True,
-                can_send_other_messages=True,
-                can_add_web_page_previews=True,
-                can_change_info=False,
-                can_invite_users=True,
-                can_pin_messages=False
-            )
+            # 在群组内使用时解禁所属组合的搜索群，私聊时可指定搜索群ID
+            route = self.db.groups.route(update.effective_chat.id)
+            if route is not None:
+                search_group_id = route.pair.search_group_id
+            elif context.args and len(context.args) >= 2:
+                search_group_id = int(context.args[1])
+            else:
+                search_group_id = Config.SEARCH_GROUP_ID
             
-            await context.bot.restrict_chat_member(
-                chat_id=Config.SEARCH_GROUP_ID,
-                user_id=user_id,
-                permissions=unrestricted_permissions
-            )
+            # 恢复用户在搜索群的所有权限，同时删除禁言记录
+            await self.moderation.lift(search_group_id, user_id)
             
             # 获取用户名用于显示
             username = "未知用户"
@@ -246,26 +459,24 @@ class TelegramBot:
                 replied_user = update.message.reply_to_message.from_user
                 username = f"@{replied_user.username}" if replied_user.username else replied_user.first_name
             
-            await update.message.reply_text(
+            self.outbound.reply_text(
+                update.message,
                 f"✅ 已解除用户 {username} ({user_id}) 的禁言状态\n"
                 f"🔓 用户现在可以在搜索群正常发言"
             )
             
-            # 尝试通知用户
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text="🎉 您在搜索群的禁言已被管理员解除！\n\n"
-                         "现在您可以正常发言了。请注意保持足够的积分以避免再次被限制。"
-                )
-            except Exception as e:
-                logger.warning(f"无法向用户 {user_id} 发送解禁通知: {e}")
+            # 通知用户（发送失败时由出站调度器记录日志）
+            self.outbound.send_message(
+                chat_id=user_id,
+                text="🎉 您在搜索群的禁言已被管理员解除！\n\n"
+                     "现在您可以正常发言了。请注意保持足够的积分以避免再次被限制。"
+            )
             
         except ValueError:
-            await update.message.reply_text("❌ 用户ID格式错误")
+            self.outbound.reply_text(update.message, "❌ 用户ID格式错误")
         except Exception as e:
             logger.error(f"解禁用户失败: {e}")
-            await update.message.reply_text("❌ 解禁失败，请检查用户ID或权限设置")
+            self.outbound.reply_text(update.message, "❌ 解禁失败，请检查用户ID或权限设置")
     
     async def stats_command(self, update, context):
         """统计命令"""
@@ -273,24 +484,25 @@ class TelegramBot:
         
         # 检查管理员权限
         if user.id not in Config.ADMIN_USER_IDS:
-            await update.message.reply_text("❌ 您没有管理员权限")
+            self.outbound.reply_text(update.message, "❌ 您没有管理员权限")
             return
         
-        # 获取统计数据
-        top_users = self.db.get_top_users(5)
-        total_users = len(self.db.get_top_users(999999))  # 获取所有用户数量
+        if context.args:
+            await self._range_stats(update, ' '.join(context.args))
+            return
         
-        # 计算有积分用户数量
-        active_count = 0
-        for _, _, _, points in self.db.get_top_users(999999):
-            if points >= Config.SEARCH_MESSAGE_COST:
-                active_count += 1
+        # 获取统计数据
+        top_users = await self.adb.get_top_users(5)
+        stats = await self.adb.get_stats()
+        active_rate = stats.spendable_users / stats.total_users * 100 if stats.total_users else 0.0
         
         stats_text = (
             f"📊 系统统计\n\n"
-            f"👥 总用户数：{total_users}\n"
-            f"� 有积分用户：{active_count}\n"
-            f"📈 活跃率：{active_count/total_users*100:.1f}%\n\n"
+            f"👥 总用户数：{stats.total_users}\n"
+            f"� 有积分用户：{stats.spendable_users}\n"
+            f"📈 活跃率：{active_rate:.1f}%\n"
+            f"💎 流通积分：{stats.total_points}\n"
+            f"🔥 今日活跃：{stats.daily_active_users}\n\n"
             f"🏆 TOP 5 用户：\n"
         )
         
@@ -298,7 +510,100 @@ class TelegramBot:
             display_name = username or first_name or f"用户{user_id}"
             stats_text += f"{i}. @{display_name}: {points} 积分\n"
         
-        await update.message.reply_text(stats_text)
+        self.outbound.reply_text(update.message, stats_text)
+
+    async def _range_stats(self, update, text: str):
+        """按时间段统计活动（从按天汇总表读取）"""
+        try:
+            start, end = parse_date_range(text, max_days=366)
+        except ValueError as e:
+            self.outbound.reply_text(
+                update.message,
+                f"❌ 日期范围无效：{e}\n"
+                "用法：/stats <today|yesterday|7d|2024-05|2024-05-01|2024-05-01..2024-05-31>"
+            )
+            return
+
+        stats = await self.adb.get_activity_stats(start, end)
+        messages = sum(day.messages for day in stats.days)
+        checkins = sum(day.checkins for day in stats.days)
+        earned = sum(day.points_earned for day in stats.days)
+        spent = sum(day.points_spent for day in stats.days)
+
+        lines = [
+            f"📊 活动统计 {stats.start} ~ {stats.end}\n",
+            f"💬 发言：{messages} 条",
+            f"✅ 签到：{checkins} 次",
+            f"📈 积分收入：{earned}",
+            f"📉 积分支出：{spent}",
+        ]
+        if stats.points_by_type:
+            lines.append("\n💎 按类型（收入/支出）：")
+            for transaction_type, (credits, debits) in sorted(stats.points_by_type.items()):
+                name = TRANSACTION_TYPE_NAMES.get(transaction_type, transaction_type or '其他')
+                lines.append(f"• {name}：+{credits} / -{debits}")
+        if stats.group_messages:
+            lines.append("\n👥 各群发言：")
+            for group_id, count in sorted(stats.group_messages.items(), key=lambda item: -item[1]):
+                lines.append(f"• {group_id}：{count} 条")
+        if len(stats.days) <= STATS_DAILY_ROWS:
+            lines.append("\n📅 每日（发言/签到/收入/支出）：")
+            for day in stats.days:
+                lines.append(f"{day.day}：{day.messages} / {day.checkins} / +{day.points_earned} / -{day.points_spent}")
+
+        self.outbound.reply_text(update.message, "\n".join(lines))
+
+    async def export_command(self, update, context):
+        """导出数据命令：/export <类型> [日期范围] [csv|jsonl]"""
+        if update.effective_user.id not in Config.ADMIN_USER_IDS:
+            self.outbound.reply_text(update.message, "❌ 您没有管理员权限")
+            return
+
+        try:
+            kind, start, end, fmt = parse_export_args(context.args)
+        except ValueError as e:
+            self.outbound.reply_text(update.message, f"❌ {e}")
+            return
+
+        self.outbound.reply_text(update.message, f"⏳ 正在导出 {kind}，完成后分片发送...")
+        # 导出可能持续较久，在后台进行，不占用该管理员的更新处理顺序
+        context.application.create_task(self._export(update, kind, start, end, fmt), update=update)
+
+    async def _export(self, update, kind: str, start, end, fmt: str):
+        """逐个生成导出分片并发送，发送后立即删除"""
+        chat_id = update.effective_chat.id
+        directory = tempfile.mkdtemp(prefix='export-')
+        suffix = f'-{start.isoformat()}_{end.isoformat()}' if start else ''
+        chunks = write_chunks(self.db.iter_export(kind, start, end), EXPORT_SPECS[kind].columns, fmt,
+                              directory, f'{kind}{suffix}', Config.EXPORT_FILE_MAX_MB * 1024 * 1024)
+        parts = total = 0
+        try:
+            while True:
+                # 分片写入在线程中进行（不占用数据库线程池），每页读取都是独立的短读取
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                path, rows = chunk
+                parts += 1
+                total += rows
+                await self.outbound.send_document(
+                    chat_id, Path(path), caption=f"{kind} 第 {parts} 部分（{rows} 行）",
+                    write_timeout=120
+                )
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"导出 {kind} 失败: {e}")
+            self.outbound.send_message(chat_id, f"❌ 导出失败：{e}", PRIORITY_REPLY)
+            return
+        finally:
+            chunks.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        logger.info(f"管理员 {update.effective_user.id} 导出 {kind}：{total} 行，{parts} 个文件")
+        if parts == 0:
+            self.outbound.send_message(chat_id, "📭 没有符合条件的数据", PRIORITY_REPLY)
+        else:
+            self.outbound.send_message(chat_id, f"✅ 导出完成：{total} 行，{parts} 个文件", PRIORITY_REPLY)
 
     async def config_command(self, update, context):
         """配置管理命令"""
@@ -306,14 +611,14 @@ class TelegramBot:
 
         # 检查管理员权限
         if user.id not in Config.ADMIN_USER_IDS:
-            await update.message.reply_text("❌ 您没有管理员权限")
+            self.outbound.reply_text(update.message, "❌ 您没有管理员权限")
             return
 
         # 解析命令参数
         args = context.args
         if not args:
             # 显示当前配置
-            config_info = Config.get_config_info()
+            config_info = context.config.as_dict()
             expire_text = "永不过期" if config_info['expire_days'] == 0 else f"{config_info['expire_days']}天"
             config_text = (
                 "⚙️ 当前系统配置\n\n"
@@ -322,8 +627,9 @@ class TelegramBot:
                 f"💰 搜索群发言消耗：{config_info['search_cost']}\n"
                 f"📊 每日发言积分上限：{config_info['max_daily_points']}\n"
                 f"⏰ 积分过期时间：{expire_text}\n"
-                f"🕐 积分为0时发言限制：{config_info['cooldown_hours']}小时一次\n\n"
-                "🔧 修改配置命令：\n"
+                f"🕐 积分为0时发言限制：{config_info['cooldown_hours']}小时一次\n"
+                f"🔖 配置版本：v{context.config.version}\n\n"
+                "🔧 修改配置命令（保存到数据库，重启后仍然有效）：\n"
                 "• /config checkin_min <数值> - 设置签到最少积分\n"
                 "• /config checkin_max <数值> - 设置签到最多积分\n"
                 "• /config message_points <数值> - 设置发言积分\n"
@@ -332,60 +638,123 @@ class TelegramBot:
                 "• /config expire_days <数值> - 设置积分过期天数（0为永不过期）\n"
                 "• /config cooldown_hours <数值> - 设置积分为0时发言冷却时间（小时）"
             )
-            await update.message.reply_text(config_text)
+            self.outbound.reply_text(update.message, config_text)
             return
 
         if len(args) >= 2:
             config_key = args[0]
             try:
                 config_value = int(args[1])
-
-                if Config.update_config(config_key, config_value):
-                    await update.message.reply_text(
-                        f"✅ 配置更新成功\n"
-                        f"🔧 {config_key}: {config_value}"
-                    )
-                    logger.info(f"管理员 {user.id} 更新配置: {config_key} = {config_value}")
-                else:
-                    await update.message.reply_text(
-                        f"❌ 无效的配置项: {config_key}\n"
-                        f"💡 使用 /config 查看可用配置项"
-                    )
             except ValueError:
-                await update.message.reply_text("❌ 配置值必须是数字")
+                self.outbound.reply_text(update.message, "❌ 配置值必须是数字")
+                return
+
+            if config_key not in TUNABLES:
+                self.outbound.reply_text(
+                    update.message,
+                    f"❌ 无效的配置项: {config_key}\n"
+                    f"💡 使用 /config 查看可用配置项"
+                )
+                return
+
+            try:
+                snapshot = await self.adb.update_config({config_key: config_value})
+            except ValueError as e:
+                self.outbound.reply_text(update.message, f"❌ 配置值无效：{e}")
+                return
+
+            self.outbound.reply_text(
+                update.message,
+                f"✅ 配置更新成功\n"
+                f"🔧 {config_key}: {config_value}\n"
+                f"🔖 配置版本：v{snapshot.version}"
+            )
+            logger.info(f"管理员 {user.id} 更新配置: {config_key} = {config_value}（v{snapshot.version}）")
         else:
-            await update.message.reply_text("❌ 参数不足，使用 /config 查看帮助")
+            self.outbound.reply_text(update.message, "❌ 参数不足，使用 /config 查看帮助")
+
+    async def _post_init(self, application):
+        """事件循环启动后开始处理自动解禁"""
+        self.moderation.start(asyncio.get_running_loop())
+
+    async def _post_shutdown(self, application):
+        """机器人停止后释放资源"""
+        self.moderation.stop()
+        await self.outbound.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.adb.close()
+        self.db.close()
 
     async def cleanup_expired_points_job(self, context):
         """定期清理过期积分的任务"""
         try:
-            cleaned_count = self.db.cleanup_expired_points()
+            cleaned_count = await self.adb.cleanup_expired_points()
             if cleaned_count > 0:
                 logger.info(f"定期清理完成，处理了 {cleaned_count} 个用户的过期积分")
         except Exception as e:
             logger.error(f"定期清理过期积分失败: {e}")
+
+    async def compact_ledger_job(self, context):
+        """定期压缩过期流水的任务"""
+        try:
+            await self.adb.compact_ledger()
+        except Exception as e:
+            logger.error(f"积分流水压缩失败: {e}")
     
     def run(self):
         """运行机器人"""
         logger.info("机器人启动中...")
-        logger.info(f"签到群ID: {Config.CHECKIN_GROUP_ID}")
-        logger.info(f"搜索群ID: {Config.SEARCH_GROUP_ID}")
+        for pair in self.db.groups.pairs():
+            logger.info(f"群组组合 {pair.name or ''}: 签到群 {pair.checkin_group_id}，搜索群 {pair.search_group_id}")
         logger.info(f"签到积分: {Config.CHECKIN_POINTS_MIN}-{Config.CHECKIN_POINTS_MAX}")
         logger.info(f"搜索群发言消耗: {Config.SEARCH_MESSAGE_COST} 积分")
         logger.info(f"积分过期天数: {Config.POINTS_EXPIRE_DAYS} ({'永不过期' if Config.POINTS_EXPIRE_DAYS == 0 else '天'})")
         
         # 添加定期清理过期积分的任务（每天凌晨2点执行）
-        if Config.POINTS_EXPIRE_DAYS > 0:
-            job_queue = self.application.job_queue
+        # 过期天数可在运行时修改，任务始终注册，未开启过期时直接返回
+        job_queue = self.application.job_queue
+        job_queue.run_daily(
+            self.cleanup_expired_points_job,
+            time=datetime.time(2, 0),  # 每天凌晨2点
+            name="cleanup_expired_points"
+        )
+        logger.info("已启动积分过期清理定时任务（每天凌晨2点执行）")
+
+        # 流水压缩在过期清理之后执行（每天凌晨3点）
+        if Config.LEDGER_RETENTION_DAYS > 0:
             job_queue.run_daily(
-                self.cleanup_expired_points_job,
-                time=datetime.time(2, 0),  # 每天凌晨2点
-                name="cleanup_expired_points"
+                self.compact_ledger_job,
+                time=datetime.time(3, 0),
+                name="compact_ledger"
             )
-            logger.info("已启动积分过期清理定时任务（每天凌晨2点执行）")
+            logger.info(f"已启动积分流水压缩定时任务（保留 {Config.LEDGER_RETENTION_DAYS} 天，每天凌晨3点执行）")
+        
+        # 启动监控指标服务
+        if Config.METRICS_PORT > 0:
+            self.metrics_server = MetricsServer(Config.METRICS_HOST, Config.METRICS_PORT)
+            self.metrics_server.start()
         
         # 运行机器人
-        self.application.run_polling(drop_pending_updates=True)
+        if Config.BOT_MODE == 'webhook':
+            logger.info(f"Webhook 模式，监听 {Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}/{Config.WEBHOOK_PATH}")
+            self.application.run_webhook(**self.webhook_options())
+        else:
+            self.application.run_polling(drop_pending_updates=True)
+    
+    def webhook_options(self, **overrides) -> dict:
+        """run_webhook / Updater.start_webhook 的参数，overrides 可覆盖监听地址等"""
+        options = {
+            'listen': Config.WEBHOOK_LISTEN,
+            'port': Config.WEBHOOK_PORT,
+            'url_path': Config.WEBHOOK_PATH,
+            'webhook_url': Config.WEBHOOK_URL or None,
+            'secret_token': Config.WEBHOOK_SECRET_TOKEN or None,
+            'max_connections': Config.WEBHOOK_MAX_CONNECTIONS,
+            'drop_pending_updates': True,
+        }
+        options.update(overrides)
+        return options
 
 def main():
     """主函数"""
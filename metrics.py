@@ -0,0 +1,301 @@
+import time
+import bisect
+import logging
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Tuple = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """只增计数器"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def values(self) -> Dict[Tuple, float]:
+        """全部标签组合的当前值"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+class Gauge:
+    """取值时调用回调函数的仪表"""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"读取指标 {self.name} 失败: {e}")
+            return
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} gauge'
+        yield f'{self.name} {_format_value(value)}'
+
+class Histogram:
+    """延迟直方图"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label_values -> [各桶计数..., 总和, 总数]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def count(self, *label_values) -> int:
+        with self._lock:
+            entry = self._values.get(label_values)
+            return entry[-1] if entry else 0
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((key, list(value)) for key, value in self._values.items())
+        for label_values, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, (('le', _format_value(float(bound))),))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(entry[-2])}'
+            yield f'{self.name}_count{labels} {entry[-1]}'
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    'bot_handler_duration_seconds', '更新处理器耗时', ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', '更新处理器抛出的异常次数', ('handler',)))
+DB_LATENCY = REGISTRY.register(Histogram(
+    'bot_db_duration_seconds', '数据库方法耗时（计数即调用次数）', ('method',)))
+DB_ERRORS = REGISTRY.register(Counter(
+    'bot_db_errors_total', '数据库方法抛出的异常次数', ('method',)))
+API_LATENCY = REGISTRY.register(Histogram(
+    'bot_api_request_duration_seconds', 'Bot API 请求耗时', ('method',)))
+API_REQUESTS = REGISTRY.register(Counter(
+    'bot_api_requests_total', 'Bot API 请求次数', ('method', 'status')))
+API_ERRORS = REGISTRY.register(Counter(
+    'bot_api_errors_total', 'Bot API 请求失败次数（网络异常或非 200 响应）', ('method',)))
+OUTBOUND_REQUESTS = REGISTRY.register(Counter(
+    'bot_outbound_requests_total', '出站调度器发出的请求次数', ('method', 'status')))
+OUTBOUND_RETRIES = REGISTRY.register(Counter(
+    'bot_outbound_retries_total', '出站请求重试次数（429 或网络错误）', ('method',)))
+OUTBOUND_COALESCED = REGISTRY.register(Counter(
+    'bot_outbound_coalesced_total', '被合并的重复出站请求次数', ('method',)))
+OUTBOUND_FAILED = REGISTRY.register(Counter(
+    'bot_outbound_failed_total', '最终失败的出站请求次数（不可重试的错误或重试次数用尽）', ('method',)))
+OUTBOUND_DROPPED = REGISTRY.register(Counter(
+    'bot_outbound_dropped_total', '未发出即丢弃的出站请求次数（queue_full/expired/shutdown）', ('method', 'reason')))
+MODERATION_ACTIONS = REGISTRY.register(Counter(
+    'bot_moderation_actions_total', '禁言操作次数（restrict/lift/auto_lift/skipped）', ('action',)))
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]):
+    """注册回调式仪表"""
+    return REGISTRY.register(Gauge(name, documentation, callback))
+
+# 当前线程正在执行的 track_db 调用层数
+_db_call_depth = threading.local()
+
+def track_db(func):
+    """记录数据库方法的调用次数和耗时
+
+    只记录最外层的调用：被其他已记录方法调用时（如 cleanup_expired_points 内的 flush）
+    耗时已计入外层方法，不再重复计数。
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_db_call_depth, 'value', 0)
+        if depth:
+            _db_call_depth.value = depth + 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _db_call_depth.value = depth
+        _db_call_depth.value = 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(name)
+            raise
+        finally:
+            _db_call_depth.value = 0
+            DB_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
+
+def track_handler(name: str, callback):
+    """包装更新处理回调，记录耗时和异常"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
+
+class InstrumentedRequest(BaseRequest):
+    """统计 Bot API 调用次数、耗时和错误的请求包装"""
+
+    def __init__(self, inner: BaseRequest):
+        self.inner = inner
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        endpoint = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            status, payload = await self.inner.do_request(
+                url, method, request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout
+            )
+        except Exception:
+            API_REQUESTS.inc(endpoint, 'exception')
+            API_ERRORS.inc(endpoint)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - start, endpoint)
+        API_REQUESTS.inc(endpoint, str(status))
+        if status != 200:
+            API_ERRORS.inc(endpoint)
+        return status, payload
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer:
+    """在后台线程中提供 /metrics 接口"""
+
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY):
+        handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"监控指标服务已启动: http://{self._server.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,311 @@
+import logging
+import sqlite3
+from datetime import date, timedelta
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 迁移列表：(版本号, 说明, 迁移函数)，版本号必须严格递增
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+def migration(version: int, description: str):
+    """注册一个数据库迁移"""
+    def decorator(func: Callable):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"迁移版本号必须递增: {version}")
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """读取数据库当前版本"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def column_exists(cursor, table: str, column: str) -> bool:
+    """检查表中是否已有指定列"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+def add_column(cursor, table: str, column: str, definition: str):
+    """为已有表添加列（列已存在时跳过）"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """依次执行尚未应用的迁移，每个迁移在独立事务中完成，返回最终版本"""
+    current = get_schema_version(conn)
+    for version, description, func in MIGRATIONS:
+        if version <= current:
+            continue
+
+        logger.info(f"执行数据库迁移 v{version}: {description}")
+        if conn.in_transaction:
+            conn.commit()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            func(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"数据库迁移 v{version} 失败，已回滚")
+            raise
+        current = version
+    return current
+
+@migration(1, "为过期清理、排名和排行榜查询添加索引")
+def _add_hot_path_indexes(cursor):
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_points_transactions_user_created
+        ON points_transactions (user_id, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_points_transactions_created
+        ON points_transactions (created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_total_points
+        ON users (total_points)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_message_records_date
+        ON message_records (message_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkin_records_date
+        ON checkin_records (checkin_date)
+    ''')
+
+@migration(2, "创建搜索群发言记录表")
+def _create_search_message_records(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_message_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            last_message_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE(user_id)
+        )
+    ''')
+
+@migration(3, "用户表增加连续签到天数和最后签到日期")
+def _add_checkin_streak(cursor):
+    add_column(cursor, 'users', 'checkin_streak', 'INTEGER DEFAULT 0')
+    add_column(cursor, 'users', 'last_checkin_date', 'TEXT')
+
+    # 根据已有签到记录回填每个用户截至最后一次签到的连续天数
+    cursor.execute('''
+        SELECT user_id, checkin_date FROM checkin_records
+        ORDER BY user_id, checkin_date DESC
+    ''')
+    streaks = {}
+    previous = {}
+    for user_id, checkin_date in cursor.fetchall():
+        day = date.fromisoformat(checkin_date)
+        if user_id not in streaks:
+            streaks[user_id] = [1, checkin_date, False]
+        elif not streaks[user_id][2] and previous[user_id] - day == timedelta(days=1):
+            streaks[user_id][0] += 1
+        else:
+            streaks[user_id][2] = True  # 连续记录已中断
+        previous[user_id] = day
+
+    cursor.executemany(
+        'UPDATE users SET checkin_streak = ?, last_checkin_date = ? WHERE user_id = ?',
+        [(streak, last_date, user_id) for user_id, (streak, last_date, _) in streaks.items()]
+    )
+
+@migration(4, "创建群组组合表（多组签到群/搜索群及各自的积分规则）")
+def _create_group_pairs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS group_pairs (
+            checkin_group_id INTEGER PRIMARY KEY,
+            search_group_id INTEGER NOT NULL UNIQUE,
+            name TEXT,
+            checkin_points_min INTEGER,
+            checkin_points_max INTEGER,
+            message_points INTEGER,
+            max_message_points_per_day INTEGER,
+            search_message_cost INTEGER,
+            enabled INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migration(5, "创建运行时配置表，配置变更时自动递增配置版本")
+def _create_runtime_config(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS runtime_config (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _create_config_version_triggers(cursor)
+
+def _create_config_version_triggers(cursor):
+    # 任何写入（包括直接用 SQL 修改）都会递增版本，运行中的机器人据此重新加载。
+    # 不能用 INSERT OR IGNORE：外层语句为 UPSERT 时，触发器内语句的冲突处理会被外层覆盖
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS runtime_config_version_{event.lower()}
+            AFTER {event} ON runtime_config
+            BEGIN
+                INSERT INTO system_state (key, value) VALUES ('config_version', '1')
+                ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;
+            END
+        ''')
+
+@migration(6, "创建积分流水按用户/日期/类型汇总表（用于流水压缩）")
+def _create_ledger_summary(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS points_ledger_summary (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            transaction_type TEXT NOT NULL,
+            credits INTEGER NOT NULL DEFAULT 0,
+            debits INTEGER NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, transaction_type)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_points_ledger_summary_day
+        ON points_ledger_summary (day)
+    ''')
+
+@migration(7, "创建按天汇总的活动统计表，写入原始记录时由触发器同步更新")
+def _create_daily_rollups(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_message_stats (
+            day TEXT NOT NULL,
+            group_id INTEGER NOT NULL,
+            sender_count INTEGER NOT NULL DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            points_earned INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, group_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_checkin_stats (
+            day TEXT PRIMARY KEY,
+            checkin_count INTEGER NOT NULL DEFAULT 0,
+            points_earned INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_points_stats (
+            day TEXT NOT NULL,
+            transaction_type TEXT NOT NULL,
+            credits INTEGER NOT NULL DEFAULT 0,
+            debits INTEGER NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, transaction_type)
+        )
+    ''')
+
+    # 用已有数据回填，已压缩的流水从汇总表回填。流水日期与触发器一致按本地时间计；
+    # 汇总表按 UTC 日期累计无法再拆分，取该 UTC 日正午换算为本地日期（即该日大部分流水所在的本地日期）
+    cursor.execute('''
+        INSERT OR REPLACE INTO daily_message_stats (day, group_id, sender_count, message_count, points_earned)
+        SELECT message_date, group_id, COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(points_earned), 0)
+        FROM message_records GROUP BY message_date, group_id
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO daily_checkin_stats (day, checkin_count, points_earned)
+        SELECT checkin_date, COUNT(*), COALESCE(SUM(points_earned), 0)
+        FROM checkin_records GROUP BY checkin_date
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO daily_points_stats (day, transaction_type, credits, debits, transaction_count)
+        SELECT day, transaction_type, SUM(credits), SUM(debits), SUM(transaction_count) FROM (
+            SELECT date(created_at, 'localtime') AS day, COALESCE(transaction_type, '') AS transaction_type,
+                   SUM(MAX(points_change, 0)) AS credits, SUM(MAX(-points_change, 0)) AS debits,
+                   COUNT(*) AS transaction_count
+            FROM points_transactions GROUP BY 1, 2
+            UNION ALL
+            SELECT date(day || ' 12:00:00', 'localtime'), transaction_type,
+                   SUM(credits), SUM(debits), SUM(transaction_count)
+            FROM points_ledger_summary GROUP BY 1, 2
+        ) GROUP BY day, transaction_type
+    ''')
+
+    # 发言记录按 (用户, 群, 日期) 一行：新行计为一个发言人，更新时累加增量
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS message_records_rollup_insert
+        AFTER INSERT ON message_records
+        BEGIN
+            INSERT OR IGNORE INTO daily_message_stats (day, group_id) VALUES (NEW.message_date, NEW.group_id);
+            UPDATE daily_message_stats SET
+                sender_count = sender_count + 1,
+                message_count = message_count + COALESCE(NEW.message_count, 0),
+                points_earned = points_earned + COALESCE(NEW.points_earned, 0)
+            WHERE day = NEW.message_date AND group_id = NEW.group_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS message_records_rollup_update
+        AFTER UPDATE OF message_count, points_earned ON message_records
+        BEGIN
+            UPDATE daily_message_stats SET
+                message_count = message_count + COALESCE(NEW.message_count, 0) - COALESCE(OLD.message_count, 0),
+                points_earned = points_earned + COALESCE(NEW.points_earned, 0) - COALESCE(OLD.points_earned, 0)
+            WHERE day = NEW.message_date AND group_id = NEW.group_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS checkin_records_rollup_insert
+        AFTER INSERT ON checkin_records
+        BEGIN
+            INSERT OR IGNORE INTO daily_checkin_stats (day) VALUES (NEW.checkin_date);
+            UPDATE daily_checkin_stats SET
+                checkin_count = checkin_count + 1,
+                points_earned = points_earned + COALESCE(NEW.points_earned, 0)
+            WHERE day = NEW.checkin_date;
+        END
+    ''')
+    # 流水压缩删除原始流水时不回退汇总，因此只监听插入
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS points_transactions_rollup_insert
+        AFTER INSERT ON points_transactions
+        BEGIN
+            INSERT OR IGNORE INTO daily_points_stats (day, transaction_type)
+            VALUES (date(NEW.created_at, 'localtime'), COALESCE(NEW.transaction_type, ''));
+            UPDATE daily_points_stats SET
+                credits = credits + MAX(NEW.points_change, 0),
+                debits = debits + MAX(-NEW.points_change, 0),
+                transaction_count = transaction_count + 1
+            WHERE day = date(NEW.created_at, 'localtime')
+            AND transaction_type = COALESCE(NEW.transaction_type, '');
+        END
+    ''')
+
+@migration(8, "创建禁言记录表")
+def _create_restrictions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS restrictions (
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            until TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, chat_id)
+        )
+    ''')
+
+@migration(9, "重建配置版本触发器（修复第二次修改配置时的唯一约束错误）")
+def _rebuild_config_version_triggers(cursor):
+    for event in ('insert', 'update', 'delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS runtime_config_version_{event}')
+    _create_config_version_triggers(cursor)
+
+@migration(10, "创建系统状态表（过期清理水位、配置版本等）")
+def _create_system_state(cursor):
+    # 早期版本在迁移之外创建，已有数据库中可能已存在
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
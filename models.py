@@ -1,6 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 @dataclass
 class User:
@@ -42,3 +42,79 @@ class PointsTransaction:
     transaction_type: str  # 'checkin', 'message', 'admin_adjust'
     description: str
     created_at: Optional[datetime] = None
+
+
+@dataclass
+class SystemStats:
+    """系统统计"""
+    total_users: int
+    spendable_users: int  # 积分足够在搜索群发言的用户数
+    total_points: int  # 流通中的积分总量
+    daily_active_users: int  # 今日签到或发言的用户数
+
+@dataclass
+class SearchChargeResult:
+    """搜索群发言扣费结果"""
+    allowed: bool  # 是否允许发言
+    charged: bool  # 是否扣除了积分（False 表示免费、积分不足按冷却规则处理或扣费出错）
+    balance: int  # 处理后的积分余额
+    cost: int = 0  # 本次发言的价格，0 表示免费；charged 为 False 时未扣除
+
+@dataclass
+class CheckinResult:
+    """签到结果"""
+    success: bool  # 是否签到成功（False 表示今天已签到或用户不存在）
+    points: int = 0  # 本次获得的积分（含连续签到奖励）
+    bonus: int = 0  # 连续签到奖励积分
+    streak: int = 0  # 连续签到天数
+    balance: int = 0  # 签到后的积分余额
+
+@dataclass
+class BulkPointsResult:
+    """批量调整积分结果"""
+    applied: int = 0  # 成功调整的用户数
+    created: int = 0  # 新建的用户数
+    total_points: int = 0  # 实际调整的积分合计
+    skipped: int = 0  # 因余额不足跳过的扣分用户数
+    failed: int = 0  # 因写入失败未处理的用户数（之前的批次已生效）
+
+@dataclass
+class GroupPair:
+    """签到群/搜索群组合及其积分规则，规则为 None 时使用全局配置"""
+    checkin_group_id: int
+    search_group_id: int
+    name: Optional[str] = None
+    checkin_points_min: Optional[int] = None
+    checkin_points_max: Optional[int] = None
+    message_points: Optional[int] = None
+    max_message_points_per_day: Optional[int] = None
+    search_message_cost: Optional[int] = None
+    enabled: bool = True
+
+@dataclass
+class LedgerCompactionResult:
+    """积分流水压缩结果"""
+    cutoff: str = ''  # 早于该时间的流水被压缩
+    rows: int = 0  # 归档并删除的流水条数
+    summaries: int = 0  # 写入或累加的汇总行数
+    archives: List[str] = field(default_factory=list)  # 写入的归档文件
+
+@dataclass
+class DailyActivity:
+    """单日活动汇总"""
+    day: str  # YYYY-MM-DD格式
+    messages: int = 0  # 发言条数
+    message_points: int = 0  # 发言获得的积分
+    checkins: int = 0  # 签到人数
+    checkin_points: int = 0  # 签到获得的积分
+    points_earned: int = 0  # 所有流水的积分收入
+    points_spent: int = 0  # 所有流水的积分支出（含过期）
+
+@dataclass
+class ActivityStats:
+    """时间段活动统计"""
+    start: str
+    end: str
+    days: List[DailyActivity] = field(default_factory=list)  # 按日期排列，包含没有活动的日期
+    group_messages: Dict[int, int] = field(default_factory=dict)  # 群ID -> 发言条数
+    points_by_type: Dict[str, tuple] = field(default_factory=dict)  # 流水类型 -> (收入, 支出)
@@ -0,0 +1,405 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from config import Config
+from metrics import OUTBOUND_REQUESTS, OUTBOUND_RETRIES, OUTBOUND_COALESCED, OUTBOUND_DROPPED, OUTBOUND_FAILED
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先发送
+PRIORITY_MODERATION = 0  # 禁言、解禁、删除消息
+PRIORITY_REPLY = 1       # 命令回复
+PRIORITY_NOTIFY = 2      # 私聊通知等可以延后的消息
+
+class TokenBucket:
+    """令牌桶限速器，rate 为每秒补充的令牌数，capacity 为最大突发数"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离下一个可用令牌的秒数，0 表示可以立即发送"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        """令牌已补满，可以丢弃"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class OutboundDropped(RuntimeError):
+    """请求未发出即被丢弃（会话队列已满、排队超时或调度器关闭）"""
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'chat_id', 'limited', 'call', 'future', 'key', 'attempts', 'method',
+                 'droppable', 'created', 'in_flight', 'follow_up')
+
+    def __init__(self, priority, seq, chat_id, limited, call, future, key, method, droppable=False):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.limited = limited
+        self.call = call
+        self.future = future
+        self.key = key
+        self.method = method
+        self.droppable = droppable
+        self.created = time.monotonic()
+        self.attempts = 0
+        self.in_flight = False
+        self.follow_up: Optional['_Job'] = None  # 执行中时提交的同键请求，当前请求结束后再执行
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+def _log_failure(future: asyncio.Future):
+    """不等待结果的请求在失败时记录日志（同时避免未取回异常的警告）"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if isinstance(error, OutboundDropped):
+        logger.debug(f"出站消息已丢弃: {error}")
+    elif error is not None:
+        logger.warning(f"出站消息发送失败: {error}")
+
+def _copy_outcome(target: asyncio.Future):
+    """返回把源 Future 的结果复制到 target 的回调"""
+    def callback(source: asyncio.Future):
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+    return callback
+
+class OutboundScheduler:
+    """Bot API 出站请求调度器
+
+    所有请求按优先级排队，由后台任务按全局速率和每个会话的发消息速率发出：
+    禁言/删除等管理操作优先于普通回复；遇到 429 时暂停该会话 retry_after 秒后重试，
+    网络错误按指数退避重试；同类请求（如对同一用户的多次禁言）在最终完成前合并为一次，
+    以最后一次的参数为准，正在执行时提交的同类请求在其完成后再执行，不会乱序。
+
+    回复和通知可以丢弃：每个会话最多排队 chat_queue_limit 条，超出时丢弃最早的一条；
+    排队超过 message_ttl 秒仍发不出的直接丢弃，限速下队列不会无限增长。
+    """
+
+    def __init__(self, bot, global_rate: float = None, private_rate: float = None,
+                 group_rate_per_minute: float = None, chat_burst: int = None,
+                 max_retries: int = None, max_in_flight: int = None,
+                 chat_queue_limit: int = None, message_ttl: float = None):
+        self.bot = bot
+        self.global_rate = global_rate or Config.OUTBOUND_GLOBAL_RATE
+        self.private_rate = private_rate or Config.OUTBOUND_PRIVATE_CHAT_RATE
+        self.group_rate = (group_rate_per_minute or Config.OUTBOUND_GROUP_RATE_PER_MINUTE) / 60
+        self.chat_burst = chat_burst or Config.OUTBOUND_CHAT_BURST
+        self.max_retries = Config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self.max_in_flight = max_in_flight or Config.OUTBOUND_MAX_IN_FLIGHT
+        self.chat_queue_limit = chat_queue_limit or Config.OUTBOUND_CHAT_QUEUE_LIMIT
+        self.message_ttl = message_ttl or Config.OUTBOUND_MESSAGE_TTL
+
+        self._global = TokenBucket(self.global_rate, max(1.0, self.global_rate))
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._blocked_until: Dict[int, float] = {}  # 收到 429 的会话 -> 恢复时间
+        self._ready = []    # 可以发送的请求（按优先级）
+        self._delayed = []  # (可发送时间, 请求)
+        self._pending: Dict[Hashable, _Job] = {}  # 合并键 -> 尚未最终完成的请求
+        self._chat_queues: Dict[int, Dict[int, _Job]] = {}  # 会话 -> 排队中可丢弃的请求（按提交顺序）
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        queued = sum(1 for job in self._ready if not job.future.done())
+        queued += sum(1 for _, job in self._delayed if not job.future.done())
+        return queued + self._in_flight
+
+    def _ensure_started(self):
+        if self._dispatcher is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch(), name='outbound-scheduler')
+
+    def submit(self, call: Callable[[], Awaitable[Any]], chat_id: Optional[int] = None,
+               priority: int = PRIORITY_REPLY, limited: bool = True, key: Hashable = None,
+               method: str = 'request', droppable: bool = False) -> asyncio.Future:
+        """提交一个请求，返回其结果的 Future
+
+        call 每次调用都返回新的协程（重试时会再次调用）；limited 为 True 时
+        受会话发消息速率限制；key 相同且尚未完成的请求会被合并；droppable 为 True 时
+        会话队列满或排队超时会被丢弃，Future 以 OutboundDropped 结束。
+        """
+        self._ensure_started()
+        if key is not None:
+            job = self._pending.get(key)
+            if job is not None:
+                if job.in_flight:
+                    # 正在执行的请求不能再改参数，新请求排在它之后
+                    if job.follow_up is None:
+                        job.follow_up = self._new_job(priority, chat_id, limited, call, key, method, droppable)
+                        return job.follow_up.future
+                    job = job.follow_up
+                job.call = call
+                OUTBOUND_COALESCED.inc(method)
+                return job.future
+
+        job = self._new_job(priority, chat_id, limited, call, key, method, droppable)
+        if key is not None:
+            self._pending[key] = job
+        self._enqueue(job)
+        return job.future
+
+    def _new_job(self, priority, chat_id, limited, call, key, method, droppable) -> _Job:
+        return _Job(priority, next(self._seq), chat_id, limited, call,
+                    asyncio.get_running_loop().create_future(), key, method,
+                    droppable=droppable and chat_id is not None)
+
+    def _enqueue(self, job: _Job):
+        if job.droppable:
+            queue = self._chat_queues.setdefault(job.chat_id, {})
+            if len(queue) >= self.chat_queue_limit:
+                self._drop(queue[next(iter(queue))], 'queue_full')
+            queue[job.seq] = job
+        heapq.heappush(self._ready, job)
+        self._idle.clear()
+        self._wakeup.set()
+
+    def _dequeue(self, job: _Job):
+        """从会话队列中移除（已发出或已丢弃）"""
+        if not job.droppable:
+            return
+        queue = self._chat_queues.get(job.chat_id)
+        if queue is not None and queue.pop(job.seq, None) is not None and not queue:
+            del self._chat_queues[job.chat_id]
+
+    def _drop(self, job: _Job, reason: str):
+        """丢弃未发出的请求；仍在堆中的请求在取出时跳过"""
+        self._dequeue(job)
+        OUTBOUND_DROPPED.inc(job.method, reason)
+        self._fail(job, OutboundDropped(f"{job.method} 未发出即丢弃（{reason}）"))
+
+    def reply_text(self, message, text: str, **kwargs) -> asyncio.Future:
+        """回复消息：只入队不等待，返回发送结果的 Future，失败时记录日志
+
+        处理器不应等待回复发出（会话限速下可能要等数十秒，期间一直占用并发名额），
+        只有确实需要发出的 Message 时才 await 返回值。
+        """
+        return self._background(self.submit(lambda: message.reply_text(text, **kwargs), message.chat_id,
+                                            PRIORITY_REPLY, method='sendMessage', droppable=True))
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_NOTIFY, **kwargs) -> asyncio.Future:
+        """发送消息：只入队不等待，同 reply_text（管理优先级的消息不会被丢弃）"""
+        return self._background(self.submit(lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs),
+                                            chat_id, priority, method='sendMessage',
+                                            droppable=priority != PRIORITY_MODERATION))
+
+    @staticmethod
+    def _background(future: asyncio.Future) -> asyncio.Future:
+        future.add_done_callback(_log_failure)
+        return future
+
+    async def send_document(self, chat_id: int, document, priority: int = PRIORITY_NOTIFY, **kwargs):
+        """发送文件，document 为本地路径时每次重试都重新读取"""
+        return await self.submit(lambda: self.bot.send_document(chat_id=chat_id, document=document, **kwargs),
+                                 chat_id, priority, method='sendDocument')
+
+    async def restrict_chat_member(self, chat_id: int, user_id: int, permissions, **kwargs):
+        """禁言或解禁用户，排队中的同一用户的操作只执行最后一次"""
+        return await self.submit(
+            lambda: self.bot.restrict_chat_member(chat_id=chat_id, user_id=user_id,
+                                                  permissions=permissions, **kwargs),
+            chat_id, PRIORITY_MODERATION, limited=False,
+            key=('restrictChatMember', chat_id, user_id), method='restrictChatMember'
+        )
+
+    async def delete_message(self, chat_id: int, message_id: int):
+        """删除消息"""
+        return await self.submit(
+            lambda: self.bot.delete_message(chat_id=chat_id, message_id=message_id),
+            chat_id, PRIORITY_MODERATION, limited=False,
+            key=('deleteMessage', chat_id, message_id), method='deleteMessage'
+        )
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10000:
+                now = time.monotonic()
+                for idle_chat in [c for c, b in self._chat_buckets.items() if b.is_idle(now)]:
+                    del self._chat_buckets[idle_chat]
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _chat_delay(self, job: _Job, now: float) -> float:
+        if job.chat_id is None:
+            return 0.0
+        delay = self._blocked_until.get(job.chat_id, 0) - now
+        if delay <= 0:
+            self._blocked_until.pop(job.chat_id, None)
+            delay = 0.0
+        if job.limited:
+            delay = max(delay, self._chat_bucket(job.chat_id).delay(now))
+        return delay
+
+    def _promote(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            heapq.heappush(self._ready, heapq.heappop(self._delayed)[1])
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            self._promote(now)
+            if not self._ready:
+                if not self._delayed and not self._in_flight:
+                    self._idle.set()
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job = heapq.heappop(self._ready)
+            if job.future.done():
+                # 已被丢弃
+                continue
+            delay = self._chat_delay(job, now)
+            if job.droppable and now + delay - job.created > self.message_ttl:
+                self._drop(job, 'expired')
+                continue
+            if delay > 0:
+                heapq.heappush(self._delayed, (now + delay, job))
+                continue
+            delay = self._global.delay(now)
+            if delay > 0:
+                heapq.heappush(self._ready, job)
+                await asyncio.sleep(delay)
+                continue
+
+            await self._slots.acquire()
+            now = time.monotonic()
+            self._global.consume(now)
+            if job.limited and job.chat_id is not None:
+                self._chat_bucket(job.chat_id).consume(now)
+            self._dequeue(job)
+            job.in_flight = True
+            self._in_flight += 1
+            asyncio.create_task(self._execute(job))
+
+    async def _execute(self, job: _Job):
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            OUTBOUND_REQUESTS.inc(job.method, 'retry_after')
+            retry_after = float(e.retry_after)
+            if job.chat_id is not None:
+                self._blocked_until[job.chat_id] = time.monotonic() + retry_after
+            self._retry(job, e, retry_after)
+        except NetworkError as e:
+            if isinstance(e, BadRequest):
+                OUTBOUND_REQUESTS.inc(job.method, 'error')
+                self._finish(job, error=e)
+            else:
+                OUTBOUND_REQUESTS.inc(job.method, 'network_error')
+                backoff = min(30.0, 2 ** job.attempts) * (0.5 + random.random())
+                self._retry(job, e, backoff)
+        except Exception as e:
+            OUTBOUND_REQUESTS.inc(job.method, 'error')
+            self._finish(job, error=e)
+        else:
+            OUTBOUND_REQUESTS.inc(job.method, 'ok')
+            self._finish(job, result=result)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+            self._wakeup.set()
+
+    def _retry(self, job: _Job, error: Exception, delay: float):
+        job.in_flight = False
+        if job.attempts >= self.max_retries:
+            logger.warning(f"出站请求 {job.method} 重试 {job.attempts} 次后仍失败: {error}")
+            self._finish(job, error=error)
+            return
+        follow_up = job.follow_up
+        if follow_up is not None:
+            # 执行期间已提交了同键的新请求：重试时直接执行新请求，旧参数作废
+            job.follow_up = None
+            job.call = follow_up.call
+            job.future.add_done_callback(_copy_outcome(follow_up.future))
+            OUTBOUND_COALESCED.inc(job.method)
+        job.attempts += 1
+        OUTBOUND_RETRIES.inc(job.method)
+        heapq.heappush(self._delayed, (time.monotonic() + delay, job))
+
+    def _finish(self, job: _Job, result: Any = None, error: Exception = None):
+        """请求最终完成：设置结果，释放合并键或开始执行排在其后的同键请求"""
+        job.in_flight = False
+        if error is not None:
+            OUTBOUND_FAILED.inc(job.method)
+            self._fail(job, error)
+        elif not job.future.done():
+            job.future.set_result(result)
+        if job.key is not None and self._pending.get(job.key) is job:
+            if job.follow_up is not None:
+                self._pending[job.key] = job.follow_up
+                self._enqueue(job.follow_up)
+            else:
+                del self._pending[job.key]
+        job.follow_up = None
+
+    @staticmethod
+    def _fail(job: _Job, error: Exception):
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    async def stop(self, timeout: float = 10.0):
+        """等待排队的请求发送完毕（最多 timeout 秒）后停止调度"""
+        if self._dispatcher is None:
+            return
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"出站队列关闭时仍有 {len(self)} 个请求未发送")
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        leftover = [job for _, job in self._delayed] + self._ready
+        leftover += [job.follow_up for job in self._pending.values() if job.follow_up is not None]
+        for job in leftover:
+            if not job.future.done():
+                self._drop(job, 'shutdown')
+        self._ready.clear()
+        self._delayed.clear()
+        self._pending.clear()
+        self._chat_queues.clear()
@@ -0,0 +1,93 @@
+import io
+import csv
+import json
+import logging
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+USER_ID_COLUMNS = ('user_id', 'userid', 'id', '用户id')
+POINTS_COLUMNS = ('points', 'point', '积分')
+
+class PointsFileError(ValueError):
+    """积分文件格式错误"""
+
+def _iter_csv(text: str) -> Iterator[Tuple[int, object, object]]:
+    """逐行读取 CSV，返回 (行号, 用户ID, 积分)，首行不是数字时视为表头"""
+    reader = csv.reader(io.StringIO(text))
+    user_col, points_col = 0, 1
+    for line_no, row in enumerate(reader, 1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if line_no == 1 and not row[0].strip().lstrip('-').isdigit():
+            header = [cell.strip().lower() for cell in row]
+            try:
+                user_col = next(i for i, name in enumerate(header) if name in USER_ID_COLUMNS)
+                points_col = next(i for i, name in enumerate(header) if name in POINTS_COLUMNS)
+            except StopIteration:
+                raise PointsFileError("CSV 表头需要包含 user_id 和 points 列")
+            continue
+        if len(row) <= max(user_col, points_col):
+            yield line_no, None, None
+            continue
+        yield line_no, row[user_col].strip(), row[points_col].strip()
+
+def _iter_json(text: str) -> Iterator[Tuple[int, object, object]]:
+    """读取 JSON：[{"user_id": 1, "points": 10}, ...]、[[1, 10], ...] 或 {"1": 10, ...}"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise PointsFileError(f"JSON 解析失败: {e}")
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = []
+        for item in data:
+            if isinstance(item, dict):
+                items.append((
+                    next((item[key] for key in USER_ID_COLUMNS if key in item), None),
+                    next((item[key] for key in POINTS_COLUMNS if key in item), None)
+                ))
+            elif isinstance(item, (list, tuple)) and len(item) >= 2:
+                items.append((item[0], item[1]))
+            else:
+                items.append((None, None))
+    else:
+        raise PointsFileError("JSON 必须是数组或对象")
+    for index, (user_id, points) in enumerate(items, 1):
+        yield index, user_id, points
+
+def parse_points_file(data: bytes, filename: str = '', max_rows: int = 0) -> Tuple[Dict[int, int], int, List[str]]:
+    """解析批量积分文件（CSV 或 JSON）
+
+    返回 (用户ID -> 积分合计, 有效行数, 错误列表)，同一用户的多行积分会合并。
+    """
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise PointsFileError("文件必须是 UTF-8 编码")
+
+    stripped = text.lstrip()
+    if filename.lower().endswith('.json') or stripped[:1] in ('[', '{'):
+        rows = _iter_json(text)
+    else:
+        rows = _iter_csv(text)
+
+    totals: Dict[int, int] = {}
+    count = 0
+    errors: List[str] = []
+    for line_no, user_id, points in rows:
+        try:
+            user_id = int(user_id)
+            points = int(points)
+        except (TypeError, ValueError):
+            errors.append(f"第 {line_no} 行格式错误")
+            continue
+        if user_id <= 0 or points == 0:
+            errors.append(f"第 {line_no} 行用户ID或积分无效")
+            continue
+        count += 1
+        if max_rows and count > max_rows:
+            raise PointsFileError(f"行数超过上限 {max_rows}")
+        totals[user_id] = totals.get(user_id, 0) + points
+    return totals, count, errors
@@ -0,0 +1,210 @@
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        # width[i] 为沿第 i 层指针前进一步跨过的元素个数
+        self.width = [1] * level
+
+class RankIndex:
+    """积分排行索引（可索引跳表）
+
+    按 (积分降序, 用户ID升序) 排列所有用户，插入、删除、排名查询和按位置取值
+    均为 O(log n)，同时维护积分总量。非线程安全，由调用方加锁。
+    查找只遍历已使用的层数，层数随用户数增长；启动时用 build 从有序数据线性构建。
+    """
+
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._level = 1  # 已使用的层数
+        self._points: Dict[int, int] = {}
+        self.total_points = 0
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, int]]) -> 'RankIndex':
+        """从按 (积分降序, 用户ID升序) 排好的 (用户ID, 积分) 线性构建索引
+
+        第 i 个元素（从1开始）的层数为 i 的二进制末尾 0 的个数 + 1，
+        得到的跳表层次均匀，构建结果与数据一一对应。顺序不对时抛出 ValueError。
+        """
+        index = cls()
+        head = index._head
+        last = [head] * cls.MAX_LEVEL
+        last_position = [0] * cls.MAX_LEVEL
+        previous_key = None
+        position = 0
+        for user_id, points in rows:
+            key = cls._key(user_id, points)
+            if previous_key is not None and not previous_key < key:
+                raise ValueError(f"排行数据未按积分降序、用户ID升序排列: {key}")
+            previous_key = key
+            position += 1
+            height = min(cls.MAX_LEVEL, (position & -position).bit_length())
+            node = _Node(key, height)
+            for level in range(height):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+            index._level = max(index._level, height)
+            index._points[user_id] = points
+            index.total_points += points
+
+        for level in range(cls.MAX_LEVEL):
+            last[level].width[level] = position + 1 - last_position[level]
+        return index
+
+    @staticmethod
+    def _key(user_id: int, points: int) -> Tuple[int, int]:
+        return (-points, user_id)
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _insert(self, key, size: int):
+        """插入 key，size 为插入前的元素个数"""
+        height = self._random_level()
+        if height > self._level:
+            # 启用新的层：头节点在这些层上直接指向末尾，跨过全部元素
+            for level in range(self._level, height):
+                self._head.next[level] = None
+                self._head.width[level] = size + 1
+            self._level = height
+
+        chain = [None] * self._level
+        steps_at_level = [0] * self._level
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new_node = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self._level):
+            chain[level].width[level] += 1
+
+    def _remove(self, key):
+        chain = [None] * self._level
+        node = self._head
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self._level):
+            chain[level].width[level] -= 1
+
+    def _count_less(self, key) -> int:
+        """统计排在 key 之前的元素个数"""
+        node = self._head
+        position = 0
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def _node_at(self, index: int) -> _Node:
+        """按位置（从0开始）获取节点"""
+        if not 0 <= index < len(self._points):
+            raise IndexError(index)
+        node = self._head
+        index += 1
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def update(self, user_id: int, points: int):
+        """设置用户积分"""
+        old_points = self._points.get(user_id)
+        if old_points == points:
+            return
+        if old_points is not None:
+            self._remove(self._key(user_id, old_points))
+            self.total_points -= old_points
+        self._insert(self._key(user_id, points), len(self._points) - (old_points is not None))
+        self._points[user_id] = points
+        self.total_points += points
+
+    def remove(self, user_id: int):
+        """移除用户"""
+        old_points = self._points.pop(user_id, None)
+        if old_points is not None:
+            self._remove(self._key(user_id, old_points))
+            self.total_points -= old_points
+
+    def get_points(self, user_id: int) -> Optional[int]:
+        return self._points.get(user_id)
+
+    def count_above(self, points: int) -> int:
+        """积分严格高于 points 的用户数"""
+        return self._count_less((-points, float('-inf')))
+
+    def count_at_least(self, points: int) -> int:
+        """积分不低于 points 的用户数"""
+        return self._count_less((-points, float('inf')))
+
+    def rank(self, user_id: int) -> int:
+        """用户排名（同分并列），不存在的用户按0分计算"""
+        return self.count_above(self._points.get(user_id, 0)) + 1
+
+    def position(self, user_id: int) -> int:
+        """用户在排行中的位置（从0开始，同分按用户ID排序）"""
+        return self._count_less(self._key(user_id, self._points[user_id]))
+
+    def slice(self, start: int, stop: int) -> List[Tuple[int, int]]:
+        """按位置取出 [start, stop) 区间内的 (用户ID, 积分)"""
+        start = max(0, start)
+        stop = min(stop, len(self._points))
+        result = []
+        if start >= stop:
+            return result
+        node = self._node_at(start)
+        while node is not None and len(result) < stop - start:
+            result.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return result
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """积分最高的 limit 个用户"""
+        return self.slice(0, limit)
+
+    def around(self, user_id: int, radius: int) -> List[Tuple[int, int]]:
+        """用户前后各 radius 名的用户（含自己）"""
+        if user_id not in self._points:
+            return []
+        index = self.position(user_id)
+        return self.slice(index - radius, index + radius + 1)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._points
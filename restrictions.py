@@ -0,0 +1,158 @@
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from telegram import ChatPermissions
+from config import Config
+from metrics import MODERATION_ACTIONS
+from outbound import PRIORITY_NOTIFY
+
+logger = logging.getLogger(__name__)
+
+# 禁言：只禁止发消息
+RESTRICTED_PERMISSIONS = ChatPermissions(can_send_messages=False)
+
+# 解禁：恢复普通成员的发言权限
+UNRESTRICTED_PERMISSIONS = ChatPermissions(
+    can_send_messages=True,
+    can_send_audios=True,
+    can_send_documents=True,
+    can_send_photos=True,
+    can_send_videos=True,
+    can_send_video_notes=True,
+    can_send_voice_notes=True,
+    can_send_polls=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True,
+    can_change_info=False,
+    can_invite_users=True,
+    can_pin_messages=False
+)
+
+class RestrictionIndex:
+    """当前禁言状态的内存索引
+
+    记录 (用户, 会话) -> 解禁时间（UNIX 时间戳），判断是否已禁言无需查询数据库；
+    另按用户索引被禁言的会话，积分变动时可以快速判断是否需要自动解禁。
+    已过期的记录在查询时清理。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until: Dict[Tuple[int, int], float] = {}
+        self._by_user: Dict[int, Set[int]] = {}
+
+    def load(self, entries: Iterable[Tuple[int, int, float]]):
+        """从数据库加载 (用户, 会话, 解禁时间) 记录"""
+        for user_id, chat_id, until in entries:
+            self.set(user_id, chat_id, until)
+
+    def set(self, user_id: int, chat_id: int, until: float):
+        with self._lock:
+            self._until[(user_id, chat_id)] = until
+            self._by_user.setdefault(user_id, set()).add(chat_id)
+
+    def remove(self, user_id: int, chat_id: int) -> bool:
+        """删除记录，返回记录是否存在（并发调用时只有一个返回 True）"""
+        with self._lock:
+            return self._remove(user_id, chat_id)
+
+    def _remove(self, user_id: int, chat_id: int) -> bool:
+        if self._until.pop((user_id, chat_id), None) is None:
+            return False
+        chats = self._by_user.get(user_id)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self._by_user[user_id]
+        return True
+
+    def until(self, user_id: int, chat_id: int) -> Optional[float]:
+        """禁言中返回解禁时间，否则返回 None"""
+        with self._lock:
+            until = self._until.get((user_id, chat_id))
+            if until is not None and until <= time.time():
+                self._remove(user_id, chat_id)
+                return None
+            return until
+
+    def chats(self, user_id: int) -> List[int]:
+        """用户当前被禁言的会话"""
+        with self._lock:
+            chats = self._by_user.get(user_id)
+            if not chats:
+                return []
+            now = time.time()
+            for chat_id in [c for c in chats if self._until[(user_id, c)] <= now]:
+                self._remove(user_id, chat_id)
+            return list(self._by_user.get(user_id, ()))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._until)
+
+class Moderation:
+    """禁言和解禁，所有操作经过禁言记录
+
+    已在禁言中的用户不再重复调用 restrictChatMember；用户积分恢复到足够在搜索群
+    发言时，Database 在积分变动提交后通过 schedule_lift 提前自动解禁。
+    处理器可通过 context.bot_data['moderation'] 使用。
+    """
+
+    def __init__(self, adb, outbound):
+        self.adb = adb
+        self.outbound = outbound
+        self.index: RestrictionIndex = adb.db.restrictions
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """绑定事件循环并开始接收自动解禁通知"""
+        self._loop = loop
+        self.adb.db.on_restriction_lift = self.schedule_lift
+
+    def stop(self):
+        self.adb.db.on_restriction_lift = None
+        self._loop = None
+
+    async def restrict(self, chat_id: int, user_id: int, hours: float = None) -> bool:
+        """禁言用户 hours 小时（默认 BAN_DURATION_HOURS），已在禁言中时跳过，返回是否发出了请求"""
+        if self.index.until(user_id, chat_id) is not None:
+            MODERATION_ACTIONS.inc('skipped')
+            return False
+
+        until = datetime.now(timezone.utc) + timedelta(hours=hours or Config.BAN_DURATION_HOURS)
+        # 先记录再调用接口：期间积分恢复触发的解禁会与排队中的禁言合并，以解禁为准
+        await self.adb.record_restriction(user_id, chat_id, until)
+        try:
+            await self.outbound.restrict_chat_member(chat_id, user_id, RESTRICTED_PERMISSIONS, until_date=until)
+        except Exception:
+            await self.adb.clear_restriction(user_id, chat_id)
+            raise
+        MODERATION_ACTIONS.inc('restrict')
+        return True
+
+    async def lift(self, chat_id: int, user_id: int):
+        """解除禁言（无论记录中是否在禁言，都会调用接口）"""
+        # 先删除记录：接口调用失败时最多多禁言到原定的解禁时间，不会出现记录已解禁但跳过禁言
+        await self.adb.clear_restriction(user_id, chat_id)
+        await self.outbound.restrict_chat_member(chat_id, user_id, UNRESTRICTED_PERMISSIONS)
+        MODERATION_ACTIONS.inc('lift')
+
+    def schedule_lift(self, user_id: int, chat_id: int):
+        """积分恢复时由 Database 调用（可能在数据库线程中），提交自动解禁任务"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._auto_lift(chat_id, user_id), loop)
+
+    async def _auto_lift(self, chat_id: int, user_id: int):
+        try:
+            await self.lift(chat_id, user_id)
+        except Exception as e:
+            logger.warning(f"自动解除用户 {user_id} 在 {chat_id} 的禁言失败: {e}")
+            return
+        MODERATION_ACTIONS.inc('auto_lift')
+        logger.info(f"用户 {user_id} 积分已恢复，自动解除在 {chat_id} 的禁言")
+        self.outbound.send_message(user_id, "🎉 您的积分已足够在搜索群发言，禁言已自动解除！", PRIORITY_NOTIFY)
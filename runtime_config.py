@@ -0,0 +1,178 @@
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, Optional
+from config import Config
+from write_behind import PeriodicFlusher
+
+logger = logging.getLogger(__name__)
+
+# 可在运行时修改的配置：名称 -> Config 中的配置项，名称与 /config 命令一致
+TUNABLES = {
+    'checkin_min': 'CHECKIN_POINTS_MIN',
+    'checkin_max': 'CHECKIN_POINTS_MAX',
+    'message_points': 'MESSAGE_POINTS',
+    'search_cost': 'SEARCH_MESSAGE_COST',
+    'max_daily_points': 'MAX_MESSAGE_POINTS_PER_DAY',
+    'expire_days': 'POINTS_EXPIRE_DAYS',
+    'cooldown_hours': 'ZERO_POINTS_COOLDOWN_HOURS',
+}
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """某一版本的运行时配置（不可变），处理一个更新时只读取一次"""
+    version: int
+    checkin_min: int
+    checkin_max: int
+    message_points: int
+    search_cost: int
+    max_daily_points: int
+    expire_days: int
+    cooldown_hours: int
+
+    def as_dict(self) -> Dict[str, int]:
+        data = asdict(self)
+        data.pop('version')
+        return data
+
+def validate_snapshot(snapshot: ConfigSnapshot):
+    """校验一组配置（全局配置或合并了群组规则后的配置），无效时抛出 ValueError"""
+    for key, value in snapshot.as_dict().items():
+        if value < 0:
+            raise ValueError(f"{key} 不能为负数")
+    if snapshot.checkin_min > snapshot.checkin_max:
+        raise ValueError("checkin_min 不能大于 checkin_max")
+    if Config.LEDGER_RETENTION_DAYS > 0 and snapshot.expire_days >= Config.LEDGER_RETENTION_DAYS:
+        # 过期计算依赖过期天数内的原始流水，这些流水不能被压缩
+        raise ValueError(f"expire_days 必须小于流水保留天数 {Config.LEDGER_RETENTION_DAYS}")
+
+class RuntimeConfig:
+    """保存在数据库中的运行时配置
+
+    current() 返回当前快照；修改配置时在一个事务中写入 runtime_config 表，
+    再整体替换快照。runtime_config 表的任何变动都会由触发器递增 config_version，
+    后台线程定期检查版本号（以及可选的 JSON 配置文件），变化时重新加载。
+    """
+
+    def __init__(self, db, config_file: str = None):
+        self.db = db
+        self.config_file = Config.RUNTIME_CONFIG_FILE if config_file is None else config_file
+        self._lock = threading.Lock()
+        self._file_mtime: Optional[float] = None
+        # 环境变量中的值作为未保存配置项的默认值
+        self._base = self._defaults(0)
+        self._snapshot: ConfigSnapshot = self._base
+        self._watcher: Optional[PeriodicFlusher] = None
+
+    @staticmethod
+    def _defaults(version: int) -> ConfigSnapshot:
+        return ConfigSnapshot(version, **{key: getattr(Config, attr) for key, attr in TUNABLES.items()})
+
+    def current(self) -> ConfigSnapshot:
+        """当前配置快照"""
+        return self._snapshot
+
+    def _read_version(self, cursor) -> int:
+        cursor.execute("SELECT value FROM system_state WHERE key = 'config_version'")
+        row = cursor.fetchone()
+        return int(row[0]) if row else 0
+
+    def load(self) -> ConfigSnapshot:
+        """从数据库加载配置，未保存的配置项使用环境变量中的值"""
+        with self._lock, self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            version = self._read_version(cursor)
+            cursor.execute('SELECT key, value FROM runtime_config')
+            values = {}
+            for key, value in cursor.fetchall():
+                if key in TUNABLES:
+                    try:
+                        values[key] = int(value)
+                    except ValueError:
+                        logger.warning(f"忽略无效的运行时配置 {key}={value}")
+            snapshot = replace(self._base, version=version, **values)
+            try:
+                validate_snapshot(snapshot)
+            except ValueError as e:
+                logger.error(f"数据库中的运行时配置无效，保持 v{self._snapshot.version}: {e}")
+                return self._snapshot
+            self._apply(snapshot)
+            return snapshot
+
+    def _apply(self, snapshot: ConfigSnapshot):
+        previous = self._snapshot
+        self._snapshot = snapshot
+        # 同步到 Config，兼容仍直接读取 Config 的代码
+        for key, attr in TUNABLES.items():
+            setattr(Config, attr, getattr(snapshot, key))
+        if previous.version != snapshot.version:
+            logger.info(f"运行时配置已加载 v{snapshot.version}: {snapshot.as_dict()}")
+
+    def update(self, changes: Dict[str, int]) -> ConfigSnapshot:
+        """在一个事务中修改一项或多项配置，返回新快照；配置名或数值无效时抛出 ValueError"""
+        unknown = [key for key in changes if key not in TUNABLES]
+        if unknown:
+            raise ValueError(f"无效的配置项: {', '.join(unknown)}")
+        with self._lock, self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            candidate = replace(self._snapshot, **changes)
+            validate_snapshot(candidate)
+            cursor.executemany('''
+                INSERT INTO runtime_config (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+            ''', [(key, str(value)) for key, value in changes.items()])
+            snapshot = replace(candidate, version=self._read_version(cursor))
+            conn.commit()
+            self._apply(snapshot)
+            return snapshot
+
+    def check_for_changes(self):
+        """检查配置文件和数据库中的配置版本，有变化时重新加载"""
+        self._check_file()
+        with self.db.get_connection() as conn:
+            version = self._read_version(conn.cursor())
+        if version != self._snapshot.version:
+            self.load()
+
+    def _check_file(self):
+        if not self.config_file:
+            return
+        try:
+            mtime = os.path.getmtime(self.config_file)
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        self._file_mtime = mtime
+        try:
+            with open(self.config_file, encoding='utf-8') as f:
+                changes = {key: int(value) for key, value in json.load(f).items()}
+            changed = {key: value for key, value in changes.items()
+                       if getattr(self._snapshot, key, None) != value}
+            if changed:
+                self.update(changed)
+                logger.info(f"已从 {self.config_file} 更新配置: {changed}")
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(f"读取配置文件 {self.config_file} 失败: {e}")
+
+    def start(self, interval: float = None):
+        """加载配置并启动后台检查线程"""
+        self.load()
+        self._check_file()
+        interval = Config.CONFIG_RELOAD_INTERVAL if interval is None else interval
+        if interval > 0:
+            self._watcher = PeriodicFlusher(interval, self._safe_check, name='config-reload')
+            self._watcher.start()
+
+    def _safe_check(self):
+        try:
+            self.check_for_changes()
+        except Exception as e:
+            logger.error(f"检查运行时配置失败: {e}")
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
@@ -0,0 +1,38 @@
+import threading
+from datetime import date
+from typing import Iterable
+
+class DailyActiveTracker:
+    """当日活跃用户统计，跨天自动重置"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = date.today().isoformat()
+        self._users = set()
+
+    def _rollover(self, today: str):
+        # 只向后切换日期，跨天前缓冲的旧记录不会把统计拉回前一天
+        if today > self._day:
+            self._day = today
+            self._users = set()
+
+    def load(self, day: str, user_ids: Iterable[int]):
+        """用数据库中的当日记录初始化"""
+        with self._lock:
+            self._rollover(day)
+            if day == self._day:
+                self._users.update(user_ids)
+
+    def touch(self, user_id: int, day: str = None):
+        """记录用户当日活跃"""
+        day = day or date.today().isoformat()
+        with self._lock:
+            self._rollover(day)
+            if day == self._day:
+                self._users.add(user_id)
+
+    def count(self) -> int:
+        """当日活跃用户数"""
+        with self._lock:
+            self._rollover(date.today().isoformat())
+            return len(self._users)
@@ -64,9 +64,13 @@ def test_database():
         db = Database()
         print("✅ 数据库初始化成功")
         
-        # 测试基本操作
-        test_user = db.get_or_create_user(12345, "test_user", "Test", "User")
-        print(f"✅ 用户操作测试成功: {test_user.user_id}")
+        try:
+            # 测试基本操作
+            test_user = db.get_or_create_user(12345, "test_user", "Test", "User")
+            print(f"✅ 用户操作测试成功: {test_user.user_id}")
+        finally:
+            # 写入缓冲中的数据
+            db.close()
         
         return True
     except Exception as e:
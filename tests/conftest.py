@@ -0,0 +1,50 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# 项目模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试不依赖本地 .env 中的群组配置（load_dotenv 不覆盖已有环境变量）
+os.environ.setdefault('CHECKIN_GROUP_ID', '-1001')
+os.environ.setdefault('SEARCH_GROUP_ID', '-1002')
+
+@pytest.fixture
+def make_db(tmp_path, monkeypatch):
+    """创建使用临时数据库文件的 Database，测试结束时关闭"""
+    from config import Config
+    from database import Database
+    from runtime_config import TUNABLES
+    # 运行时配置会同步写入 Config，测试结束后恢复
+    for attr in TUNABLES.values():
+        monkeypatch.setattr(Config, attr, getattr(Config, attr))
+    created = []
+
+    def make(name='bot_data.db'):
+        db = Database(str(tmp_path / name))
+        created.append(db)
+        return db
+
+    yield make
+    for db in created:
+        db.close()
+
+def days_ago(days: float) -> str:
+    """days 天前的 UTC 时间（与流水 created_at 格式相同）"""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+@pytest.fixture
+def record():
+    """直接写入一笔指定时间的积分变动（余额与流水同步）"""
+    def record(db, user_id: int, points: int, days: float, transaction_type: str = 'test'):
+        with db.get_connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO users (user_id, total_points) VALUES (?, 0)', (user_id,))
+            conn.execute('UPDATE users SET total_points = total_points + ? WHERE user_id = ?', (points, user_id))
+            conn.execute('''
+                INSERT INTO points_transactions (user_id, points_change, transaction_type, description, created_at)
+                VALUES (?, ?, ?, '', ?)
+            ''', (user_id, points, transaction_type, days_ago(days)))
+            conn.commit()
+    return record
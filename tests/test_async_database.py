@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+from async_database import AsyncDatabase
+
+def test_queue_size_counts_waiting_calls(make_db):
+    adb = AsyncDatabase(make_db(), workers=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.ensure_future(adb.run(release.wait))
+        await asyncio.sleep(0.05)
+        # 唯一的线程被占用，后续调用全部排队
+        waiting = [asyncio.ensure_future(adb.run(lambda: None)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert adb.queue_size() == 3
+
+        # 开始执行前取消的调用也要从计数中扣除
+        waiting[0].cancel()
+        await asyncio.sleep(0.05)
+        assert adb.queue_size() == 2
+
+        release.set()
+        await blocker
+        await asyncio.gather(*waiting[1:])
+        assert adb.queue_size() == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        adb.close()
@@ -0,0 +1,27 @@
+import pytest
+
+from config import Config
+
+@pytest.fixture
+def webhook_config(monkeypatch):
+    monkeypatch.setattr(Config, 'BOT_TOKEN', 'token')
+    monkeypatch.setattr(Config, 'CHECKIN_GROUP_ID', -100)
+    monkeypatch.setattr(Config, 'SEARCH_GROUP_ID', -200)
+    monkeypatch.setattr(Config, 'BOT_MODE', 'webhook')
+    monkeypatch.setattr(Config, 'WEBHOOK_URL', 'https://bot.example.com/telegram')
+    monkeypatch.setattr(Config, 'WEBHOOK_SECRET_TOKEN', 'secret-token_1')
+    return monkeypatch
+
+def test_webhook_with_secret_token_is_valid(webhook_config):
+    assert Config.validate()
+
+@pytest.mark.parametrize('token', ['', 'has space', 'x' * 257])
+def test_webhook_requires_valid_secret_token(webhook_config, token):
+    webhook_config.setattr(Config, 'WEBHOOK_SECRET_TOKEN', token)
+    with pytest.raises(ValueError, match='WEBHOOK_SECRET_TOKEN'):
+        Config.validate()
+
+def test_polling_does_not_need_secret_token(webhook_config):
+    webhook_config.setattr(Config, 'BOT_MODE', 'polling')
+    webhook_config.setattr(Config, 'WEBHOOK_SECRET_TOKEN', '')
+    assert Config.validate()
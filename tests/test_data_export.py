@@ -0,0 +1,34 @@
+import csv
+from datetime import date
+
+import pytest
+
+from data_export import EXPORT_SPECS, parse_export_args, write_chunks
+
+def test_parse_export_args():
+    assert parse_export_args(['users']) == ('users', None, None, 'csv')
+    assert parse_export_args(['checkins', '2024-05', 'jsonl']) == (
+        'checkins', date(2024, 5, 1), date(2024, 5, 31), 'jsonl')
+
+@pytest.mark.parametrize('args', [
+    ['transactions', '99999999999d'],
+    ['transactions', '9999-12'],
+    ['transactions', 'abc'],
+])
+def test_bad_range_gets_user_facing_error(args):
+    with pytest.raises(ValueError, match='日期范围无效'):
+        parse_export_args(args)
+
+@pytest.mark.parametrize('args', [[], ['nope'], ['balances', '7d']])
+def test_bad_kind_or_filter(args):
+    with pytest.raises(ValueError):
+        parse_export_args(args)
+
+def test_write_chunks_splits_with_header(tmp_path):
+    columns = EXPORT_SPECS['balances'].columns
+    rows = ((i, f'user{i}', i) for i in range(2500))
+    chunks = list(write_chunks(rows, columns, 'csv', str(tmp_path), 'balances', 1))
+    assert [count for _, count in chunks] == [1000, 1000, 500]
+    with open(chunks[-1][0], encoding='utf-8-sig') as f:
+        lines = list(csv.reader(f))
+    assert lines[0] == list(columns) and len(lines) == 501
@@ -0,0 +1,42 @@
+from datetime import date
+
+import pytest
+
+from date_range import parse_date_range
+
+TODAY = date(2024, 5, 15)
+
+@pytest.mark.parametrize('text, expected', [
+    ('', (TODAY, TODAY)),
+    ('today', (TODAY, TODAY)),
+    ('yesterday', (date(2024, 5, 14), date(2024, 5, 14))),
+    ('7d', (date(2024, 5, 9), TODAY)),
+    ('2024-02', (date(2024, 2, 1), date(2024, 2, 29))),
+    ('2024-05-01', (date(2024, 5, 1), date(2024, 5, 1))),
+    ('2024-05-01..2024-05-03', (date(2024, 5, 1), date(2024, 5, 3))),
+])
+def test_parse_valid_ranges(text, expected):
+    assert parse_date_range(text, TODAY) == expected
+
+@pytest.mark.parametrize('text', [
+    '99999999999d',  # timedelta 溢出
+    '9999-12',       # 月末计算超出 date 上限
+    '0001-01-01..9999-12-31x',
+    '0d',
+    '2024-13',
+    'abc',
+    '2024-05-03..2024-05-01',
+])
+def test_invalid_ranges_raise_value_error(text):
+    with pytest.raises(ValueError):
+        parse_date_range(text, TODAY)
+
+def test_overflow_has_chinese_message():
+    with pytest.raises(ValueError, match='日期超出范围'):
+        parse_date_range('99999999999d', TODAY)
+    with pytest.raises(ValueError, match='日期超出范围'):
+        parse_date_range('9999-12', TODAY)
+
+def test_max_days():
+    with pytest.raises(ValueError, match='366'):
+        parse_date_range('400d', TODAY, max_days=366)
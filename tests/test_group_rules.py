@@ -0,0 +1,39 @@
+import pytest
+
+from group_routing import rule
+from models import GroupPair
+
+@pytest.fixture
+def db(make_db):
+    db = make_db()
+    db.update_config({'checkin_min': 5, 'checkin_max': 20})
+    assert db.save_group_pair(GroupPair(-10, -20, name='test'))
+    return db
+
+def test_valid_rule_is_saved(db):
+    assert db.set_group_rule(-10, 'checkin_max', 50)
+    assert db.set_group_rule(-10, 'checkin_min', 30)
+    assert rule(db.groups.get(-10), 'checkin_min') == 30
+    assert db.set_group_rule(-10, 'checkin_min', None)
+    assert db.groups.get(-10).checkin_points_min is None
+
+@pytest.mark.parametrize('name, value', [
+    ('search_cost', -1),
+    ('message_points', -5),
+    # 合并全局配置后 checkin_min（25）大于 checkin_max（20）
+    ('checkin_min', 25),
+    ('checkin_max', 4),
+])
+def test_invalid_merged_rules_are_rejected(db, name, value):
+    before = db.groups.get(-10)
+    with pytest.raises(ValueError):
+        db.set_group_rule(-10, name, value)
+    assert db.groups.get(-10) == before
+    with db.get_connection() as conn:
+        row = conn.execute('SELECT checkin_points_min, checkin_points_max, search_message_cost, message_points '
+                           'FROM group_pairs WHERE checkin_group_id = -10').fetchone()
+    assert row == (None, None, None, None)
+
+def test_unknown_pair_or_rule(db):
+    assert not db.set_group_rule(-99, 'search_cost', 1)
+    assert not db.set_group_rule(-10, 'nope', 1)
@@ -0,0 +1,20 @@
+import os
+
+from ledger_archive import LedgerArchive
+
+def test_append_groups_rows_by_created_at_month(tmp_path):
+    archive = LedgerArchive(str(tmp_path))
+    rows = [
+        (1, 10, 5, 'checkin', '签到', '2024-04-30 23:59:59'),
+        (2, 10, -1, 'search', '搜索', '2024-05-01 00:00:00'),
+        (3, 11, 2, 'message', '发言', '2024-05-20 12:00:00'),
+    ]
+    paths = archive.append(rows)
+    assert [os.path.basename(p) for p in paths] == [
+        'points_transactions-2024-04.jsonl.gz', 'points_transactions-2024-05.jsonl.gz']
+    assert [r['id'] for r in LedgerArchive.read(paths[0])] == [1]
+    assert [r['id'] for r in LedgerArchive.read(paths[1])] == [2, 3]
+
+    # 再次追加到同一个月份时写入新的 gzip 成员，已有内容保留
+    archive.append([(4, 10, 1, 'checkin', '签到', '2024-05-31 08:00:00')])
+    assert [r['id'] for r in LedgerArchive.read(paths[1])] == [2, 3, 4]
@@ -0,0 +1,108 @@
+import glob
+
+import pytest
+
+from config import Config
+from ledger_archive import LedgerArchive
+
+@pytest.fixture
+def db(make_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'LEDGER_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    return make_db()
+
+def seed(db, record):
+    for user_id in (1, 2, 3):
+        record(db, user_id, 100 * user_id, 120, 'checkin')
+        record(db, user_id, -30, 100, 'search')
+        record(db, user_id, 20, 70, 'message')
+        record(db, user_id, 5, 10, 'message')
+
+def raw_ids(db, where: str = '1') -> list:
+    with db.get_connection() as conn:
+        return [row[0] for row in conn.execute(f'SELECT id FROM points_transactions WHERE {where} ORDER BY id')]
+
+def assert_ledger_matches_balances(db):
+    """每个用户的余额 = 原始流水合计 + 已压缩汇总合计"""
+    with db.get_connection() as conn:
+        balances = dict(conn.execute('SELECT user_id, total_points FROM users'))
+        totals = db._ledger_totals(conn.cursor(), sorted(balances))
+    assert totals == balances
+
+def archived_ids(db) -> list:
+    ids = set()
+    for path in glob.glob(f'{Config.LEDGER_ARCHIVE_DIR}/*.jsonl.gz'):
+        ids.update(row['id'] for row in LedgerArchive.read(path))
+    return sorted(ids)
+
+def daily_points(db) -> list:
+    with db.get_connection() as conn:
+        return conn.execute('SELECT * FROM daily_points_stats ORDER BY day, transaction_type').fetchall()
+
+def test_compaction_keeps_balances_equal_to_ledger(db, record):
+    seed(db, record)
+    old = raw_ids(db, "created_at < datetime('now', '-60 days')")
+    stats = daily_points(db)
+
+    result = db.compact_ledger(60)
+
+    assert result.rows == len(old) == 9
+    assert archived_ids(db) == old
+    assert not set(old) & set(raw_ids(db))
+    assert_ledger_matches_balances(db)
+    assert [db.get_user_points(u) for u in (1, 2, 3)] == [95, 195, 295]
+    # 按天汇总不受压缩影响
+    assert daily_points(db) == stats
+
+    # 再次压缩没有可压缩的流水
+    assert db.compact_ledger(60).rows == 0
+    assert_ledger_matches_balances(db)
+
+def test_rows_not_yet_processed_by_expiry_are_kept(db, record):
+    seed(db, record)
+    # 过期清理尚未执行过：不压缩
+    db.update_config({'expire_days': 90})
+    assert db.compact_ledger(60).rows == 0
+
+    # 过期清理水位在 90 天前，只压缩更早的流水，70 天前的流水保留
+    db.cleanup_expired_points()
+    db.update_config({'expire_days': 30})
+    kept = raw_ids(db, "created_at >= datetime('now', '-91 days')")
+    result = db.compact_ledger(60)
+    assert result.rows == 6
+    assert set(kept) <= set(raw_ids(db))
+    assert_ledger_matches_balances(db)
+
+def test_retention_must_exceed_expiry(db, record):
+    seed(db, record)
+    db.update_config({'expire_days': 30})
+    db.cleanup_expired_points()
+    assert db.compact_ledger(30).rows == 0
+    assert len(raw_ids(db)) == 12 + 3  # 含过期清理流水
+
+def test_failed_delete_rolls_back_and_rerun_completes(db, record):
+    seed(db, record)
+    before = raw_ids(db)
+    with db.get_connection() as conn:
+        conn.execute('''
+            CREATE TRIGGER fail_delete BEFORE DELETE ON points_transactions
+            BEGIN SELECT RAISE(ABORT, 'delete failed'); END
+        ''')
+        conn.commit()
+
+    with pytest.raises(Exception, match='delete failed'):
+        db.compact_ledger(60)
+
+    # 归档已写入，但数据库中的流水和汇总保持不变
+    assert raw_ids(db) == before
+    with db.get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM points_ledger_summary').fetchone()[0] == 0
+    assert len(archived_ids(db)) == 9
+    assert_ledger_matches_balances(db)
+
+    with db.get_connection() as conn:
+        conn.execute('DROP TRIGGER fail_delete')
+        conn.commit()
+    # 重新执行会再次归档同一批流水，读取时按 id 去重
+    assert db.compact_ledger(60).rows == 9
+    assert archived_ids(db) == sorted(set(before) - set(raw_ids(db)))
+    assert_ledger_matches_balances(db)
@@ -0,0 +1,33 @@
+import pytest
+
+from metrics import DB_ERRORS, DB_LATENCY, track_db
+
+def test_nested_db_calls_are_recorded_once(make_db):
+    db = make_db()
+    before = {name: DB_LATENCY.count(name) for name in ('cleanup_expired_points', 'flush')}
+    db.cleanup_expired_points()
+    # cleanup_expired_points 内部会先 flush，只记录外层调用
+    assert DB_LATENCY.count('cleanup_expired_points') == before['cleanup_expired_points'] + 1
+    assert DB_LATENCY.count('flush') == before['flush']
+
+    db.flush()
+    assert DB_LATENCY.count('flush') == before['flush'] + 1
+
+def test_errors_in_nested_calls_count_against_the_outer_call():
+    @track_db
+    def inner_failure():
+        raise RuntimeError('boom')
+
+    @track_db
+    def outer_failure():
+        inner_failure()
+
+    before = (DB_ERRORS.get('outer_failure'), DB_ERRORS.get('inner_failure'))
+    with pytest.raises(RuntimeError):
+        outer_failure()
+    assert (DB_ERRORS.get('outer_failure'), DB_ERRORS.get('inner_failure')) == (before[0] + 1, before[1])
+
+    # 外层调用结束后层数复位，之后的调用照常记录
+    with pytest.raises(RuntimeError):
+        inner_failure()
+    assert DB_ERRORS.get('inner_failure') == before[1] + 1
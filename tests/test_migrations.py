@@ -0,0 +1,119 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from migrations import MIGRATIONS
+
+LATEST = MIGRATIONS[-1][0]
+
+# 引入迁移之前的数据库结构
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+    total_points INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE checkin_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, checkin_date TEXT, points_earned INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id), UNIQUE(user_id, checkin_date)
+);
+CREATE TABLE message_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, group_id INTEGER, message_date TEXT,
+    points_earned INTEGER, message_count INTEGER DEFAULT 1, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id), UNIQUE(user_id, group_id, message_date)
+);
+CREATE TABLE points_transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, points_change INTEGER, transaction_type TEXT,
+    description TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+'''
+
+def day(offset: int) -> str:
+    return (date(2024, 5, 10) + timedelta(days=offset)).isoformat()
+
+@pytest.fixture
+def baseline_path(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO users (user_id, total_points) VALUES (?, ?)', [(1, 40), (2, 10), (3, 0)])
+    # 用户1连续签到3天；用户2最近一次签到前断签
+    conn.executemany('INSERT INTO checkin_records (user_id, checkin_date, points_earned) VALUES (?, ?, ?)', [
+        (1, day(-2), 5), (1, day(-1), 5), (1, day(0), 5),
+        (2, day(-5), 5), (2, day(-3), 5), (2, day(-2), 5),
+    ])
+    conn.executemany('''
+        INSERT INTO message_records (user_id, group_id, message_date, points_earned, message_count)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(1, -100, day(0), 3, 3), (2, -100, day(0), 1, 2), (1, -200, day(-1), 2, 2)])
+    conn.executemany('''
+        INSERT INTO points_transactions (user_id, points_change, transaction_type, description, created_at)
+        VALUES (?, ?, ?, '', ?)
+    ''', [(1, 15, 'checkin', f'{day(0)} 12:00:00'), (1, -5, 'search', f'{day(0)} 12:00:00'),
+          (2, 10, 'checkin', f'{day(-2)} 12:00:00')])
+    conn.commit()
+    conn.close()
+    return path
+
+def schema(conn) -> dict:
+    """表 -> 列名，以及全部索引和触发器名"""
+    result = {}
+    for kind, name, table in conn.execute("SELECT type, name, tbl_name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"):
+        if kind == 'table':
+            result[name] = [row[1] for row in conn.execute(f'PRAGMA table_info({name})')]
+        else:
+            result[f'{kind}:{name}'] = table
+    return result
+
+def test_baseline_database_migrates_to_latest(make_db, baseline_path):
+    db = make_db('baseline.db')
+    with db.get_connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == LATEST
+        tables = schema(conn)
+        for table in ('search_message_records', 'group_pairs', 'runtime_config', 'points_ledger_summary',
+                      'daily_message_stats', 'daily_checkin_stats', 'daily_points_stats', 'restrictions',
+                      'system_state'):
+            assert table in tables
+        assert {'checkin_streak', 'last_checkin_date'} <= set(tables['users'])
+
+        # v3 回填连续签到
+        streaks = dict((u, (s, d)) for u, s, d in conn.execute(
+            'SELECT user_id, checkin_streak, last_checkin_date FROM users'))
+        assert streaks[1] == (3, day(0))
+        assert streaks[2] == (2, day(-2))
+        assert streaks[3] == (0, None)
+
+        # v7 回填按天汇总
+        assert conn.execute('SELECT * FROM daily_message_stats ORDER BY day, group_id').fetchall() == [
+            (day(-1), -200, 1, 2, 2), (day(0), -100, 2, 5, 4)]
+        assert conn.execute('SELECT * FROM daily_checkin_stats ORDER BY day').fetchall() == [
+            (day(-5), 1, 5), (day(-3), 1, 5), (day(-2), 2, 10), (day(-1), 1, 5), (day(0), 1, 5)]
+        points = conn.execute('SELECT transaction_type, SUM(credits), SUM(debits), SUM(transaction_count) '
+                              'FROM daily_points_stats GROUP BY transaction_type ORDER BY 1').fetchall()
+        assert points == [('checkin', 25, 0, 2), ('search', 0, 5, 1)]
+
+    # 迁移后触发器持续维护汇总，配置可多次修改
+    db.update_config({'search_cost': 2})
+    db.update_config({'search_cost': 3})
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO checkin_records (user_id, checkin_date, points_earned) VALUES (3, ?, 7)", (day(0),))
+        conn.commit()
+        assert conn.execute('SELECT checkin_count, points_earned FROM daily_checkin_stats WHERE day = ?',
+                            (day(0),)).fetchone() == (2, 12)
+
+def test_fresh_and_migrated_schemas_match(make_db, baseline_path):
+    migrated = make_db('baseline.db')
+    fresh = make_db('fresh.db')
+    with migrated.get_connection() as a, fresh.get_connection() as b:
+        assert b.execute('PRAGMA user_version').fetchone()[0] == LATEST
+        assert schema(a) == schema(b)
+
+def test_migrations_are_not_rerun(make_db, baseline_path):
+    make_db('baseline.db').close()
+    db = make_db('baseline.db')
+    with db.get_connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == LATEST
+        assert conn.execute('SELECT checkin_streak FROM users WHERE user_id = 1').fetchone()[0] == 3
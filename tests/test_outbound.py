@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from outbound import PRIORITY_MODERATION, OutboundDropped, OutboundScheduler
+
+def run(coro):
+    return asyncio.run(coro)
+
+def make_scheduler(**kwargs):
+    options = dict(global_rate=1000, private_rate=1000, group_rate_per_minute=60000, chat_burst=100,
+                   max_retries=3, chat_queue_limit=100, message_ttl=60)
+    options.update(kwargs)
+    return OutboundScheduler(bot=None, **options)
+
+def recorder(calls, name, result=None):
+    async def call():
+        calls.append(name)
+        return result if result is not None else name
+    return call
+
+def test_chat_queue_limit_drops_oldest_replies():
+    async def scenario():
+        # 每个会话突发 1 条、之后每秒 1 条：第一条立即发出，其余排队
+        scheduler = make_scheduler(private_rate=1, chat_burst=1, chat_queue_limit=2)
+        calls = []
+        futures = [scheduler.submit(recorder(calls, 0), chat_id=1, droppable=True)]
+        await asyncio.sleep(0.01)
+        futures += [scheduler.submit(recorder(calls, i), chat_id=1, droppable=True) for i in range(1, 5)]
+        await asyncio.sleep(0.01)
+        assert calls == [0]
+        dropped = [i for i, f in enumerate(futures) if f.done() and isinstance(f.exception(), OutboundDropped)]
+        assert dropped == [1, 2]
+        await scheduler.stop(timeout=3)
+        assert calls == [0, 3, 4]
+    run(scenario())
+
+def test_stale_replies_expire_instead_of_queueing():
+    async def scenario():
+        # 群每分钟 1 条，第二条要等 60 秒，超过 TTL 直接丢弃
+        scheduler = make_scheduler(group_rate_per_minute=1, chat_burst=1, message_ttl=5)
+        calls = []
+        first = scheduler.submit(recorder(calls, 'a'), chat_id=-100, droppable=True)
+        second = scheduler.submit(recorder(calls, 'b'), chat_id=-100, droppable=True)
+        not_droppable = scheduler.submit(recorder(calls, 'c'), chat_id=-100, limited=False)
+        assert await first == 'a'
+        assert await not_droppable == 'c'
+        with pytest.raises(OutboundDropped):
+            await second
+        await scheduler.stop(timeout=1)
+        assert calls == ['a', 'c']
+    run(scenario())
+
+def test_same_key_submitted_in_flight_runs_after():
+    async def scenario():
+        scheduler = make_scheduler()
+        calls, release = [], asyncio.Event()
+
+        async def restrict():
+            calls.append('restrict')
+            await release.wait()
+            return 'restrict'
+
+        key = ('restrictChatMember', -100, 1)
+        first = scheduler.submit(restrict, -100, PRIORITY_MODERATION, limited=False, key=key)
+        await asyncio.sleep(0.01)
+        second = scheduler.submit(recorder(calls, 'lift'), -100, PRIORITY_MODERATION, limited=False, key=key)
+        third = scheduler.submit(recorder(calls, 'lift2'), -100, PRIORITY_MODERATION, limited=False, key=key)
+        assert second is third
+        await asyncio.sleep(0.01)
+        assert calls == ['restrict']
+        release.set()
+        assert await first == 'restrict'
+        assert await second == 'lift2'
+        assert calls == ['restrict', 'lift2']
+        await scheduler.stop(timeout=1)
+    run(scenario())
+
+def test_lift_during_restrict_retry_replaces_it():
+    async def scenario():
+        scheduler = make_scheduler()
+        calls, release = [], asyncio.Event()
+
+        async def restrict():
+            calls.append('restrict')
+            await release.wait()
+            raise RetryAfter(0)
+
+        key = ('restrictChatMember', -100, 1)
+        first = scheduler.submit(restrict, -100, PRIORITY_MODERATION, limited=False, key=key)
+        await asyncio.sleep(0.01)
+        second = scheduler.submit(recorder(calls, 'lift'), -100, PRIORITY_MODERATION, limited=False, key=key)
+        release.set()
+        # 重试时执行的是解禁，禁言不会在解禁之后再执行一次
+        assert await first == 'lift'
+        assert await second == 'lift'
+        await scheduler.stop(timeout=1)
+        assert calls == ['restrict', 'lift']
+        assert not scheduler._pending
+    run(scenario())
+
+def test_stop_drops_leftover_replies():
+    async def scenario():
+        scheduler = make_scheduler(group_rate_per_minute=1, chat_burst=1, message_ttl=600)
+        calls = []
+        scheduler.submit(recorder(calls, 'a'), chat_id=-100, droppable=True)
+        pending = scheduler.submit(recorder(calls, 'b'), chat_id=-100, droppable=True)
+        await asyncio.sleep(0.01)
+        await scheduler.stop(timeout=0.05)
+        with pytest.raises(OutboundDropped):
+            await pending
+    run(scenario())
@@ -0,0 +1,74 @@
+import pytest
+
+def expire_rows(db, user_id: int) -> list:
+    with db.get_connection() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT points_change FROM points_transactions WHERE user_id = ? AND transaction_type = 'expire'",
+            (user_id,))]
+
+def watermark(db) -> str:
+    with db.get_connection() as conn:
+        return db._get_state(conn.cursor(), 'expiry_watermark')
+
+@pytest.fixture
+def db(make_db):
+    db = make_db()
+    db.update_config({'expire_days': 30})
+    return db
+
+def test_first_run_expires_old_lots_fifo(db, record):
+    assert watermark(db) is None
+    # 40 天前获得 100，10 天前消费 30（先用掉旧积分），5 天前获得 20
+    record(db, 1, 100, 40)
+    record(db, 1, -30, 10)
+    record(db, 1, 20, 5)
+
+    assert db.cleanup_expired_points() == 1
+    assert db.get_user_points(1) == 20
+    assert expire_rows(db, 1) == [-70]
+    assert watermark(db) is not None
+
+def test_spending_already_consumed_old_lots(db, record):
+    record(db, 2, 50, 40)
+    record(db, 2, -50, 20)
+    record(db, 2, 10, 5)
+
+    assert db.cleanup_expired_points() == 0
+    assert db.get_user_points(2) == 10
+    assert expire_rows(db, 2) == []
+
+def test_rerun_is_idempotent(db, record):
+    record(db, 3, 80, 40)
+    record(db, 3, 15, 3)
+
+    assert db.cleanup_expired_points() == 1
+    first_watermark = watermark(db)
+    # 水位已推进：再次执行不会重复扣除
+    assert db.cleanup_expired_points() == 0
+    assert db.cleanup_expired_points() == 0
+    assert db.get_user_points(3) == 15
+    assert expire_rows(db, 3) == [-80]
+    assert watermark(db) >= first_watermark
+
+def test_credits_crossing_cutoff_across_runs(db, record):
+    # 第一次清理时 25 天前的积分还未过期
+    record(db, 4, 40, 25)
+    record(db, 4, 10, 2)
+    assert db.cleanup_expired_points() == 0
+    assert db.get_user_points(4) == 50
+
+    # 过期时间点前移（相当于时间推移），这笔积分跨过过期时间点，在下一次清理中过期
+    db.update_config({'expire_days': 20})
+    assert db.cleanup_expired_points() == 1
+    assert db.get_user_points(4) == 10
+    assert expire_rows(db, 4) == [-40]
+
+    # 水位之前的积分已处理过，再次清理不变
+    assert db.cleanup_expired_points() == 0
+    assert db.get_user_points(4) == 10
+
+def test_expiry_disabled(make_db, record):
+    db = make_db()
+    record(db, 5, 100, 400)
+    assert db.cleanup_expired_points() == 0
+    assert db.get_user_points(5) == 100
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from config import Config
+from rank_index import RankIndex
+
+def ordered(points):
+    return sorted(points.items(), key=lambda item: (-item[1], item[0]))
+
+def test_build_matches_incremental_updates():
+    rng = random.Random(1)
+    points = {user_id: rng.randint(0, 50) for user_id in range(1, 2001)}
+    built = RankIndex.build(ordered(points))
+    incremental = RankIndex()
+    for user_id, value in points.items():
+        incremental.update(user_id, value)
+
+    # 构建后继续增量更新，结构仍然正确
+    for _ in range(500):
+        user_id, value = rng.randint(1, 2500), rng.randint(0, 50)
+        points[user_id] = value
+        built.update(user_id, value)
+        incremental.update(user_id, value)
+    for user_id in rng.sample(sorted(points), 100):
+        del points[user_id]
+        built.remove(user_id)
+        incremental.remove(user_id)
+
+    expected = ordered(points)
+    assert built.slice(0, len(points)) == incremental.slice(0, len(points)) == expected
+    assert len(built) == len(expected)
+    assert built.total_points == sum(points.values())
+    for position, (user_id, value) in enumerate(expected):
+        assert built.position(user_id) == position
+        assert built.rank(user_id) == sum(1 for v in points.values() if v > value) + 1
+
+def test_build_rejects_unsorted_rows():
+    with pytest.raises(ValueError):
+        RankIndex.build([(1, 5), (2, 10)])
+    with pytest.raises(ValueError):
+        RankIndex.build([(2, 5), (1, 5)])
+
+def test_ties_share_rank_and_order_by_user_id():
+    index = RankIndex.build([(3, 10), (1, 5), (2, 5), (4, 5), (5, 0)])
+    assert [index.rank(u) for u in (3, 1, 2, 4, 5)] == [1, 2, 2, 2, 5]
+    assert index.around(2, 1) == [(1, 5), (2, 5), (4, 5)]
+    assert index.around(3, 2) == [(3, 10), (1, 5), (2, 5)]
+    assert index.around(99, 1) == []
+    assert index.rank(99) == 5  # 不存在的用户按0分计算
+
+def test_empty_build():
+    index = RankIndex.build([])
+    assert len(index) == 0 and index.top(10) == []
+    index.update(1, 3)
+    assert index.top(10) == [(1, 3)]
+
+@pytest.fixture
+def index_and_sql_dbs(make_db, monkeypatch):
+    """相同数据的两个数据库：一个使用排行索引，一个走 SQL 查询"""
+    rng = random.Random(7)
+    dbs = []
+    for enabled in (True, False):
+        monkeypatch.setattr(Config, 'RANK_INDEX_ENABLED', False)
+        db = make_db(f'rank_{enabled}.db')
+        with db.get_connection() as conn:
+            rng.seed(7)
+            conn.executemany('INSERT INTO users (user_id, username, first_name, total_points) VALUES (?, ?, ?, ?)',
+                             [(user_id, f'u{user_id}', f'n{user_id}', rng.choice([0, 5, 5, 10, 20]))
+                              for user_id in range(1, 301)])
+            conn.commit()
+        if enabled:
+            db._load_rank_index()
+        dbs.append(db)
+    return dbs
+
+def test_rank_queries_match_sql_fallback(index_and_sql_dbs):
+    indexed, sql = index_and_sql_dbs
+    assert indexed.rank_index is not None and sql.rank_index is None
+    assert len(indexed.rank_index) == 300
+    for user_id in (1, 2, 50, 150, 300):
+        assert indexed.get_user_rank(user_id) == sql.get_user_rank(user_id)
+        assert indexed.get_users_around(user_id, 3) == sql.get_users_around(user_id, 3)
+    assert [tuple(row) for row in indexed.get_top_users(20)] == [tuple(row) for row in sql.get_top_users(20)]
@@ -0,0 +1,24 @@
+import pytest
+
+def test_repeated_updates_bump_version(make_db):
+    db = make_db()
+    first = db.update_config({'search_cost': 3})
+    second = db.update_config({'search_cost': 4, 'checkin_max': 50})
+    third = db.update_config({'search_cost': 4})
+    assert first.version < second.version < third.version
+    assert db.runtime_config.current().search_cost == 4
+
+    # 直接用 SQL 修改同样递增版本
+    with db.get_connection() as conn:
+        conn.execute("UPDATE runtime_config SET value = '5' WHERE key = 'search_cost'")
+        conn.commit()
+    db.runtime_config.check_for_changes()
+    assert db.runtime_config.current().search_cost == 5
+    assert db.runtime_config.current().version > third.version
+
+def test_invalid_update_is_rejected(make_db):
+    db = make_db()
+    with pytest.raises(ValueError):
+        db.update_config({'checkin_min': 100, 'checkin_max': 10})
+    with pytest.raises(ValueError):
+        db.update_config({'nope': 1})
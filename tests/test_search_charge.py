@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from config import Config
+
+@pytest.fixture
+def db(make_db, record, monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_ENABLED', True)
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_INTERVAL_MS', 60000)
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_MAX_EVENTS', 1000)
+    monkeypatch.setattr(Config, 'RANK_INDEX_ENABLED', True)
+    db = make_db()
+    record(db, 1, 1, 0)
+    db._load_rank_index()
+    db.update_config({'cooldown_hours': 1})
+    return db
+
+def committed(db, user_id: int) -> int:
+    with db.get_connection() as conn:
+        return conn.execute('SELECT total_points FROM users WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+def test_charge_covered_by_pending_credits_never_goes_negative(db):
+    db.add_message_points(1, -100, 2)
+    db.add_message_points(1, -100, 2)
+    assert committed(db, 1) == 1 and db.get_user_points(1) == 5
+
+    result = db.charge_search_message(1, cost=3)
+    assert (result.allowed, result.charged, result.cost, result.balance) == (True, True, 3, 2)
+    assert committed(db, 1) == 2
+    assert db.rank_index.get_points(1) == 2
+    assert db.balance_cache.get(1) == 2
+    with db.get_connection() as conn:
+        assert conn.execute('SELECT MIN(total_points) FROM users').fetchone()[0] >= 0
+
+def test_committed_balance_is_charged_without_flushing(db):
+    db.add_message_points(1, -100, 2)
+    result = db.charge_search_message(1, cost=1)
+    assert result.charged and result.balance == 2
+    # 已入库余额足够，缓冲中的积分保持不动
+    assert db._pending_points(1) == 2
+    assert committed(db, 1) == 0
+
+def test_free_and_not_charged_are_distinguishable(db):
+    free = db.charge_search_message(1, cost=0)
+    assert (free.allowed, free.charged, free.cost) == (True, False, 0)
+
+    first = db.charge_search_message(1, cost=10)
+    assert (first.allowed, first.charged, first.cost, first.balance) == (True, False, 10, 1)
+    # 冷却期内积分仍不足：不放行
+    second = db.charge_search_message(1, cost=10)
+    assert (second.allowed, second.charged, second.cost) == (False, False, 10)
+    assert committed(db, 1) == 1
+
+def test_cooldown_restore_follows_current_setting(db, make_db):
+    with db.get_connection() as conn:
+        conn.execute('INSERT INTO search_message_records (user_id, last_message_time) VALUES (?, ?)',
+                     (2, (datetime.now(timezone.utc) - timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+
+    # 启动时冷却时间为1小时，3小时前的记录仍要恢复：之后改为5小时要继续生效
+    reopened = make_db()
+    assert reopened.can_send_search_message(2)
+    reopened.close()
+    reopened = make_db()
+    reopened.update_config({'cooldown_hours': 5})
+    assert not reopened.can_send_search_message(2)
+    reopened.update_config({'cooldown_hours': 2})
+    assert reopened.can_send_search_message(2)
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from config import Config
+from write_behind import MessageBatcher, PeriodicFlusher
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+def test_batcher_reports_size_threshold_and_restores():
+    batcher = MessageBatcher(max_events=3)
+    assert not batcher.add(1, -100, '2024-05-01', 2, credit=2)
+    assert not batcher.add(1, -100, '2024-05-01', 2, credit=2)
+    assert batcher.add(2, -100, '2024-05-01', 1)
+    assert batcher.pending_points(1) == 4
+
+    messages, credits = batcher.drain()
+    assert len(batcher) == 0 and batcher.pending_points(1) == 0
+    batcher.add(1, -100, '2024-05-01', 1, credit=1)
+    batcher.restore(messages, credits)
+    assert batcher.pending_points(1) == 5
+    assert batcher.pending_message_points(1, -100, '2024-05-01') == 5
+    assert len(batcher) == 4
+
+def test_flusher_runs_on_interval_trigger_and_stop():
+    calls = []
+    flusher = PeriodicFlusher(0.05, lambda: calls.append(time.monotonic()))
+    flusher.start()
+    assert wait_for(lambda: len(calls) >= 2)
+    flusher.stop()
+    stopped = len(calls)
+    time.sleep(0.1)
+    assert len(calls) == stopped
+
+    calls.clear()
+    event = threading.Event()
+    flusher = PeriodicFlusher(60, event.set)
+    flusher.start()
+    flusher.trigger()
+    assert event.wait(1)
+    flusher.stop()
+
+def test_flusher_survives_callback_errors():
+    calls = []
+
+    def callback():
+        calls.append(1)
+        raise RuntimeError('boom')
+
+    flusher = PeriodicFlusher(0.01, callback)
+    flusher.start()
+    assert wait_for(lambda: len(calls) >= 3)
+    with pytest.raises(RuntimeError):
+        flusher.stop()  # 最后一次刷新的异常交给调用方
+
+@pytest.fixture
+def batched(monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_ENABLED', True)
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_INTERVAL_MS', 60000)
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_MAX_EVENTS', 5)
+
+def stored_messages(db) -> int:
+    with db.get_connection() as conn:
+        return conn.execute('SELECT COALESCE(SUM(message_count), 0) FROM message_records').fetchone()[0]
+
+def test_size_triggered_flush(make_db, batched):
+    db = make_db()
+    db.get_or_create_user(1)
+    for _ in range(4):
+        db.add_message_points(1, -100, 1)
+    time.sleep(0.05)
+    assert stored_messages(db) == 0
+    assert db.get_user_points(1) == 4  # 包含未入库积分
+
+    db.add_message_points(1, -100, 1)
+    assert wait_for(lambda: stored_messages(db) == 5)
+    assert db.get_user_points(1) == 5
+
+def test_time_triggered_flush(make_db, batched, monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_BATCH_INTERVAL_MS', 50)
+    db = make_db()
+    db.get_or_create_user(1)
+    db.add_message_points(1, -100, 2)
+    assert wait_for(lambda: stored_messages(db) == 1)
+
+def test_close_flushes_pending_writes(make_db, batched):
+    db = make_db()
+    db.get_or_create_user(1)
+    db.add_message_points(1, -100, 3)
+    db.get_or_create_user(1, 'renamed')
+    db.close()
+
+    reopened = make_db()
+    assert stored_messages(reopened) == 1
+    assert reopened.get_user_points(1) == 3
+    with reopened.get_connection() as conn:
+        assert conn.execute('SELECT username FROM users WHERE user_id = 1').fetchone()[0] == 'renamed'
+
+def test_failed_flush_restores_pending_updates(make_db, batched):
+    db = make_db()
+    db.get_or_create_user(1)
+    with db.get_connection() as conn:
+        conn.execute('''
+            CREATE TRIGGER fail_messages BEFORE INSERT ON message_records
+            BEGIN SELECT RAISE(ABORT, 'write failed'); END
+        ''')
+        conn.commit()
+
+    db.add_message_points(1, -100, 2)
+    db.add_message_points(1, -100, 2)
+    db.flush()
+    assert stored_messages(db) == 0
+    assert db.get_user_points(1) == 4
+    assert len(db.message_batcher) == 2
+
+    with db.get_connection() as conn:
+        conn.execute('DROP TRIGGER fail_messages')
+        conn.commit()
+    db.flush()
+    assert stored_messages(db) == 2
+    assert db.get_user_points(1) == 4
+    assert len(db.message_batcher) == 0
+
+def test_writes_after_close_do_not_crash(make_db, batched):
+    db = make_db()
+    db.get_or_create_user(1, 'name')
+    db.close()
+    # 后台线程已停止：不再抛出 AttributeError，写入失败由数据库层记录日志
+    db.add_message_points(1, -100, 1)
+    db.get_or_create_user(1, 'other')
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """并发处理更新，同一用户的更新按到达顺序逐个处理
+
+    不同用户的更新最多同时处理 max_concurrent_updates 个；同一用户的更新
+    先在该用户的队列中排队，轮到后才占用并发名额，因此单个用户刷屏不会
+    占满全部名额，也不会出现同一用户两次积分变动乱序执行。
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # 排序键 -> [锁, 排队和处理中的更新数]，没有待处理更新时删除
+        self._queues: Dict[int, list] = {}
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[int]:
+        """更新的排序键：优先按用户，没有用户时按会话，其他更新不排序"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    @property
+    def pending_keys(self) -> int:
+        """当前有更新在排队或处理中的用户数"""
+        return len(self._queues)
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # 先按用户排队再获取并发名额（基类在 process_update 中获取名额）
+        key = self.ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._queues.get(key)
+        if entry is None:
+            entry = self._queues[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._queues[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._queues:
+            logger.warning(f"更新处理器关闭时仍有 {len(self._queues)} 个用户的更新未处理完")
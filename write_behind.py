@@ -0,0 +1,132 @@
+import logging
+import threading
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MessageBatcher:
+    """签到群发言的写后缓冲
+
+    按 (用户, 群组, 日期) 累计发言次数和积分，按用户累计待入账积分，
+    由 Database.flush 一次性批量写入数据库。
+    """
+
+    def __init__(self, max_events: int = 500):
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._messages: Dict[Tuple[int, int, str], list] = {}  # key -> [发言次数, 发言积分]
+        self._credits: Dict[int, list] = {}  # user_id -> [待入账积分, 发言次数]
+        self._events = 0
+
+    def add(self, user_id: int, group_id: int, day: str, points: int, credit: int = 0) -> bool:
+        """累计一条发言，返回是否达到批量刷新阈值"""
+        with self._lock:
+            entry = self._messages.setdefault((user_id, group_id, day), [0, 0])
+            entry[0] += 1
+            entry[1] += points
+            if credit:
+                pending = self._credits.setdefault(user_id, [0, 0])
+                pending[0] += credit
+                pending[1] += 1
+            self._events += 1
+            return self._events >= self.max_events
+
+    def pending_points(self, user_id: int) -> int:
+        """获取用户尚未入账的积分"""
+        with self._lock:
+            pending = self._credits.get(user_id)
+            return pending[0] if pending else 0
+
+    def pending_message_points(self, user_id: int, group_id: int, day: str) -> int:
+        """获取用户当天在指定群尚未写入的发言积分"""
+        with self._lock:
+            entry = self._messages.get((user_id, group_id, day))
+            return entry[1] if entry else 0
+
+    def drain(self):
+        """取出全部待写入数据，返回 (发言累计, 积分累计)"""
+        with self._lock:
+            messages, self._messages = self._messages, {}
+            credits, self._credits = self._credits, {}
+            self._events = 0
+            return messages, credits
+
+    def restore(self, messages: dict, credits: dict):
+        """写入失败时把数据放回缓冲区，等待下次刷新"""
+        with self._lock:
+            for key, (count, points) in messages.items():
+                entry = self._messages.setdefault(key, [0, 0])
+                entry[0] += count
+                entry[1] += points
+                self._events += count
+            for user_id, (points, count) in credits.items():
+                pending = self._credits.setdefault(user_id, [0, 0])
+                pending[0] += points
+                pending[1] += count
+
+    def __len__(self):
+        with self._lock:
+            return self._events
+
+class PendingUpdates:
+    """按键合并的待写入数据，同一个键只保留最新的值"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict = {}
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def drain(self) -> Dict:
+        """取出全部待写入数据"""
+        with self._lock:
+            data, self._data = self._data, {}
+            return data
+
+    def restore(self, data: Dict):
+        """写入失败时放回，期间产生的新值优先"""
+        with self._lock:
+            for key, value in data.items():
+                self._data.setdefault(key, value)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+class PeriodicFlusher:
+    """后台刷新线程：每隔固定时间或被提前唤醒时执行一次回调"""
+
+    def __init__(self, interval: float, callback: Callable[[], None], name: str = 'db-flusher'):
+        self.interval = interval
+        self.callback = callback
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def trigger(self):
+        """提前唤醒刷新线程"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.callback()
+            except Exception as e:
+                logger.error(f"后台刷新失败: {e}")
+
+    def stop(self):
+        """停止刷新线程并执行最后一次刷新"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.callback()